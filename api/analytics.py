@@ -0,0 +1,217 @@
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import BlogVisitLog, Post, PostDailyVisitRollup, PostReader, PostReadingDaily, PostReadingStats, \
+    AuthorReader, AuthorReadingDaily, AuthorReadingStats
+
+# Period of a series -> first day of the period a day falls in.
+BUCKETS = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+
+# Aggregate level -> (key field, totals, daily totals, readers).
+LEVELS = OrderedDict((
+    ('post', ('post_id', PostReadingStats, PostReadingDaily, PostReader)),
+    ('author', ('author_id', AuthorReadingStats, AuthorReadingDaily, AuthorReader)),
+))
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def visit_day(value):
+    return value.astimezone(timezone.utc).date()
+
+
+def read_seconds(start_time, end_time):
+    return max(0.0, (end_time - start_time).total_seconds())
+
+
+def _increment(model, deltas):
+    """
+    Adds `deltas` {lookup: {field: delta}} to the rows of `model` matching each lookup,
+    creating missing rows first so every increment is a plain `F(field) + delta` UPDATE.
+    """
+    if not deltas:
+        return
+    model.objects.bulk_create([model(**dict(lookup)) for lookup in deltas], ignore_conflicts=True)
+    for lookup, fields in deltas.items():
+        changes = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if changes:
+            model.objects.filter(**dict(lookup)).update(**changes)
+
+
+class Deltas(object):
+    """
+    Increments to the totals and daily rows of posts and their authors, written together.
+    """
+
+    def __init__(self):
+        self.totals = {level: defaultdict(lambda: defaultdict(int)) for level in LEVELS}
+        self.daily = {level: defaultdict(lambda: defaultdict(int)) for level in LEVELS}
+
+    def add(self, level, target, day, views=0, readers=0, seconds=0.0):
+        field = LEVELS[level][0]
+        totals = self.totals[level][((field, target),)]
+        daily = self.daily[level][((field, target), ('day', day))]
+        totals['views'] += views
+        totals['readers'] += readers
+        totals['read_seconds'] += seconds
+        daily['views'] += views
+        daily['new_readers'] += readers
+        daily['read_seconds'] += seconds
+
+    def write(self):
+        for level, (_, stats, daily, _) in LEVELS.items():
+            _increment(stats, self.totals[level])
+            _increment(daily, self.daily[level])
+
+
+def _owners(post_ids):
+    return dict(Post.objects.filter(pk__in=set(post_ids)).values_list('pk', 'owner_id'))
+
+
+def _new_readers(first_visits):
+    """
+    (level, reader) for each {(level, target, user_id): first visit} not yet recorded.
+    """
+    readers = []
+    for level, (field, _, _, model) in LEVELS.items():
+        visits = {(target, user_id): first_visit
+                  for (visit_level, target, user_id), first_visit in first_visits.items() if visit_level == level}
+        if not visits:
+            continue
+        known = set(model.objects.filter(**{field + '__in': {target for target, _ in visits},
+                                            'user_id__in': {user_id for _, user_id in visits}})
+                    .values_list(field, 'user_id'))
+        readers.extend((level, model(**{field: target, 'user_id': user_id, 'first_visit': first_visit}))
+                       for (target, user_id), first_visit in visits.items() if (target, user_id) not in known)
+    return readers
+
+
+def record_visits(logs):
+    """
+    Counts newly written visit logs for their post and its author: a view each, their
+    read time so far, and a reader for every user visiting either for the first time.
+    """
+    logs = list(logs)
+    if not logs:
+        return
+    owners = _owners(log.post_id for log in logs)
+    deltas = Deltas()
+    first_visits = {}
+    for log in logs:
+        if log.post_id not in owners:
+            # The post was deleted since.
+            continue
+        day = visit_day(log.start_time)
+        for level, target in (('post', log.post_id), ('author', owners[log.post_id])):
+            deltas.add(level, target, day, views=1, seconds=read_seconds(log.start_time, log.end_time))
+            key = (level, target, log.user_id)
+            if key not in first_visits or log.start_time < first_visits[key]:
+                first_visits[key] = log.start_time
+
+    readers = _new_readers(first_visits)
+    for level, reader in readers:
+        deltas.add(level, getattr(reader, LEVELS[level][0]), visit_day(reader.first_visit), readers=1)
+
+    with transaction.atomic():
+        for level, (_, _, _, model) in LEVELS.items():
+            model.objects.bulk_create([reader for reader_level, reader in readers if reader_level == level],
+                                      ignore_conflicts=True)
+        deltas.write()
+
+
+def record_reading(changes):
+    """
+    Adds the read time of visits whose end time moved, from (post_id, start_time,
+    previous end_time, end_time) tuples. The time goes to the day the visit started.
+    """
+    changes = list(changes)
+    owners = _owners(post_id for post_id, _, _, _ in changes)
+    deltas = Deltas()
+    for post_id, start_time, previous_end, end_time in changes:
+        seconds = read_seconds(start_time, end_time) - read_seconds(start_time, previous_end)
+        if seconds > 0 and post_id in owners:
+            deltas.add('post', post_id, visit_day(start_time), seconds=seconds)
+            deltas.add('author', owners[post_id], visit_day(start_time), seconds=seconds)
+
+    with transaction.atomic():
+        deltas.write()
+
+
+def rebuild():
+    """
+    Recomputes every aggregate from the daily visit rollups and the raw visit logs.
+    Readers of days already rolled up are unknown and not counted.
+    """
+    with transaction.atomic():
+        for _, stats, daily, readers in LEVELS.values():
+            readers.objects.all().delete()
+            daily.objects.all().delete()
+            stats.objects.all().delete()
+
+        rollups = list(PostDailyVisitRollup.objects.values_list('post_id', 'day', 'views', 'total_dwell'))
+        owners = _owners(post_id for post_id, _, _, _ in rollups)
+        deltas = Deltas()
+        for post_id, day, views, seconds in rollups:
+            deltas.add('post', post_id, day, views=views, seconds=seconds)
+            deltas.add('author', owners[post_id], day, views=views, seconds=seconds)
+        deltas.write()
+
+        batch = []
+        count = 0
+        for log in BlogVisitLog.objects.only('post_id', 'user_id', 'start_time', 'end_time') \
+                .order_by('start_time').iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(log)
+            if len(batch) == REBUILD_BATCH_SIZE:
+                record_visits(batch)
+                count += len(batch)
+                batch = []
+        record_visits(batch)
+    return count + len(batch)
+
+
+def series(queryset, bucket, since=None):
+    """
+    Sums daily rows into periods. The days come in order from the (target, day) unique
+    index, so they are summed here instead of by a GROUP BY that would sort them.
+    """
+    if since is not None:
+        queryset = queryset.filter(day__gte=since)
+    periods = OrderedDict()
+    for day, views, new_readers, seconds in queryset.order_by('day') \
+            .values_list('day', 'views', 'new_readers', 'read_seconds'):
+        period = BUCKETS[bucket](day)
+        row = periods.setdefault(period, {'period': period, 'views': 0, 'new_readers': 0, 'read_seconds': 0.0})
+        row['views'] += views
+        row['new_readers'] += new_readers
+        row['read_seconds'] += seconds
+    return list(periods.values())
+
+
+def summary(stats):
+    return {
+        'views': stats.views,
+        'readers': stats.readers,
+        'read_seconds': stats.read_seconds,
+        'average_read_seconds': stats.read_seconds / stats.views if stats.views else 0.0,
+    }
+
+
+def post_analytics(post_id, bucket='day', since=None):
+    stats = PostReadingStats.objects.filter(post_id=post_id).first() or PostReadingStats(post_id=post_id)
+    return dict(summary(stats), series=series(PostReadingDaily.objects.filter(post_id=post_id), bucket, since))
+
+
+def author_analytics(user_id, bucket='day', since=None):
+    """
+    Totals over every post of the author. A user reading several of them is one reader.
+    """
+    stats = AuthorReadingStats.objects.filter(author_id=user_id).first() or AuthorReadingStats(author_id=user_id)
+    return dict(summary(stats), series=series(AuthorReadingDaily.objects.filter(author_id=user_id), bucket, since))
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from api import buffers, search, signals  # noqa: F401
+        buffers.connect()
+        post_migrate.connect(search.create_index, sender=self)
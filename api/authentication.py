@@ -0,0 +1,59 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from api.cache import LRUCache
+from api.models import User
+
+principal_cache = LRUCache('AUTH_PRINCIPAL')
+
+
+def principal_key(user_id):
+    return str(user_id)
+
+
+def invalidate_principal(user_id):
+    principal_cache.delete(principal_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user id from an in-process cache
+    instead of selecting the user row on every request.
+
+    The cache stores the user's column values and each request gets a fresh `User`
+    built from them, so a view mutating `request.user` cannot leak into other requests.
+    Entries are dropped by the User save/delete signals; changes made with
+    `QuerySet.update()` bypass them and are only picked up once the entry expires.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        key = principal_key(user_id)
+        values = principal_cache.get(key)
+        if values is None:
+            try:
+                user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except (User.DoesNotExist, ValueError):
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            values = principal_cache.set(key, _column_values(user))
+        user = _build_user(values)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+
+def _column_values(user):
+    return user._state.db, tuple(getattr(user, field.attname) for field in User._meta.concrete_fields)
+
+
+def _build_user(values):
+    db, row = values
+    return User.from_db(db, [field.attname for field in User._meta.concrete_fields], row)
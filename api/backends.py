@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission
+
+from api.cache import LRUCache
+from api.models import UserGroup
+
+# `permissions` holds 'app_label.codename' strings, `group_ids` the api.Group ids.
+PermissionSnapshot = namedtuple('PermissionSnapshot', ('permissions', 'group_ids'))
+
+EMPTY_SNAPSHOT = PermissionSnapshot(frozenset(), frozenset())
+
+snapshot_cache = LRUCache('PERMISSION_SNAPSHOT')
+
+
+def get_snapshot(user):
+    """
+    Returns the user's permissions and group memberships, built with two queries the
+    first time and then served from the request's user object or the process cache.
+    """
+    if user is None or not user.is_authenticated or not user.is_active:
+        return EMPTY_SNAPSHOT
+    snapshot = getattr(user, '_permission_snapshot', None)
+    if snapshot is None:
+        key = str(user.pk)
+        snapshot = snapshot_cache.get(key)
+        if snapshot is None:
+            snapshot = snapshot_cache.set(key, build_snapshot(user))
+        user._permission_snapshot = snapshot
+    return snapshot
+
+
+def build_snapshot(user):
+    permissions = Permission.objects.all() if user.is_superuser else Permission.objects.filter(user=user)
+    permissions = permissions.values_list('content_type__app_label', 'codename')
+    group_ids = UserGroup.objects.filter(user=user).values_list('group_id', flat=True)
+    return PermissionSnapshot(
+        frozenset('%s.%s' % (app_label, codename) for app_label, codename in permissions),
+        frozenset(group_ids),
+    )
+
+
+def invalidate_snapshot(user_id):
+    snapshot_cache.delete(str(user_id))
+
+
+def invalidate_all_snapshots():
+    snapshot_cache.clear()
+
+
+class SnapshotModelBackend(ModelBackend):
+    """
+    ModelBackend answering permission checks from the cached PermissionSnapshot.
+
+    The stock backend also reads permissions through `user.groups`, which here points at
+    api.Group rather than auth.Group; api.Group carries no permissions, so group
+    permissions are always empty and groups only contribute their ids.
+    """
+
+    def get_user_permissions(self, user_obj, obj=None):
+        if obj is not None:
+            return set()
+        return set(get_snapshot(user_obj).permissions)
+
+    def get_group_permissions(self, user_obj, obj=None):
+        return set()
+
+    def get_all_permissions(self, user_obj, obj=None):
+        return self.get_user_permissions(user_obj, obj)
+
+    def has_perm(self, user_obj, perm, obj=None):
+        return obj is None and perm in get_snapshot(user_obj).permissions
+
+    def has_module_perms(self, user_obj, app_label):
+        prefix = app_label + '.'
+        return any(perm.startswith(prefix) for perm in get_snapshot(user_obj).permissions)
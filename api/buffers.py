@@ -0,0 +1,334 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Case, When, Value
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_PENDING': 500,
+}
+
+_buffers = []
+
+# The flusher thread of this process, once `start_flusher` was called.
+_flusher = {'enabled': False, 'thread': None, 'pid': None, 'stop': None}
+_flusher_lock = threading.Lock()
+
+# Sent by CounterBuffer after a batch of deltas has been committed, with `batch` {pk: delta}.
+counter_flushed = Signal()
+# Sent by QueueBuffer with the `batch` of instances it inserted, inside the inserting
+# transaction, so receivers that fail roll the insert back and the batch is retried whole.
+queue_flushed = Signal()
+
+
+class WriteBehindBuffer(object):
+    """
+    Collects pending writes in memory and hands them to the database in batches.
+
+    A buffer is flushed once it holds `MAX_PENDING` items, or once it is older than
+    `FLUSH_INTERVAL` seconds: after the request that finds it so has finished, so the
+    write never sits on the response path, or by the flusher thread of an idle worker.
+    Settings live under `settings.WRITE_BEHIND[setting_name]`.
+    """
+    setting_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _buffers.append(self)
+
+    def config(self):
+        config = dict(DEFAULTS)
+        config.update(getattr(settings, 'WRITE_BEHIND', {}).get(self.setting_name, {}))
+        return config
+
+    def flush(self):
+        """
+        Writes everything pending. Returns the number of items written.
+        """
+        with self._lock:
+            batch = self._drain()
+            self._last_flush = time.monotonic()
+        if not batch:
+            return 0
+
+        try:
+            self._write(batch)
+        except Exception:
+            logger.exception('Failed to flush %s, re-queueing %d item(s).', self.setting_name, len(batch))
+            with self._lock:
+                self._restore(batch)
+            return 0
+        return len(batch)
+
+    def flush_if_due(self):
+        config = self.config()
+        if not len(self):
+            return 0
+        if len(self) >= config['MAX_PENDING'] or \
+                time.monotonic() - self._last_flush >= config['FLUSH_INTERVAL']:
+            return self.flush()
+        return 0
+
+    def _after_add(self):
+        _ensure_flusher()
+        config = self.config()
+        if not config['ENABLED'] or len(self) >= config['MAX_PENDING']:
+            self.flush()
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def _drain(self):
+        raise NotImplementedError
+
+    def _restore(self, batch):
+        raise NotImplementedError
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+
+class CounterBuffer(WriteBehindBuffer):
+    """
+    Accumulates deltas for an integer column and applies them as `F(field) + n` updates.
+    """
+
+    def __init__(self, model, field, setting_name):
+        self.model = model
+        self.field = field
+        self.setting_name = setting_name
+        self._pending = {}
+        super(CounterBuffer, self).__init__()
+
+    def add(self, pk, delta=1):
+        with self._lock:
+            self._pending[pk] = self._pending.get(pk, 0) + delta
+        self._after_add()
+
+    def pending(self, pk):
+        return self._pending.get(pk, 0)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _drain(self):
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _restore(self, batch):
+        for pk, delta in batch.items():
+            self._pending[pk] = self._pending.get(pk, 0) + delta
+
+    def _write(self, batch):
+        with transaction.atomic():
+            for pk, delta in batch.items():
+                if delta:
+                    self.model.objects.filter(pk=pk).update(**{self.field: F(self.field) + delta})
+        counter_flushed.send(sender=self, batch=batch)
+
+
+class LatestValueBuffer(WriteBehindBuffer):
+    """
+    Keeps the newest value set for a column per row and writes the whole batch as one
+    `UPDATE ... SET field = CASE pk WHEN ... END` touching only that column. Values must
+    be orderable; an older value never replaces a newer pending one.
+    """
+
+    def __init__(self, model, field, setting_name):
+        self.model = model
+        self.field = field
+        self.setting_name = setting_name
+        self._pending = {}
+        super(LatestValueBuffer, self).__init__()
+
+    def set(self, pk, value):
+        with self._lock:
+            current = self._pending.get(pk)
+            if current is None or value > current:
+                self._pending[pk] = value
+        self._after_add()
+
+    def pending(self, pk):
+        return self._pending.get(pk)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _drain(self):
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _restore(self, batch):
+        for pk, value in batch.items():
+            current = self._pending.get(pk)
+            if current is None or value > current:
+                self._pending[pk] = value
+
+    def _write(self, batch):
+        output_field = self.model._meta.get_field(self.field)
+        size = self.config()['MAX_PENDING']
+        items = list(batch.items())
+        with transaction.atomic():
+            for start in range(0, len(items), size):
+                chunk = items[start:start + size]
+                value = Case(*[When(pk=pk, then=Value(value, output_field=output_field)) for pk, value in chunk],
+                             output_field=output_field)
+                self.model.objects.filter(pk__in=[pk for pk, _ in chunk]).update(**{self.field: value})
+
+
+class QueueBuffer(WriteBehindBuffer):
+    """
+    Queues unsaved model instances and inserts them with `bulk_create`.
+    Primary keys must be assigned in-process (e.g. UUID defaults) since they are handed
+    out before the row exists.
+    """
+
+    def __init__(self, model, setting_name):
+        self.model = model
+        self.setting_name = setting_name
+        self._pending = []
+        super(QueueBuffer, self).__init__()
+
+    def add(self, instance):
+        with self._lock:
+            self._pending.append(instance)
+        self._after_add()
+        return instance
+
+    def contains(self, pk):
+        pk = str(pk)
+        return any(str(instance.pk) == pk for instance in list(self._pending))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _drain(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _restore(self, batch):
+        self._pending[:0] = batch
+
+    def _write(self, batch):
+        try:
+            self._insert(batch)
+        except IntegrityError:
+            # One row whose post or user was deleted while queued fails the whole INSERT.
+            # Re-queueing the batch would fail forever, so the rows that cannot be written are dropped.
+            logger.warning('Failed to insert %d queued %s row(s), dropping the invalid ones.',
+                           len(batch), self.model._meta.model_name)
+            self._insert_valid(self._with_existing_references(batch))
+
+    def _insert(self, batch):
+        with transaction.atomic():
+            self.model.objects.bulk_create(batch, batch_size=self.config()['MAX_PENDING'])
+            queue_flushed.send(sender=self, batch=batch)
+
+    def _with_existing_references(self, batch):
+        for field in self.model._meta.concrete_fields:
+            if not field.many_to_one:
+                continue
+            target = field.target_field.attname
+            ids = {getattr(instance, field.attname) for instance in batch} - {None}
+            existing = set(field.related_model._base_manager.filter(**{target + '__in': ids})
+                           .values_list(target, flat=True))
+            valid = [instance for instance in batch if getattr(instance, field.attname) in existing or
+                     getattr(instance, field.attname) is None]
+            if len(valid) < len(batch):
+                logger.warning('Dropping %d queued %s row(s) whose %s no longer exists.',
+                               len(batch) - len(valid), self.model._meta.model_name, field.name)
+            batch = valid
+        return batch
+
+    def _insert_valid(self, batch):
+        """
+        Inserts `batch`, halving it around rows that still fail until only those are left out.
+        """
+        if not batch:
+            return
+        try:
+            self._insert(batch)
+        except IntegrityError:
+            if len(batch) == 1:
+                logger.exception('Dropping queued %s %s.', self.model._meta.model_name, batch[0].pk)
+                return
+            middle = len(batch) // 2
+            self._insert_valid(batch[:middle])
+            self._insert_valid(batch[middle:])
+
+
+def flush_all():
+    for buffer in _buffers:
+        buffer.flush()
+
+
+def flush_due(**kwargs):
+    for buffer in _buffers:
+        buffer.flush_if_due()
+
+
+def flush_tick():
+    """
+    Seconds between the flusher thread's checks: half the shortest `FLUSH_INTERVAL`, so
+    nothing waits much longer than its interval.
+    """
+    return min(buffer.config()['FLUSH_INTERVAL'] for buffer in _buffers) / 2.0 if _buffers else 1.0
+
+
+def start_flusher():
+    """
+    Runs `flush_due` from a daemon thread, so buffered writes of a worker that stops
+    getting requests still reach the database. Called by the WSGI entry point; a
+    process forked after it starts its own thread on its first buffered write.
+    """
+    with _flusher_lock:
+        _flusher['enabled'] = True
+    _ensure_flusher()
+
+
+def stop_flusher():
+    with _flusher_lock:
+        _flusher['enabled'] = False
+        thread, stop = _flusher['thread'], _flusher['stop']
+        _flusher.update(thread=None, pid=None, stop=None)
+    if thread is not None and thread.is_alive():
+        stop.set()
+        thread.join()
+
+
+def _ensure_flusher():
+    if not _flusher['enabled'] or _flusher['pid'] == os.getpid():
+        return
+    with _flusher_lock:
+        if not _flusher['enabled'] or _flusher['pid'] == os.getpid():
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_run_flusher, args=(stop,), name='write-behind-flusher', daemon=True)
+        _flusher.update(thread=thread, pid=os.getpid(), stop=stop)
+        thread.start()
+
+
+def _run_flusher(stop):
+    while not stop.wait(flush_tick()):
+        try:
+            flush_due()
+        except Exception:
+            logger.exception('Write-behind flusher failed.')
+        finally:
+            connections.close_all()
+
+
+def connect():
+    request_finished.connect(flush_due, dispatch_uid='api.buffers.flush_due')
+    atexit.register(flush_all)
@@ -0,0 +1,88 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.fields import get_error_detail
+
+from api import images
+from api.models import Image
+from api.storage import content_storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BULK_IMAGE_UPLOADS = {
+    # Threads validating and storing files. Pillow's decoder and hashlib release the GIL.
+    'WORKERS': 4,
+    'MAX_FILES': 200,
+}
+
+
+class BulkResult(object):
+    """
+    Outcome of one file of a bulk upload: the saved Image, or the validation errors.
+    """
+
+    def __init__(self, name, image=None, errors=None):
+        self.name = name
+        self.image = image
+        self.errors = errors
+
+
+def bulk_config():
+    config = dict(DEFAULT_BULK_IMAGE_UPLOADS)
+    config.update(getattr(settings, 'BULK_IMAGE_UPLOADS', {}))
+    return config
+
+
+def prepare(upload):
+    """
+    Validates one upload and writes it to storage. Runs in a worker thread, so it must
+    not touch the database.
+    """
+    try:
+        serializers.ImageField().run_validation(upload)
+    except DjangoValidationError as e:
+        # Raised by the underlying Django form field; a serializer would convert it the same way.
+        raise serializers.ValidationError(get_error_detail(e))
+    return content_storage.write_blob(upload.name, upload)
+
+
+def store_images(uploads, owner):
+    """
+    Stores `uploads` as Images of `owner` and returns a BulkResult per upload, in order.
+    Files that fail validation or storage are reported and the rest are still saved,
+    with one bulk INSERT.
+    """
+    config = bulk_config()
+    with ThreadPoolExecutor(max_workers=max(1, min(config['WORKERS'], len(uploads)))) as executor:
+        futures = [executor.submit(prepare, upload) for upload in uploads]
+
+    name_length = Image._meta.get_field('name').max_length
+    results = []
+    blobs = []
+    for upload, future in zip(uploads, futures):
+        try:
+            blob_name, digest, size = future.result()
+        except serializers.ValidationError as e:
+            results.append(BulkResult(upload.name, errors={'image': e.detail}))
+            continue
+        except OSError:
+            logger.exception('Failed to store %s.', upload.name)
+            results.append(BulkResult(upload.name, errors={'image': ['The file could not be stored.']}))
+            continue
+        image = Image(image=blob_name, name=upload.name[:name_length], owner=owner)
+        blobs.append((upload, image, (blob_name, digest, size)))
+        results.append(BulkResult(upload.name, image=image))
+
+    if blobs:
+        with transaction.atomic():
+            for upload, image, blob in blobs:
+                content_storage.reference_blob(upload.name, upload, blob)
+            # bulk_create sends no post_save, so variants are scheduled here instead of by the signal.
+            Image.objects.bulk_create([image for _, image, _ in blobs])
+            for _, image, _ in blobs:
+                images.schedule(Image, image.pk, 'image', 'variants_version', image.image.name)
+    return results
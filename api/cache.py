@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULTS = {
+    'TTL': 60,
+    'MAX_ENTRIES': 1000,
+}
+
+
+class LRUCache(object):
+    """
+    Thread-safe in-process LRU cache whose entries also expire after `TTL` seconds.
+    Settings live under `settings.CACHES_IN_PROCESS[setting_name]` and are read on use.
+
+    Entries are per process, so an invalidation only reaches the process it ran in;
+    other workers serve their copy until it expires.
+    """
+
+    def __init__(self, setting_name):
+        self.setting_name = setting_name
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def config(self):
+        config = dict(DEFAULTS)
+        config.update(getattr(settings, 'CACHES_IN_PROCESS', {}).get(self.setting_name, {}))
+        return config
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key):
+        """
+        Returns the entry without touching recency or the hit/miss counters.
+        """
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        config = self.config()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + config['TTL'], value)
+            while len(self._entries) > config['MAX_ENTRIES']:
+                self._remove(next(iter(self._entries)))
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        del self._entries[key]
+
+
+class TaggedLRUCache(LRUCache):
+    """
+    LRUCache whose entries carry tags, so every entry built from an object can be
+    dropped at once when that object changes.
+    """
+
+    def __init__(self, setting_name):
+        super(TaggedLRUCache, self).__init__(setting_name)
+        self._tags = {}
+        self._key_tags = {}
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            super(TaggedLRUCache, self).set(key, value)
+            if key in self._entries:
+                self._key_tags[key] = frozenset(tags)
+                for tag in tags:
+                    self._tags.setdefault(tag, set()).add(key)
+        return value
+
+    def keys_for(self, tag):
+        with self._lock:
+            return list(self._tags.get(tag, ()))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            super(TaggedLRUCache, self).clear()
+            self._tags.clear()
+            self._key_tags.clear()
+
+    def _remove(self, key):
+        super(TaggedLRUCache, self)._remove(key)
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
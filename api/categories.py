@@ -0,0 +1,104 @@
+from django.db.models import Q, Subquery, Value, Exists, OuterRef, CharField
+from django.db.models.functions import Concat, Substr, Length
+
+from api.models import Category
+
+SEPARATOR = '/'
+
+
+def build_path(name, parent_path=None):
+    return (parent_path or SEPARATOR) + name + SEPARATOR
+
+
+def upper_bound(path):
+    # '0' sorts right after '/', so [path, upper_bound(path)) holds exactly the paths under `path`.
+    return path[:-1] + '0'
+
+
+def subtree_filter(name, prefix=''):
+    """
+    Q matching the category `name` and its descendants as an index range scan on
+    `path`. The bounds are scalar subqueries, so no extra round trip is needed.
+    `prefix` points the lookup through a relation, e.g. 'category__'.
+    """
+    node = Category.objects.filter(name=name)
+    lower = Subquery(node.values('path')[:1])
+    upper = Subquery(node.annotate(
+        upper=Concat(Substr('path', 1, Length('path') - 1), Value('0'), output_field=CharField())
+    ).values('upper')[:1])
+    return Q(**{prefix + 'path__gte': lower, prefix + 'path__lt': upper})
+
+
+def ancestors(name):
+    """
+    The category `name` and its ancestors, root first.
+    """
+    node = Category.objects.filter(name=name, path__startswith=OuterRef('path'))
+    return Category.objects.filter(Exists(node)).order_by(Length('path'))
+
+
+def build_tree(categories, serialize):
+    """
+    Nests categories ordered by path into [{..., 'children': [...]}]. Anything whose
+    parent is not in `categories` becomes a root.
+    """
+    nodes = {}
+    roots = []
+    for category in categories:
+        node = serialize(category)
+        node['children'] = []
+        nodes[category.name] = node
+        parent = nodes.get(category.parent_id)
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
+
+
+def is_within(category, ancestor):
+    """
+    Whether `category` is `ancestor` or one of its descendants. Categories whose path
+    is not backfilled yet are checked by walking their parent links instead.
+    """
+    if category.path and ancestor.path:
+        return category.path.startswith(ancestor.path)
+    seen = set()
+    name = category.name
+    while name is not None and name not in seen:
+        if name == ancestor.name:
+            return True
+        seen.add(name)
+        name = Category.objects.filter(name=name).values_list('parent_id', flat=True).first()
+    return False
+
+
+def move_subtree(old_path, new_path):
+    """
+    Rewrites the paths of every descendant of `old_path` to live under `new_path`.
+    An empty `old_path` is a category not backfilled yet, whose descendants are not
+    found by path either, so nothing is rewritten.
+    """
+    if not old_path:
+        return
+    Category.objects.filter(path__gte=old_path, path__lt=upper_bound(old_path)).exclude(path=old_path).update(
+        path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=CharField()))
+
+
+def rebuild_paths():
+    """
+    Recomputes every path from the parent links. Returns the number of categories.
+    """
+    categories = {category.name: category for category in Category.objects.all()}
+    paths = {}
+
+    def resolve(name, seen=()):
+        if name not in paths:
+            parent = categories[name].parent_id
+            if parent is None or parent not in categories or parent in seen:
+                paths[name] = build_path(name)
+            else:
+                paths[name] = build_path(name, resolve(parent, seen + (name,)))
+        return paths[name]
+
+    for name, category in categories.items():
+        category.path = resolve(name)
+    Category.objects.bulk_update(categories.values(), ['path'], batch_size=500)
+    return len(categories)
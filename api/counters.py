@@ -0,0 +1,5 @@
+from api.buffers import CounterBuffer
+from api.models import Post
+
+view_counter = CounterBuffer(Post, 'view', 'VIEW_COUNTER')
+like_counter = CounterBuffer(Post, 'like', 'LIKE_COUNTER')
@@ -0,0 +1,86 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_DATABASE_ROUTING = {
+    # Aliases in DATABASES that replicate 'default'. Empty sends everything to 'default'.
+    'REPLICAS': [],
+    # After a request writes, the client reads from the primary for this long, so it sees
+    # its own changes even if the replicas lag behind.
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'read_primary',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing state of the request being handled by this thread.
+_state = threading.local()
+
+
+def routing_config():
+    config = dict(DEFAULT_DATABASE_ROUTING)
+    config.update(getattr(settings, 'DATABASE_ROUTING', {}))
+    return config
+
+
+def reads_from_replica():
+    """
+    True while handling a safe request that has not written and is not pinned to the
+    primary. Anything else, e.g. background flushes or management commands, reads
+    from the primary.
+    """
+    return getattr(_state, 'replica_reads', False) and not getattr(_state, 'wrote', False)
+
+
+class ReplicaRouter(object):
+    """
+    Sends reads of safe requests to a random replica and everything else to 'default',
+    unless a query names its database with `using`.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = routing_config()['REPLICAS']
+        if not replicas or not reads_from_replica() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # No opinion: Django uses the database of a hinted instance, else 'default'.
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in routing_config()['REPLICAS']:
+            # Rows read from a replica are saved to the primary.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS}.union(routing_config()['REPLICAS'])
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Marks which requests may read from replicas and pins a client to the primary for
+    `STICKY_SECONDS` after a request of theirs wrote to it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = routing_config()
+        _state.replica_reads = request.method in SAFE_METHODS and config['COOKIE_NAME'] not in request.COOKIES
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                response.set_cookie(config['COOKIE_NAME'], '1', max_age=config['STICKY_SECONDS'], httponly=True,
+                                    samesite='Lax')
+        finally:
+            _state.replica_reads = False
+            _state.wrote = False
+        return response
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from api.backends import get_snapshot
+
 
 class ModelPermissions(permissions.DjangoModelPermissions):
     perms_map = {
@@ -57,3 +59,24 @@ class IsUserSelfOrAdmin(permissions.BasePermission):
         if obj.user_id:
             return obj.user_id == request.user.user_id
         return obj.owner == request.user or request.user.is_staff
+
+
+class IsOwnerOrAdmin(permissions.BasePermission):
+    """
+    Object-level permission to only allow owners of an object, or admins, to access it,
+    including reads. Assumes the model instance has an `owner` attribute.
+    """
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        return obj.owner_id == request.user.pk or request.user.is_staff or request.user.is_superuser
+
+
+def is_group_member(user, *group_ids):
+    """
+    True if the user belongs to any of the given api.Group ids. Answered from the
+    user's permission snapshot, so repeated checks do not query `user_group`.
+    """
+    return not get_snapshot(user).group_ids.isdisjoint(group_ids)
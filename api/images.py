@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image as PILImage, ImageOps
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {
+    # Size of the process pool generating variants for new uploads. 0 renders in the
+    # calling thread, which tests and management commands rely on.
+    'WORKERS': 2,
+    # name -> [max width, max height]; the aspect ratio is kept.
+    'SIZES': {
+        'thumbnail': [150, 150],
+        'small': [480, 480],
+        'medium': [1024, 1024],
+    },
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 82,
+}
+
+EXTENSIONS = {
+    'jpeg': 'jpg',
+    'png': 'png',
+    'webp': 'webp',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_config():
+    config = dict(DEFAULT_VARIANTS)
+    config.update(getattr(settings, 'IMAGE_VARIANTS', {}))
+    return config
+
+
+def config_version(config=None):
+    """
+    Short hash of the sizes, formats and quality. Images whose variants were made under
+    another version are regenerated by the `generate_image_variants` command.
+    """
+    config = config if config is not None else variant_config()
+    output = {key: config[key] for key in ('SIZES', 'FORMATS', 'QUALITY')}
+    return hashlib.sha1(json.dumps(output, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def variant_name(name, size, fmt):
+    """
+    Storage name of one variant, derived from the original's name alone so URLs can be
+    built without touching the file system.
+    """
+    directory, filename = posixpath.split(name)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', '{}_{}.{}'.format(stem, size, EXTENSIONS[fmt]))
+
+
+def variant_names(name, config=None):
+    config = config if config is not None else variant_config()
+    return {size: {fmt: variant_name(name, size, fmt) for fmt in config['FORMATS']} for size in config['SIZES']}
+
+
+def variant_urls(field_file, version, config=None):
+    """
+    `{size: {format: url}}` for a stored image, or None while its variants are missing
+    or stale so clients fall back to the original.
+    """
+    config = config if config is not None else variant_config()
+    if not field_file or version != config_version(config):
+        return None
+    storage = field_file.storage
+    return {size: {fmt: storage.url(name) for fmt, name in formats.items()}
+            for size, formats in variant_names(field_file.name, config).items()}
+
+
+def render_variants(media_root, name, config):
+    """
+    Writes every configured variant of `media_root/name`. Takes its inputs explicitly
+    so it can run in a worker process.
+    """
+    with PILImage.open(os.path.join(media_root, name)) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, box in config['SIZES'].items():
+            resized = original.copy()
+            resized.thumbnail(tuple(box), PILImage.LANCZOS)
+            for fmt in config['FORMATS']:
+                _save(resized, os.path.join(media_root, variant_name(name, size, fmt)), fmt, config['QUALITY'])
+    return name
+
+
+def delete_variants(storage, name, config=None):
+    for formats in variant_names(name, config).values():
+        for variant in formats.values():
+            storage.delete(variant)
+
+
+def schedule(model, pk, field, version_field, name):
+    """
+    Generates the variants of `name` off the request thread and then stamps
+    `version_field` on the row, as long as `field` still points at the same file.
+    """
+    config = variant_config()
+    task = (settings.MEDIA_ROOT, name, config)
+    if config['WORKERS'] <= 0:
+        _finish(model, pk, field, version_field, name, config, lambda: render_variants(*task))
+        return
+
+    def submit():
+        future = _get_executor(config['WORKERS']).submit(render_variants, *task)
+        future.add_done_callback(lambda done: _finish_in_thread(model, pk, field, version_field, name, config, done))
+
+    # The row must be visible to the callback's connection before it is stamped.
+    transaction.on_commit(submit)
+
+
+def _finish(model, pk, field, version_field, name, config, result):
+    try:
+        result()
+    except Exception:
+        logger.exception('Failed to generate variants of %s.', name)
+        return
+    model.objects.filter(pk=pk, **{field: name}).update(**{version_field: config_version(config)})
+
+
+def _finish_in_thread(model, pk, field, version_field, name, config, future):
+    # Done callbacks run on the executor's management thread, which owns its own connection.
+    try:
+        _finish(model, pk, field, version_field, name, config, future.result)
+    finally:
+        connection.close()
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+
+def _save(image, path, fmt, quality):
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed so a reader never sees a half-written variant.
+    partial = path + '.part'
+    image.save(partial, format=fmt.upper(), quality=quality)
+    os.replace(partial, path)
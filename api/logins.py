@@ -0,0 +1,4 @@
+from api.buffers import LatestValueBuffer
+from api.models import User
+
+last_login_buffer = LatestValueBuffer(User, 'last_login', 'LAST_LOGIN')
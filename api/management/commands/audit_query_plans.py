@@ -0,0 +1,147 @@
+import json
+import os
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import User, Post, Category, BlogVisitLog, Image
+from api.post_cache import post_response_cache
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'query_plan_baseline.json')
+
+# A table read from start to end; "SCAN x USING INDEX" walks an index in order and is fine.
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)$')
+TEMP_SORT = re.compile(r'^USE TEMP B-TREE FOR (?P<clause>.+)$')
+
+POST_ORDERINGS = ('createdTimestamp', '-createdTimestamp', 'lastUpdatedTimestamp', '-lastUpdatedTimestamp',
+                  'title', '-view', '-like', 'trending')
+
+
+class Command(BaseCommand):
+    help = ('Runs the list and read requests of every viewset across their filters and orderings, '
+            'EXPLAINs each query and fails on full table scans or temp B-tree sorts missing from the baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Accept the current findings as the new baseline.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans are only read from SQLite.')
+
+        findings = {}
+        # Fixture rows and everything the requests write are rolled back.
+        with transaction.atomic():
+            fixtures = self._create_fixtures()
+            for name, role, path, params in self.scenarios(fixtures):
+                findings[name] = self._audit(fixtures[role], path, params)
+            transaction.set_rollback(True)
+        post_response_cache.clear()
+
+        audited = len(findings)
+        findings = {name: sorted(issues) for name, issues in findings.items() if issues}
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(findings, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                'Wrote {} accepted finding(s) to {}.'.format(sum(map(len, findings.values())), options['baseline'])))
+            return
+
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        new = ['{}: {}'.format(name, issue) for name, issues in sorted(findings.items())
+               for issue in issues if issue not in baseline.get(name, ())]
+        fixed = ['{}: {}'.format(name, issue) for name, issues in sorted(baseline.items())
+                 for issue in issues if issue not in findings.get(name, ())]
+        for line in fixed:
+            self.stdout.write('No longer seen, remove from the baseline: ' + line)
+        if new:
+            raise CommandError('New full scans or temp sorts:\n  ' + '\n  '.join(new))
+        self.stdout.write(self.style.SUCCESS('No new full scans or temp sorts in {} request(s).'.format(audited)))
+
+    @staticmethod
+    def scenarios(fixtures):
+        """
+        (name, role, path, query parameters) of each request audited. page_size=1 makes
+        every list return a next page, which is then fetched to cover the keyset seek.
+        """
+        post_id, category_name, user_id = fixtures['post'].pk, fixtures['category'].pk, fixtures['user'].pk
+        yield 'post list', 'anonymous', '/api/post/', {}
+        for ordering in POST_ORDERINGS:
+            yield 'post list orderBy={}'.format(ordering), 'anonymous', '/api/post/', {'orderBy': ordering}
+        yield 'post list author', 'anonymous', '/api/post/', {'author': 'audit'}
+        yield 'post list title', 'anonymous', '/api/post/', {'title': 'audit'}
+        yield 'post list category', 'anonymous', '/api/post/', {'category': category_name}
+        yield 'post list category subtree', 'anonymous', '/api/post/', {'category': category_name,
+                                                                         'includeDescendants': 'true'}
+        yield 'post list search', 'anonymous', '/api/post/', {'search': 'audit'}
+        yield 'post list expand', 'anonymous', '/api/post/', {'expand': 'owner,category'}
+        yield 'post retrieve', 'user', '/api/post/{}/'.format(post_id), {}
+        yield 'post visits', 'user', '/api/post/{}/visits/'.format(post_id), {}
+        yield 'post analytics', 'user', '/api/post/{}/analytics/'.format(post_id), {'bucket': 'week'}
+        yield 'user analytics', 'user', '/api/user/{}/analytics/'.format(user_id), {'bucket': 'week'}
+        yield 'user list', 'admin', '/api/user/', {}
+        yield 'group list', 'admin', '/api/group/', {}
+        yield 'category list', 'admin', '/api/category/', {}
+        yield 'category list root', 'admin', '/api/category/', {'parent': 'root'}
+        yield 'category list parent', 'admin', '/api/category/', {'parent': category_name}
+        yield 'category list subtree', 'admin', '/api/category/', {'subtree': category_name}
+        yield 'category tree', 'admin', '/api/category/tree/', {}
+        yield 'image list', 'user', '/api/image/', {}
+        yield 'image list orientation', 'user', '/api/image/', {'orientation': 'landscape'}
+        yield 'image list min_width', 'user', '/api/image/', {'min_width': 100}
+        yield 'visit log list', 'user', '/api/blog_visit_log/', {}
+        yield 'visit log list post', 'user', '/api/blog_visit_log/', {'post': post_id}
+        yield 'visit log list admin', 'admin', '/api/blog_visit_log/', {}
+        yield 'visit log list admin user', 'admin', '/api/blog_visit_log/', {'user': user_id}
+        yield 'visit log list admin post', 'admin', '/api/blog_visit_log/', {'post': post_id}
+
+    def _create_fixtures(self):
+        admin = User.objects.create(username='audit-admin', email='audit-admin@test.com', is_staff=True,
+                                    is_superuser=True)
+        user = User.objects.create(username='audit-user', email='audit-user@test.com')
+        root = Category.objects.create(name='audit-root')
+        Category.objects.create(name='audit-child', parent=root)
+        posts = [Post.objects.create(title='audit {}'.format(index), body='audit', owner=user, category=root,
+                                     is_public=True) for index in range(3)]
+        BlogVisitLog.objects.bulk_create([BlogVisitLog(post=post, user=user) for post in posts])
+        Image.objects.bulk_create([Image(image='audit/{}.png'.format(index), name='audit', owner=user)
+                                   for index in range(3)])
+        return {'anonymous': None, 'user': user, 'admin': admin, 'post': posts[0], 'category': root}
+
+    def _audit(self, user, path, params):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        params = dict(params, page_size=1)
+
+        post_response_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path, params, format='json')
+            if response.status_code != 200:
+                raise CommandError('GET {} {} returned {}.'.format(path, params, response.status_code))
+            next_page = isinstance(response.data, dict) and response.data.get('next')
+            if next_page:
+                client.get(next_page, format='json')
+
+        issues = set()
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    scan, sort = FULL_SCAN.match(detail), TEMP_SORT.match(detail)
+                    if scan:
+                        issues.add('full scan of {}'.format(scan.group('table')))
+                    elif sort:
+                        issues.add('temp B-tree for {}'.format(sort.group('clause').lower()))
+        return issues
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.metadata import extract_metadata
+from api.models import MediaBlob
+from api.storage import content_storage
+
+
+class Command(BaseCommand):
+    help = 'Reads MIME type, dimensions and duration of stored blobs that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-read every blob, not just ones without a MIME type.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        queryset = MediaBlob.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(mime='')
+        fields = ['mime', 'width', 'height', 'orientation', 'duration']
+
+        updated = missing = 0
+        batch = []
+        for name in queryset.order_by('pk').values_list('name', flat=True).iterator():
+            if not content_storage.exists(name):
+                missing += 1
+                continue
+            batch.append(MediaBlob(name=name, **extract_metadata(content_storage.path(name))))
+            if len(batch) >= options['batch_size']:
+                MediaBlob.objects.bulk_update(batch, fields)
+                updated, batch = updated + len(batch), []
+        MediaBlob.objects.bulk_update(batch, fields)
+        updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Updated metadata of {} blob(s), {} file(s) missing.'.format(updated, missing)))
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import images
+from api.models import Image, User
+
+
+class Command(BaseCommand):
+    help = 'Generates resized variants of uploaded images and profile pictures that lack current ones.'
+
+    # model -> (file field, version field)
+    targets = (
+        (Image, 'image', 'variants_version'),
+        (User, 'profile_pic', 'profile_pic_variants_version'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate every variant, not just stale ones.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        config = images.variant_config()
+        version = images.config_version(config)
+        workers = max(1, options['workers'])
+
+        generated = failed = 0
+        pending = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for model, field, version_field in self.targets:
+                queryset = model.objects.exclude(**{field: ''})
+                if model is User:
+                    # The shared default picture is not an upload.
+                    queryset = queryset.exclude(**{field: model._meta.get_field(field).default})
+                if not options['all']:
+                    queryset = queryset.exclude(**{version_field: version})
+                for pk, name in queryset.order_by('pk').values_list('pk', field).iterator():
+                    future = executor.submit(images.render_variants, settings.MEDIA_ROOT, name, config)
+                    pending[future] = (model, pk, field, version_field, name)
+                    # Keep a bounded number of images in flight so large tables are not read into memory at once.
+                    if len(pending) >= workers * 4:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        saved, errors = self._save(done, pending, version)
+                        generated, failed = generated + saved, failed + errors
+            saved, errors = self._save(wait(pending).done, pending, version)
+            generated, failed = generated + saved, failed + errors
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated variants for {} image(s), {} failed.'.format(generated, failed)))
+
+    def _save(self, futures, pending, version):
+        saved = failed = 0
+        for future in futures:
+            model, pk, field, version_field, name = pending.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                self.stderr.write('Failed to generate variants of {}: {}'.format(name, e))
+                failed += 1
+                continue
+            model.objects.filter(pk=pk, **{field: name}).update(**{version_field: version})
+            saved += 1
+        return saved, failed
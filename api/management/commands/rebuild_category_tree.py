@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import categories
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized path of every category from its parent links.'
+
+    def handle(self, *args, **options):
+        count = categories.rebuild_paths()
+        self.stdout.write(self.style.SUCCESS('Rebuilt {} category path(s).'.format(count)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import analytics
+from api.visit_logs import visit_log_buffer
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the reading analytics of posts from the visit rollups and logs. Readers of days '
+            'already rolled up are not known, so run it before the first rollup_visit_logs.')
+
+    def handle(self, *args, **options):
+        visit_log_buffer.flush()
+        count = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS('Counted {} visit log(s).'.format(count)))
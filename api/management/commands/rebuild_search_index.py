@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text index of posts.'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Full-text search requires the sqlite3 backend.')
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Indexed {} post(s).'.format(count)))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = 'Folds new views, likes and reading time into the trending score of posts. Run periodically.'
+
+    def handle(self, *args, **options):
+        updated = trending.refresh_trending()
+        self.stdout.write(self.style.SUCCESS('Updated {} post(s).'.format(updated)))
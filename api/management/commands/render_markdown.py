@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from api import rendering
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Re-renders post bodies whose HTML was produced with a different Markdown config.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every post, not just stale ones.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        config = rendering.markdown_config()
+        version = rendering.config_version(config)
+        queryset = Post.objects.all()
+        if not options['all']:
+            queryset = queryset.exclude(body_html_version=version)
+        rows = queryset.order_by('pk').values_list('pk', 'body').iterator()
+
+        workers = max(1, options['workers'])
+        rendered = 0
+        pending = set()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk in self._chunks(rows, options['chunk_size']):
+                pending.add(executor.submit(rendering.render_many, chunk, config))
+                # Keep a bounded number of chunks in flight so large tables are not read into memory at once.
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    rendered += self._save(done, version)
+            rendered += self._save(wait(pending).done, version)
+
+        self.stdout.write(self.style.SUCCESS('Rendered {} post(s).'.format(rendered)))
+
+    @staticmethod
+    def _save(futures, version):
+        saved = 0
+        for future in futures:
+            posts = [Post(pk=pk, body_html=html, body_html_version=version) for pk, html in future.result()]
+            # bulk_update skips signals and auto_now, so lastUpdatedTimestamp is untouched.
+            Post.objects.bulk_update(posts, ['body_html', 'body_html_version'])
+            saved += len(posts)
+        return saved
+
+    @staticmethod
+    def _chunks(rows, size):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = ('Compacts visit logs older than the retention window into daily per-post rollups and '
+            'deletes the raw rows. Run periodically.')
+
+    def handle(self, *args, **options):
+        days, deleted = rollups.rollup_visit_logs()
+        self.stdout.write(self.style.SUCCESS('Rolled up {} day(s) and deleted {} visit log(s).'.format(days, deleted)))
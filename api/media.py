@@ -0,0 +1,213 @@
+import mimetypes
+import os
+import posixpath
+import stat
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from api.storage import BLOB_DIRECTORY
+
+DEFAULT_MEDIA_SERVING = {
+    # 'python' streams the file from Django, handing the open file to the server's
+    # wsgi.file_wrapper (sendfile) when it has one. 'x-accel-redirect' (nginx) and
+    # 'x-sendfile' (Apache, lighttpd) only check the request and let the server send it.
+    'MODE': 'python',
+    # Internal nginx location that aliases MEDIA_ROOT.
+    'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+    'BLOCK_SIZE': 256 * 1024,
+    # Requests asking for more ranges than this get the whole file.
+    'MAX_RANGES': 16,
+}
+
+# Content-addressed blobs never change under the same name. Their image variants do:
+# they are rebuilt in place when IMAGE_VARIANTS changes.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class RangeFile(object):
+    """
+    Read-only view of bytes [start, end) of an open file. The file is positioned at
+    `start`, so a WSGI server's file_wrapper can sendfile from the descriptor and stop
+    at Content-Length, while plain iteration stops at `end`.
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.remaining = end - start
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def media_config():
+    config = dict(DEFAULT_MEDIA_SERVING)
+    config.update(getattr(settings, 'MEDIA_SERVING', {}))
+    return config
+
+
+def parse_range(header, size, max_ranges):
+    """
+    Returns the sorted, merged [start, end) ranges of a `Range: bytes=...` header, or
+    None if the header should be ignored. Raises RangeNotSatisfiable if no range overlaps
+    the file.
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if not specs or len(specs) > max_ranges:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition('-')
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if end <= start:
+                    return None
+            else:
+                start, end = max(0, size - int(last)), size
+                if int(last) == 0:
+                    continue
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def serve_media(request, path):
+    """
+    Serves a file under MEDIA_ROOT with single and multiple byte ranges, ETag and
+    Last-Modified validators, and zero-copy transfer or server offload.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('"{}" does not exist'.format(path))
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('"{}" does not exist'.format(path))
+
+    config = media_config()
+    size = stat_result.st_size
+    etag = '"{:x}-{:x}"'.format(size, stat_result.st_mtime_ns)
+    last_modified = int(stat_result.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+        if config['MODE'] == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = config['ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + quote(path)
+        elif config['MODE'] == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = fullpath
+        else:
+            response = _file_response(request, fullpath, size, content_type, etag, last_modified, config)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if path.startswith(BLOB_DIRECTORY + '/') and '/variants/' not in path:
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def _file_response(request, fullpath, size, content_type, etag, last_modified, config):
+    ranges = None
+    header = request.META.get('HTTP_RANGE')
+    if header and _if_range_matches(request, etag, last_modified):
+        try:
+            ranges = parse_range(header, size, config['MAX_RANGES'])
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+    if not ranges:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(RangeFile(open(fullpath, 'rb'), start, end), content_type=content_type, status=206)
+        response['Content-Length'] = end - start
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end - 1, size)
+    else:
+        boundary = uuid.uuid4().hex
+        headers = [_part_header(boundary, content_type, start, end, size) for start, end in ranges]
+        closing = '\r\n--{}--\r\n'.format(boundary).encode('ascii')
+        response = StreamingHttpResponse(
+            _multipart(fullpath, ranges, headers, closing, config['BLOCK_SIZE']), status=206,
+            content_type='multipart/byteranges; boundary=' + boundary)
+        response['Content-Length'] = sum(len(part) for part in headers) + len(closing) + \
+            sum(end - start for start, end in ranges)
+    response.block_size = config['BLOCK_SIZE']
+    return response
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _part_header(boundary, content_type, start, end, size):
+    return '\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+        boundary, content_type, start, end - 1, size).encode('ascii')
+
+
+def _multipart(fullpath, ranges, headers, closing, block_size):
+    with open(fullpath, 'rb') as file:
+        for (start, end), header in zip(ranges, headers):
+            yield header
+            part = RangeFile(file, start, end)
+            for block in iter(lambda: part.read(block_size), b''):
+                yield block
+    yield closing
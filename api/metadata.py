@@ -0,0 +1,105 @@
+import mimetypes
+import struct
+import wave
+
+from PIL import Image as PilImage
+
+# EXIF orientations that rotate the picture by 90 degrees, swapping width and height.
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+EXIF_ORIENTATION = 0x0112
+
+MP4_EXTENSIONS = ('.mp4', '.m4a', '.m4v', '.mov', '.3gp')
+# Boxes walked into on the way to mvhd and tkhd.
+MP4_CONTAINERS = (b'moov', b'trak')
+
+
+def extract_metadata(path):
+    """
+    Reads MIME type, dimensions and duration from the headers of the file at `path`.
+    Only the bytes needed are read; values that cannot be found are left empty.
+    """
+    metadata = {'mime': mimetypes.guess_type(path)[0] or '', 'width': None, 'height': None, 'duration': None}
+    extension = path[path.rfind('.'):].lower()
+    try:
+        if metadata['mime'].startswith('image/'):
+            metadata.update(_image_metadata(path))
+        elif extension == '.wav':
+            metadata.update(_wav_metadata(path))
+        elif extension in MP4_EXTENSIONS:
+            metadata.update(_mp4_metadata(path))
+    except (OSError, EOFError, ValueError, struct.error, wave.Error, SyntaxError):
+        # Not what the extension claims; keep what was guessed from the name.
+        pass
+    metadata['orientation'] = orientation(metadata['width'], metadata['height'])
+    return metadata
+
+
+def orientation(width, height):
+    if not width or not height:
+        return ''
+    if width == height:
+        return 'square'
+    return 'landscape' if width > height else 'portrait'
+
+
+def _image_metadata(path):
+    # Pillow parses the header on open and only decodes pixels on load, which is not needed here.
+    with PilImage.open(path) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        return {'mime': PilImage.MIME.get(image.format, ''), 'width': width, 'height': height}
+
+
+def _wav_metadata(path):
+    with wave.open(path, 'rb') as audio:
+        return {'mime': 'audio/wav', 'duration': audio.getnframes() / float(audio.getframerate())}
+
+
+def _mp4_metadata(path):
+    """
+    Duration from the movie header (mvhd) and dimensions from the first visual track
+    header (tkhd). Boxes are skipped by their size, so media data is never read.
+    """
+    metadata = {}
+    with open(path, 'rb') as file:
+        file.seek(0, 2)
+        for box, start, end in _mp4_boxes(file, 0, file.tell()):
+            if box == b'mvhd':
+                # struct raises on a box cut short, like every other header read here.
+                version = struct.unpack('>B3x', file.read(4))[0]
+                if version == 1:
+                    timescale, duration = struct.unpack('>16xIQ', file.read(28))
+                else:
+                    timescale, duration = struct.unpack('>8xII', file.read(16))
+                if timescale:
+                    metadata['duration'] = duration / float(timescale)
+            elif box == b'tkhd' and 'width' not in metadata and end - start >= 8:
+                # Width and height are the last 8 bytes, as 16.16 fixed point.
+                file.seek(end - 8)
+                width, height = struct.unpack('>II', file.read(8))
+                if width and height:
+                    metadata['width'], metadata['height'] = width >> 16, height >> 16
+    return metadata
+
+
+def _mp4_boxes(file, start, end):
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        size, box = struct.unpack('>I4s', file.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', file.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            raise ValueError('Invalid MP4 box size.')
+        if box in MP4_CONTAINERS:
+            for child in _mp4_boxes(file, position + header, position + size):
+                yield child
+        else:
+            file.seek(position + header)
+            yield box, position + header, position + size
+        position += size
@@ -4,7 +4,9 @@ import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 
+from api.storage import content_storage
 from api.utils import random_string
 
 
@@ -18,6 +20,8 @@ class Group(models.Model):
 class User(AbstractUser):
     REQUIRED_FIELDS = ['email', 'password']
     profile_pic = models.ImageField(default='default_profile.jpeg')  # set up default pic
+    # Variant config the resized copies of `profile_pic` were generated with; empty until they exist.
+    profile_pic_variants_version = models.CharField(max_length=12, blank=True, default='', editable=False)
     user_id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False)
     groups = models.ManyToManyField(
@@ -34,6 +38,9 @@ class User(AbstractUser):
 
     class Meta:
         db_table = 'user'
+        indexes = [
+            models.Index(fields=['date_joined', 'user_id'], name='user_date_joined_idx'),
+        ]
 
 
 class UserGroup(models.Model):
@@ -47,6 +54,8 @@ class UserGroup(models.Model):
 class Category(models.Model):
     name = models.CharField(primary_key=True, max_length=100)
     parent = models.ForeignKey('self', null=True, on_delete=models.SET_NULL, related_name="parent_category")
+    # Materialized path of names from the root, e.g. '/tech/python/'. Maintained by signals.
+    path = models.CharField(max_length=1000, db_index=True, default='', editable=False)
     createdBy = models.ForeignKey(
         User,
         blank=True,
@@ -77,8 +86,16 @@ class Post(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=500, null=True)
     body = models.TextField()
-    video = models.FileField(upload_to=get_video_upload_path, null=True)
-    audio = models.FileField(upload_to=get_audio_upload_path, null=True)
+    # `body` rendered to sanitized HTML on write, and the Markdown config it was rendered with.
+    body_html = models.TextField(blank=True, default='', editable=False)
+    body_html_version = models.CharField(max_length=12, blank=True, default='', editable=False)
+    video = models.FileField(upload_to=get_video_upload_path, storage=content_storage, null=True)
+    audio = models.FileField(upload_to=get_audio_upload_path, storage=content_storage, null=True)
+    # Joins on the stored file names; no columns of their own.
+    video_blob = models.ForeignObject('MediaBlob', on_delete=models.DO_NOTHING, from_fields=['video'],
+                                      to_fields=['name'], null=True, related_name='+', serialize=False)
+    audio_blob = models.ForeignObject('MediaBlob', on_delete=models.DO_NOTHING, from_fields=['audio'],
+                                      to_fields=['name'], null=True, related_name='+', serialize=False)
 
     owner = models.ForeignKey(
         User,
@@ -98,6 +115,14 @@ class Post(models.Model):
     is_public = models.BooleanField(default=False)
     like = models.IntegerField(default=0)
 
+    # Log of the time-decayed popularity, maintained by `manage.py refresh_trending`,
+    # and the counters it had already accounted for.
+    trending_score = models.FloatField(default=0, db_index=True)
+    trending_view_base = models.BigIntegerField(default=0)
+    trending_like_base = models.IntegerField(default=0)
+    # Set when a counter flush moves view or like past its base, so the refresh reads only these posts.
+    trending_dirty = models.BooleanField(default=False, db_index=True)
+
     createdTimestamp = models.DateTimeField(
         auto_now_add=True,
         editable=False,
@@ -107,6 +132,23 @@ class Post(models.Model):
 
     class Meta:
         db_table = 'post'
+        # Ordered reads of the lists, found with `manage.py audit_query_plans`.
+        indexes = [
+            models.Index(fields=['createdTimestamp'], name='post_created_idx'),
+            models.Index(fields=['category', 'createdTimestamp'], name='post_category_created_idx'),
+        ]
+
+
+class PostLike(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_likes')
+    createdTimestamp = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        db_table = 'post_like'
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='post_like_post_user_unique'),
+        ]
 
 
 def get_image_upload_path(instance, filename):
@@ -118,7 +160,12 @@ def get_image_upload_path(instance, filename):
 
 class Image(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    image = models.ImageField(upload_to=get_image_upload_path)
+    image = models.ImageField(upload_to=get_image_upload_path, storage=content_storage)
+    # Joins on the stored file name, so metadata filters need no column of their own.
+    blob = models.ForeignObject('MediaBlob', on_delete=models.DO_NOTHING, from_fields=['image'],
+                                to_fields=['name'], null=True, related_name='+', serialize=False)
+    # Variant config the resized copies of `image` were generated with; empty until they exist.
+    variants_version = models.CharField(max_length=12, blank=True, default='', editable=False)
     name = models.CharField(max_length=100)
     is_public = models.BooleanField(default=True)
     owner = models.ForeignKey(
@@ -135,11 +182,205 @@ class Image(models.Model):
 
     class Meta:
         db_table = 'image'
+        indexes = [
+            models.Index(fields=['owner', 'createdTimestamp', 'id'], name='image_owner_created_idx'),
+        ]
+
+
+class MediaBlob(models.Model):
+    """
+    A stored upload, shared by every Image, Post.video and Post.audio with the same
+    content. `references` counts them; the file goes when it drops to zero.
+
+    Metadata is read from the file once, when its first reference is added.
+    """
+    ORIENTATION_CHOICES = (
+        ('landscape', 'landscape'),
+        ('portrait', 'portrait'),
+        ('square', 'square'),
+    )
+
+    name = models.CharField(primary_key=True, max_length=255)
+    hash = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(db_index=True)
+    mime = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    # Displayed dimensions, i.e. after EXIF rotation.
+    width = models.PositiveIntegerField(null=True, db_index=True)
+    height = models.PositiveIntegerField(null=True, db_index=True)
+    orientation = models.CharField(max_length=10, choices=ORIENTATION_CHOICES, blank=True, default='',
+                                   db_index=True)
+    # Seconds, for audio and video whose container is cheap to parse.
+    duration = models.FloatField(null=True, db_index=True)
+    references = models.PositiveIntegerField(default=0)
+    createdTimestamp = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        db_table = 'media_blob'
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of a post's video or audio. Chunks are written into a file of
+    the final size under `RESUMABLE_UPLOADS['DIRECTORY']` and recorded as UploadChunk rows.
+    """
+    FIELD_CHOICES = (
+        ('video', 'video'),
+        ('audio', 'audio'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='upload_sessions')
+    field = models.CharField(max_length=10, choices=FIELD_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    createdTimestamp = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        db_table = 'upload_session'
+
+
+class UploadChunk(models.Model):
+    """
+    A byte range [start, end) written to an UploadSession's file.
+    """
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    start = models.BigIntegerField()
+    end = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'upload_chunk'
 
 
 class BlogVisitLog(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     post = models.ForeignKey(Post, blank=False, null=False, on_delete=models.CASCADE, related_name='user_views')
     user = models.ForeignKey(User, blank=False, null=False, on_delete=models.CASCADE, related_name='post_views')
-    start_time = models.DateTimeField(auto_now_add=True, editable=False)
-    end_time = models.DateTimeField(auto_now=True, editable=True)
+    # Set in-process rather than by auto_now so rows inserted late by the write-behind
+    # buffer keep the time of the visit.
+    start_time = models.DateTimeField(default=timezone.now, editable=False)
+    end_time = models.DateTimeField(default=timezone.now, editable=True, db_index=True)
+    # The end_time up to which `refresh_trending` has counted the visit's reading time.
+    trending_counted_until = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        # The visit log list returns the latest visits, optionally of one user or post.
+        indexes = [
+            models.Index(fields=['start_time'], name='visit_log_start_idx'),
+            models.Index(fields=['user', 'start_time'], name='visit_log_user_start_idx'),
+            models.Index(fields=['post', 'start_time'], name='visit_log_post_start_idx'),
+        ]
+
+
+class JobWatermark(models.Model):
+    """
+    The point in time up to which a periodic job has processed its input.
+    """
+    name = models.CharField(primary_key=True, max_length=100)
+    value = models.DateTimeField()
+
+    class Meta:
+        db_table = 'job_watermark'
+
+
+class PostDailyVisitRollup(models.Model):
+    """
+    Visit logs of one post on one day, compacted by `manage.py rollup_visit_logs` once
+    the raw rows leave the retention window. Dwell times are in seconds.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_visits')
+    day = models.DateField()
+    views = models.PositiveIntegerField()
+    unique_users = models.PositiveIntegerField()
+    total_dwell = models.FloatField()
+    median_dwell = models.FloatField()
+
+    class Meta:
+        db_table = 'post_daily_visit_rollup'
+        unique_together = ('post', 'day')
+
+
+class PostReadingStats(models.Model):
+    """
+    Running totals of a post's visits, maintained by `api.analytics` as visit logs are
+    written so analytics never aggregate the raw logs. Read time is in seconds.
+    """
+    post = models.OneToOneField(Post, primary_key=True, on_delete=models.CASCADE, related_name='reading_stats')
+    views = models.BigIntegerField(default=0)
+    readers = models.IntegerField(default=0)
+    read_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'post_reading_stats'
+
+
+class PostReadingDaily(models.Model):
+    """
+    The same totals per day of the visit's start, for time series. `new_readers` counts
+    users who read the post for the first time that day.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reading_daily')
+    day = models.DateField()
+    views = models.IntegerField(default=0)
+    new_readers = models.IntegerField(default=0)
+    read_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'post_reading_daily'
+        unique_together = ('post', 'day')
+
+
+class PostReader(models.Model):
+    """
+    A user who has read a post, so repeat visits are not counted as new readers.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='readers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_posts')
+    first_visit = models.DateTimeField()
+
+    class Meta:
+        db_table = 'post_reader'
+        unique_together = ('post', 'user')
+
+
+class AuthorReadingStats(models.Model):
+    """
+    PostReadingStats summed over an author's posts. A user reading several of them is
+    one reader.
+    """
+    author = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='reading_stats')
+    views = models.BigIntegerField(default=0)
+    readers = models.IntegerField(default=0)
+    read_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'author_reading_stats'
+
+
+class AuthorReadingDaily(models.Model):
+    """
+    AuthorReadingStats per day of the visit's start. `new_readers` counts users who read
+    one of the author's posts for the first time that day.
+    """
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_daily')
+    day = models.DateField()
+    views = models.IntegerField(default=0)
+    new_readers = models.IntegerField(default=0)
+    read_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'author_reading_daily'
+        unique_together = ('author', 'day')
+
+
+class AuthorReader(models.Model):
+    """
+    A user who has read any post of an author.
+    """
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='author_readers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    first_visit = models.DateTimeField()
+
+    class Meta:
+        db_table = 'author_reader'
+        unique_together = ('author', 'user')
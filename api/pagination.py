@@ -0,0 +1,148 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(object):
+    """
+    Cursor pagination that seeks on the ordering columns instead of using OFFSET.
+
+    `ordering` is a sequence of field names (optionally prefixed with '-') whose last
+    entry must be unique, usually the primary key. The cursor holds the ordering values
+    of the row at the edge of the current page, so fetching any page is a range scan of
+    `page_size` rows and stays stable while rows are inserted.
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering if not self.reverse else tuple(_flip(field) for field in self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, self.position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = cursor['v']
+            reverse = bool(cursor.get('r', False))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [self._to_python(field, value) for field, value in zip(self.ordering, values)]
+        except (TypeError, KeyError, ValueError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        values = [getattr(instance, self._attname(field)) for field in self.ordering]
+        payload = json.dumps({'v': values, 'r': reverse}, cls=CursorEncoder, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def _seek_filter(self, ordering, position):
+        # (a, b, c) > (x, y, z)  <=>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+            condition |= Q(**dict(equal, **{lookup: value}))
+            equal[name] = value
+        return condition
+
+    def _field(self, name):
+        name = name.lstrip('-')
+        if name == 'pk':
+            return self.model._meta.pk
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _attname(self, name):
+        field = self._field(name)
+        return field.attname if field is not None else name.lstrip('-')
+
+    def _to_python(self, name, value):
+        field = self._field(name)
+        if field is None or value is None:
+            return value
+        return field.to_python(value)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds, which would skip rows on seek.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super(CursorEncoder, self).default(o)
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else '-' + field
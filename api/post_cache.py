@@ -0,0 +1,99 @@
+from api.cache import TaggedLRUCache
+from api.counters import view_counter, like_counter
+
+post_response_cache = TaggedLRUCache('POST_RESPONSE')
+
+# Query parameters that change the body of a post list or retrieve response.
+CACHE_PARAMS = ('author', 'title', 'category', 'includeDescendants', 'orderBy', 'search', 'cursor', 'page_size',
+                'fields', 'expand')
+
+LIST_TAG = 'post-list'
+AUTHOR_FILTER_TAG = 'post-author-filter'
+CATEGORY_TREE_TAG = 'post-category-tree'
+
+# Post fields backed by a write-behind counter.
+COUNTERS = {
+    'view': view_counter,
+    'like': like_counter,
+}
+
+
+def cache_key(action, request, pk=None):
+    params = []
+    for name in CACHE_PARAMS:
+        value = request.query_params.get(name, '').strip()
+        if value:
+            params.append((name, value))
+    return action, None if pk is None else str(pk), tuple(params)
+
+
+def post_tags(post):
+    return [('post', post.pk), ('user', str(post.owner_id)), ('category', post.category_id)]
+
+
+class CachedPosts(object):
+    """
+    A serialized post or page of posts. Counter fields are kept apart from the body so
+    a cached response still reports increments made after it was cached.
+    """
+
+    def __init__(self, data, many=False, owner_id=None):
+        self.data = data
+        self.many = many
+        self.owner_id = owner_id
+        self.counts = {}
+        for field, counter in COUNTERS.items():
+            self.counts[field] = {post['id']: post[field] - counter.pending(post['id'])
+                                  for post in self.posts() if field in post}
+
+    def posts(self):
+        return self.data['results'] if self.many else [self.data]
+
+    def tags(self, request, instances):
+        tags = [tag for post in instances for tag in post_tags(post)]
+        if self.many:
+            tags.append(LIST_TAG)
+            if request.query_params.get('author'):
+                tags.append(AUTHOR_FILTER_TAG)
+            if request.query_params.get('category'):
+                tags.append(('category', request.query_params['category']))
+                if request.query_params.get('includeDescendants'):
+                    tags.append(CATEGORY_TREE_TAG)
+        return tags
+
+    def add_flushed(self, field, pk, delta):
+        counts = self.counts[field]
+        if pk in counts:
+            counts[pk] += delta
+
+    def render(self):
+        if not self.many:
+            return self._render_post(self.data)
+        data = dict(self.data)
+        data['results'] = [self._render_post(post) for post in self.data['results']]
+        return data
+
+    def _render_post(self, post):
+        post = dict(post)
+        for field, counter in COUNTERS.items():
+            if post['id'] in self.counts[field]:
+                post[field] = self.counts[field][post['id']] + counter.pending(post['id'])
+        return post
+
+
+def cache_posts(key, request, data, instances, many=False, owner_id=None):
+    cached = CachedPosts(data, many=many, owner_id=owner_id)
+    return post_response_cache.set(key, cached, tags=cached.tags(request, instances))
+
+
+def add_flushed_counts(counter, batch):
+    """
+    Moves flushed counter deltas into the stored counts of cached responses.
+    """
+    fields = [field for field, candidate in COUNTERS.items() if candidate is counter]
+    for field in fields:
+        for pk, delta in batch.items():
+            for key in post_response_cache.keys_for(('post', pk)):
+                cached = post_response_cache.peek(key)
+                if cached is not None:
+                    cached.add_flushed(field, pk, delta)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+import markdown
+from django.conf import settings
+
+DEFAULT_MARKDOWN = {
+    'EXTENSIONS': ['extra', 'sane_lists'],
+    'EXTENSION_CONFIGS': {},
+}
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'blockquote', 'br', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot',
+    'th', 'thead', 'tr', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Tags dropped together with their content.
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template'}
+ALLOWED_ATTRIBUTES = {
+    '*': {'id', 'title'},
+    'a': {'href'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'code': {'class'},
+    'div': {'class'},
+    'span': {'class'},
+    'td': {'align', 'style'},
+    'th': {'align', 'style'},
+    'ol': {'start'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto'}
+# Browsers ignore control characters and spaces around a URL and tabs and newlines inside
+# it, and urlparse before Python 3.11 does not, so they are removed before the scheme check.
+URL_IGNORED = re.compile(r'[\x00-\x20]')
+# Table cell alignment is the only inline style Markdown emits.
+ALLOWED_STYLE = re.compile(r'^text-align:\s*(left|right|center);?$')
+
+
+def markdown_config():
+    config = dict(DEFAULT_MARKDOWN)
+    config.update(getattr(settings, 'MARKDOWN', {}))
+    return config
+
+
+def config_version(config=None):
+    """
+    Short hash of the Markdown configuration. Posts rendered under a different version
+    are stale and picked up by the `render_markdown` command.
+    """
+    config = config if config is not None else markdown_config()
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def render_markdown(text, config=None):
+    """
+    Renders Markdown to HTML and strips everything outside the allow-list.
+    Takes the config explicitly so it can run in worker processes.
+    """
+    config = config if config is not None else markdown_config()
+    html = markdown.markdown(text or '', extensions=config['EXTENSIONS'],
+                             extension_configs=config['EXTENSION_CONFIGS'])
+    return sanitize_html(html)
+
+
+def render_many(items, config):
+    """
+    Renders a list of (pk, text) pairs. Used as the process pool task.
+    """
+    return [(pk, render_markdown(text, config)) for pk, text in items]
+
+
+def sanitize_html(html):
+    sanitizer = _Sanitizer()
+    sanitizer.feed(html)
+    sanitizer.close()
+    return ''.join(sanitizer.output)
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super(_Sanitizer, self).__init__(convert_charrefs=True)
+        self.output = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        self.output.append(self._start_tag(tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        self.output.append(self._start_tag(tag, attrs))
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in ALLOWED_TAGS or tag in VOID_TAGS:
+            return
+        self.output.append('</%s>' % tag)
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.output.append(escape(data, quote=False))
+
+    def _start_tag(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set()) | ALLOWED_ATTRIBUTES['*']
+        rendered = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and urlparse(URL_IGNORED.sub('', value)).scheme.lower() not in ALLOWED_SCHEMES:
+                continue
+            if name == 'style' and not ALLOWED_STYLE.match(value.strip()):
+                continue
+            rendered.append(' %s="%s"' % (name, escape(value, quote=True)))
+        return '<%s%s>' % (tag, ''.join(rendered))
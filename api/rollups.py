@@ -0,0 +1,127 @@
+import statistics
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import BlogVisitLog, JobWatermark, PostDailyVisitRollup
+
+DEFAULT_VISIT_LOG_ROLLUP = {
+    # Raw logs are kept for this many whole days before being compacted into daily rollups.
+    'RETENTION_DAYS': 30,
+    # Rows per DELETE, so compaction never holds the write lock for long.
+    'DELETE_CHUNK_SIZE': 1000,
+}
+
+WATERMARK = 'visit_log_rollup'
+
+
+def rollup_config():
+    config = dict(DEFAULT_VISIT_LOG_ROLLUP)
+    config.update(getattr(settings, 'VISIT_LOG_ROLLUP', {}))
+    return config
+
+
+def day_start(day):
+    return datetime.combine(day, time.min).replace(tzinfo=timezone.utc)
+
+
+def compacted_until():
+    """
+    Start of the first day whose raw logs are still kept, or None before the first rollup.
+    """
+    watermark = JobWatermark.objects.filter(name=WATERMARK).first()
+    return watermark.value if watermark else None
+
+
+def aggregate(rows):
+    """
+    Folds (post_id, user_id, start_time, end_time) rows into per-post-per-day stats.
+    """
+    groups = defaultdict(lambda: ([], set()))
+    for post_id, user_id, start_time, end_time in rows:
+        dwells, users = groups[(post_id, start_time.date())]
+        dwells.append(max(0.0, (end_time - start_time).total_seconds()))
+        users.add(user_id)
+    return {
+        key: {
+            'views': len(dwells),
+            'unique_users': len(users),
+            'total_dwell': sum(dwells),
+            'median_dwell': statistics.median(dwells),
+        }
+        for key, (dwells, users) in groups.items()
+    }
+
+
+def rollup_visit_logs(now=None):
+    """
+    Compacts raw visit logs of whole days older than `RETENTION_DAYS` into
+    PostDailyVisitRollup rows, one day per transaction, then deletes them in chunks.
+    The watermark moves with each day's rollups, so an interrupted run neither counts
+    a day twice nor loses one. Returns (days rolled up, raw rows deleted).
+    """
+    config = rollup_config()
+    cutoff = day_start((now or timezone.now()).date() - timedelta(days=config['RETENTION_DAYS']))
+    watermark = compacted_until()
+    # Rows a previous run rolled up but did not get to delete.
+    deleted = delete_compacted(watermark, config) if watermark else 0
+
+    days = 0
+    while True:
+        logs = BlogVisitLog.objects.filter(start_time__lt=cutoff)
+        if watermark:
+            logs = logs.filter(start_time__gte=watermark)
+        first = logs.order_by('start_time').values_list('start_time', flat=True).first()
+        if first is None:
+            break
+        start = day_start(first.astimezone(timezone.utc).date())
+        end = start + timedelta(days=1)
+
+        with transaction.atomic():
+            rows = BlogVisitLog.objects.filter(start_time__gte=start, start_time__lt=end) \
+                .values_list('post_id', 'user_id', 'start_time', 'end_time').iterator()
+            PostDailyVisitRollup.objects.bulk_create([
+                PostDailyVisitRollup(post_id=post_id, day=day, **stats)
+                for (post_id, day), stats in aggregate(rows).items()
+            ])
+            JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': end})
+        watermark = end
+        days += 1
+        deleted += delete_compacted(watermark, config)
+    return days, deleted
+
+
+def delete_compacted(watermark, config):
+    deleted = 0
+    while True:
+        chunk = list(BlogVisitLog.objects.filter(start_time__lt=watermark)
+                     .values_list('pk', flat=True)[:config['DELETE_CHUNK_SIZE']])
+        if not chunk:
+            return deleted
+        with transaction.atomic():
+            deleted += BlogVisitLog.objects.filter(pk__in=chunk).delete()[0]
+
+
+def daily_visits(post_id, since=None):
+    """
+    Per-day views, unique users and total and median dwell seconds of a post, oldest
+    first. Compacted days come from the rollups and the rest from the raw logs.
+    """
+    watermark = compacted_until()
+    rollups = PostDailyVisitRollup.objects.filter(post_id=post_id)
+    logs = BlogVisitLog.objects.filter(post_id=post_id)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+        logs = logs.filter(start_time__gte=day_start(since))
+    if watermark:
+        logs = logs.filter(start_time__gte=watermark)
+
+    days = {row['day']: row for row in rollups.values('day', 'views', 'unique_users', 'total_dwell',
+                                                        'median_dwell')}
+    raw = aggregate(logs.values_list('post_id', 'user_id', 'start_time', 'end_time').iterator())
+    for (_, day), stats in raw.items():
+        days[day] = dict(stats, day=day)
+    return [days[day] for day in sorted(days)]
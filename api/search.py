@@ -0,0 +1,99 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+INDEX_TABLE = 'post_fts'
+
+# bm25 weights for title, description and body.
+RANK = 'bm25(post_fts, 10.0, 4.0, 1.0)'
+# Matches are delimited by control characters, which survive HTML escaping and are then
+# turned into <mark> tags, so the rest of the snippet is never emitted as markup.
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET = "snippet(post_fts, -1, char(2), char(3), '…', 16)"
+
+_TOKEN = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(**kwargs):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts "
+            "USING fts5(title, description, body, tokenize='unicode61 remove_diacritics 2')")
+
+
+def index_post(post):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM post_fts WHERE rowid = %s', [post.pk])
+        cursor.execute('INSERT INTO post_fts(rowid, title, description, body) VALUES (%s, %s, %s, %s)',
+                       [post.pk, post.title, post.description or '', post.body])
+
+
+def remove_post(post_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM post_fts WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """
+    Replaces the whole index with the current posts in one INSERT ... SELECT.
+    Returns the number of indexed posts.
+    """
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM post_fts')
+        cursor.execute('INSERT INTO post_fts(rowid, title, description, body) '
+                       "SELECT id, title, COALESCE(description, ''), body FROM post")
+        cursor.execute("INSERT INTO post_fts(post_fts) VALUES ('optimize')")
+        cursor.execute('SELECT COUNT(*) FROM post_fts')
+        return cursor.fetchone()[0]
+
+
+def render_snippet(snippet):
+    """
+    HTML-escapes a snippet of the raw post text and highlights its matches with <mark>.
+    """
+    return escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def build_match_expression(query):
+    """
+    Turns user input into an FTS5 query: every word must match, and a trailing '*'
+    makes a word a prefix match. Operators and quotes in the input are not honoured.
+    """
+    terms = []
+    for token in _TOKEN.findall(query):
+        if token.endswith('*'):
+            terms.append('"%s"*' % token[:-1])
+        else:
+            terms.append('"%s"' % token)
+    return ' '.join(terms)
+
+
+def search(queryset, query):
+    """
+    Restricts a Post queryset to full-text matches, annotated with `search_rank`
+    (lower is better) and a highlighted `search_snippet`.
+    """
+    expression = build_match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSQL('SELECT rowid FROM post_fts WHERE post_fts MATCH %s', (expression,)),
+    ).annotate(
+        search_rank=RawSQL('SELECT ' + RANK + ' FROM post_fts WHERE post_fts MATCH %s AND rowid = post.id',
+                           (expression,)),
+        search_snippet=RawSQL('SELECT ' + SNIPPET + ' FROM post_fts WHERE post_fts MATCH %s AND rowid = post.id',
+                              (expression,)),
+    )
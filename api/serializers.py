@@ -1,9 +1,98 @@
+import os
+
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from api.models import User, Post, Image, Group, UserGroup, Category, BlogVisitLog
+from api import categories, images, search, uploads
+from api.counters import view_counter, like_counter
+from api.logins import last_login_buffer
+from api.models import User, Post, Image, Group, UserGroup, Category, BlogVisitLog, MediaBlob, UploadSession
+
+
+class DynamicFieldsMixin(object):
+    """
+    Lets a ModelSerializer return only the `fields` asked for and replace the relations
+    named in `expand` with nested objects. `expandable_fields` maps a relation to the
+    serializer class and kwargs used to inline it. The primary key is always returned.
+
+    `optimize_queryset` loads just the columns the chosen fields read and joins or
+    prefetches the expanded relations, so sparse or expanded lists cost one query.
+    Relations without a column of their own (ForeignObject) are always joined.
+    """
+    expandable_fields = {}
+    # Columns read by fields whose source is the whole object, e.g. SerializerMethodFields.
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super(DynamicFieldsMixin, self).__init__(*args, **kwargs)
+
+        for name in expand or ():
+            if name in self.expandable_fields and name in self.fields:
+                serializer_class, serializer_kwargs = self.expandable_fields[name]
+                self.fields[name] = serializer_class(read_only=True, **serializer_kwargs)
+
+        if fields:
+            allowed = set(fields)
+            allowed.add(self.Meta.model._meta.pk.name)
+            for name in set(self.fields) - allowed:
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=None, required=()):
+        serializer = cls(fields=fields, expand=expand)
+        model = cls.Meta.model
+        concrete = {field.name: field for field in model._meta.concrete_fields}
+        many_to_many = {field.name for field in model._meta.many_to_many}
+        joined = {field.name for field in model._meta.get_fields() if field.many_to_one and not field.concrete}
+
+        columns = {name for name in required if name in concrete}
+        select_related = []
+        prefetch_related = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            sources = cls.field_sources.get(name, (field.source.split('.')[0],))
+            columns.update(source for source in sources if source in concrete or source in joined)
+            select_related.extend(source for source in sources if source in joined)
+            if name in (expand or ()) and name in cls.expandable_fields:
+                if name in many_to_many:
+                    prefetch_related.append(name)
+                elif name in concrete:
+                    select_related.append(name)
+
+        if fields:
+            queryset = queryset.only(*columns)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only `{size: {format: url}}` of the resized copies of an image field, or null
+    until they have been generated.
+    """
+
+    def __init__(self, image_field, version_field, **kwargs):
+        self.image_field = image_field
+        self.version_field = version_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super(ImageVariantsField, self).__init__(**kwargs)
+
+    def to_representation(self, instance):
+        urls = images.variant_urls(getattr(instance, self.image_field), getattr(instance, self.version_field))
+        request = self.context.get('request', None)
+        if urls is None or request is None:
+            return urls
+        return {size: {fmt: request.build_absolute_uri(url) for fmt, url in formats.items()}
+                for size, formats in urls.items()}
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -18,8 +107,24 @@ class UserGroupSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserPublicSerializer(serializers.ModelSerializer):
+    profile_pic_variants = ImageVariantsField('profile_pic', 'profile_pic_variants_version')
+
+    class Meta:
+        model = User
+        fields = ('user_id', 'username', 'first_name', 'last_name', 'profile_pic', 'profile_pic_variants')
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'groups': (GroupSerializer, {'many': True}),
+    }
+    field_sources = {
+        'profile_pic_variants': ('profile_pic', 'profile_pic_variants_version'),
+    }
+
     profile_pic = serializers.ImageField(required=False)
+    profile_pic_variants = ImageVariantsField('profile_pic', 'profile_pic_variants_version')
     username = serializers.CharField(
         required=True,
     )
@@ -41,7 +146,7 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = '__all__'
+        exclude = ('profile_pic_variants_version',)
         read_only_fields = (
             'last_login', 'date_joined', 'is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')
 
@@ -64,7 +169,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = '__all__'
+        exclude = ('profile_pic_variants_version',)
         read_only_fields = (
             'last_login', 'date_joined', 'is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')
 
@@ -89,50 +194,137 @@ class UserAdminSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = '__all__'
+        exclude = ('profile_pic_variants_version',)
         read_only_fields = ('last_login', 'date_joined', "user_permissions")
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    def validate_name(self, value):
+        if '/' in value:
+            raise serializers.ValidationError('Category names cannot contain "/".')
+        return value
+
+    def validate_parent(self, value):
+        if value is not None and self.instance is not None and categories.is_within(value, self.instance):
+            raise serializers.ValidationError('A category cannot be moved under itself.')
+        return value
+
     class Meta:
         model = Category
         fields = '__all__'
         read_only_fields = ('createdBy',)
 
 
-class PostSerializer(serializers.ModelSerializer):
+class MediaMetadataSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MediaBlob
+        fields = ('hash', 'size', 'mime', 'width', 'height', 'orientation', 'duration')
+
+
+class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'owner': (UserPublicSerializer, {}),
+        'category': (CategorySerializer, {}),
+    }
+    field_sources = {
+        'view': ('view',),
+        'like': ('like',),
+        'video_metadata': ('video', 'video_blob'),
+        'audio_metadata': ('audio', 'audio_blob'),
+    }
+
+    view = serializers.SerializerMethodField()
+    like = serializers.SerializerMethodField()
+    video_metadata = MediaMetadataSerializer(source='video_blob', read_only=True)
+    audio_metadata = MediaMetadataSerializer(source='audio_blob', read_only=True)
+
+    # Counters include increments still waiting in the write-behind buffer.
+    def get_view(self, obj):
+        return obj.view + view_counter.pending(obj.pk)
+
+    def get_like(self, obj):
+        return obj.like + like_counter.pending(obj.pk)
+
+    def to_representation(self, instance):
+        data = super(PostSerializer, self).to_representation(instance)
+        if hasattr(instance, 'search_snippet'):
+            data['snippet'] = search.render_snippet(instance.search_snippet)
+        return data
+
     class Meta:
         model = Post
-        fields = '__all__'
-        read_only_fields = ('view', 'like', 'owner')
+        exclude = ('body_html_version', 'trending_score', 'trending_view_base', 'trending_like_base', 'trending_dirty')
+        read_only_fields = ('view', 'like', 'owner', 'body_html')
 
 
 class BlogVisitLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = BlogVisitLog
-        fields = '__all__'
+        exclude = ('trending_counted_until',)
         read_only_fields = ('post', 'user')
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'owner': (UserPublicSerializer, {}),
+    }
+    field_sources = {
+        'variants': ('image', 'variants_version'),
+        'metadata': ('image', 'blob'),
+    }
+
+    variants = ImageVariantsField('image', 'variants_version')
+    metadata = MediaMetadataSerializer(source='blob', read_only=True)
+
     class Meta:
         model = Image
-        fields = '__all__'
+        exclude = ('variants_version',)
         read_only_fields = ('owner', 'name',)
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    received = serializers.SerializerMethodField()
+    missing = serializers.SerializerMethodField()
+
+    def get_received(self, obj):
+        return uploads.received_ranges(obj)
+
+    def get_missing(self, obj):
+        return uploads.missing_ranges(self.get_received(obj), obj.size)
+
+    def validate_post(self, value):
+        if value.owner_id != self.context['request'].user.pk:
+            raise serializers.ValidationError('Uploads can only be attached to your own posts.')
+        return value
+
+    def validate_filename(self, value):
+        # The upload path is built from the name and extension of the file.
+        stem, extension = os.path.splitext(value)
+        if os.path.basename(value) != value or '\\' in value or not stem or len(extension) < 2:
+            raise serializers.ValidationError('Filename must be a file name with an extension.')
+        return value
+
+    def validate_size(self, value):
+        if value <= 0 or value > uploads.upload_config()['MAX_SIZE']:
+            raise serializers.ValidationError('Size must be between 1 and {} bytes.'.format(
+                uploads.upload_config()['MAX_SIZE']))
+        return value
+
+    class Meta:
+        model = UploadSession
+        fields = '__all__'
+        read_only_fields = ('owner',)
+
+
 class TokenObtainPairPatchedSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
+        # The parent already issued the refresh/access pair.
         data = super().validate(attrs)
 
-        refresh = self.get_token(self.user)
-
-        data['refresh'] = str(refresh)
-        data['access'] = str(refresh.access_token)
         data['is_staff'] = self.user.is_staff
         data['first_name'] = self.user.first_name
         data['last_name'] = self.user.last_name
         data['user_id'] = self.user.user_id
-        self.user.last_login = timezone.now()
-        self.user.save()
+        # Only last_login changes; it is written off the request path with other logins.
+        last_login_buffer.set(self.user.pk, timezone.now())
         return data
@@ -0,0 +1,199 @@
+from django.contrib.auth.models import Permission
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from api import analytics, categories, images, rendering, search, uploads
+from api.authentication import invalidate_principal
+from api.backends import invalidate_snapshot, invalidate_all_snapshots
+from api.buffers import counter_flushed, queue_flushed
+from api.models import Post, Category, User, UserGroup, Image, UploadSession, BlogVisitLog
+from api.post_cache import post_response_cache, add_flushed_counts, LIST_TAG, AUTHOR_FILTER_TAG, \
+    CATEGORY_TREE_TAG
+from api.visit_logs import recent_visits
+
+
+@receiver(pre_save, sender=Post)
+def render_post_body(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'body' not in update_fields:
+        return
+    config = rendering.markdown_config()
+    instance.body_html = rendering.render_markdown(instance.body, config)
+    instance.body_html_version = rendering.config_version(config)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    post_response_cache.invalidate(('post', instance.pk), LIST_TAG)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    post_response_cache.invalidate(('category', instance.pk), CATEGORY_TREE_TAG)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    post_response_cache.invalidate(('user', str(instance.pk)), AUTHOR_FILTER_TAG)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    # Covers is_active, is_staff and password changes made by UserViewSet.update/destroy.
+    invalidate_principal(instance.pk)
+    # is_active and is_superuser feed the permission snapshot as well.
+    invalidate_snapshot(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserGroup)
+def invalidate_group_membership(sender, instance, **kwargs):
+    invalidate_snapshot(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserGroup)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_permission_assignment(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_snapshot(instance.pk)
+    elif pk_set is None:
+        # Clearing from the Permission/Group side does not report the affected users.
+        invalidate_all_snapshots()
+    else:
+        for user_id in pk_set:
+            invalidate_snapshot(user_id)
+
+
+@receiver([post_save, post_delete], sender=Permission)
+def invalidate_permissions(sender, instance, **kwargs):
+    invalidate_all_snapshots()
+
+
+@receiver(counter_flushed)
+def update_cached_counts(sender, batch, **kwargs):
+    add_flushed_counts(sender, batch)
+
+
+@receiver(counter_flushed)
+def mark_trending_dirty(sender, batch, **kwargs):
+    if sender.model is Post:
+        Post.objects.filter(pk__in=[pk for pk, delta in batch.items() if delta]).update(trending_dirty=True)
+
+
+@receiver(post_save, sender=BlogVisitLog)
+def record_visit(sender, instance, created, **kwargs):
+    # Later end_time changes are counted by whoever moves it, as only they know the previous value.
+    if created:
+        analytics.record_visits([instance])
+        recent_visits.add(instance)
+
+
+@receiver(queue_flushed)
+def count_flushed_visits(sender, batch, **kwargs):
+    # bulk_create sends no post_save.
+    if sender.model is BlogVisitLog:
+        analytics.record_visits(batch)
+
+
+@receiver(pre_save, sender=Category)
+def set_category_path(sender, instance, **kwargs):
+    parent_path = None
+    if instance.parent_id is not None:
+        parent_path = Category.objects.filter(pk=instance.parent_id).values_list('path', flat=True).first()
+    instance._previous_path = Category.objects.filter(pk=instance.pk).values_list('path', flat=True).first()
+    instance.path = categories.build_path(instance.name, parent_path)
+
+
+@receiver(post_save, sender=Category)
+def move_category_subtree(sender, instance, **kwargs):
+    previous_path = getattr(instance, '_previous_path', None)
+    if previous_path and previous_path != instance.path:
+        categories.move_subtree(previous_path, instance.path)
+
+
+@receiver(pre_delete, sender=Category)
+def reroot_category_children(sender, instance, **kwargs):
+    # Children are detached by on_delete=SET_NULL and become roots.
+    categories.move_subtree(instance.path, categories.SEPARATOR)
+
+
+# Image fields that get resized variants: model -> (file field, version field).
+VARIANT_FIELDS = {
+    Image: ('image', 'variants_version'),
+    User: ('profile_pic', 'profile_pic_variants_version'),
+}
+
+
+@receiver(pre_save, sender=Image)
+@receiver(pre_save, sender=User)
+def mark_new_upload(sender, instance, **kwargs):
+    field, version_field = VARIANT_FIELDS[sender]
+    # The upload is committed to storage by the field's pre_save, which runs after this signal.
+    instance._new_upload = getattr(instance, field)._committed is False
+    if instance._new_upload:
+        setattr(instance, version_field, '')
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=User)
+def schedule_variants(sender, instance, **kwargs):
+    if getattr(instance, '_new_upload', False):
+        instance._new_upload = False
+        field, version_field = VARIANT_FIELDS[sender]
+        images.schedule(sender, instance.pk, field, version_field, getattr(instance, field).name)
+
+
+# File fields stored in the content-addressed storage.
+MEDIA_FIELDS = {
+    Image: ('image',),
+    Post: ('video', 'audio'),
+}
+
+
+def release_media(sender, field, name):
+    storage = sender._meta.get_field(field).storage
+    if storage.release(name) and VARIANT_FIELDS.get(sender, (None,))[0] == field:
+        # Variants are shared by every reference to the blob, so they go with the file.
+        images.delete_variants(storage, name)
+
+
+@receiver(pre_save, sender=Image)
+@receiver(pre_save, sender=Post)
+def remember_replaced_media(sender, instance, **kwargs):
+    fields = [field for field in MEDIA_FIELDS[sender] if getattr(instance, field)._committed is False]
+    instance._replaced_media = {}
+    if fields and not instance._state.adding:
+        previous = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+        instance._replaced_media = {field: name for field, name in previous.items() if name}
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=Post)
+def release_replaced_media(sender, instance, **kwargs):
+    replaced, instance._replaced_media = getattr(instance, '_replaced_media', {}), {}
+    for field, name in replaced.items():
+        if getattr(instance, field).name != name:
+            release_media(sender, field, name)
+
+
+@receiver(post_delete, sender=Image)
+@receiver(post_delete, sender=Post)
+def release_deleted_media(sender, instance, **kwargs):
+    for field in MEDIA_FIELDS[sender]:
+        if getattr(instance, field):
+            release_media(sender, field, getattr(instance, field).name)
+
+
+@receiver(post_delete, sender=UploadSession)
+def remove_upload_file(sender, instance, **kwargs):
+    uploads.remove_upload_file(instance)
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from api.metadata import extract_metadata
+
+BLOB_DIRECTORY = 'blobs'
+
+
+class BlobMissing(Exception):
+    """
+    The file of a new MediaBlob row was unlinked, by the release of its previous last
+    reference, after write_blob found it in place.
+    """
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct upload once, at `blobs/<ab>/<cd>/<sha256><ext>`.
+
+    The name built by `upload_to` only contributes its extension. Each save of a blob
+    adds a reference to its MediaBlob row and each delete drops one, so identical
+    uploads share a file that is unlinked with its last reference. Names without a
+    MediaBlob row, e.g. files stored before this backend, are deleted directly.
+    """
+
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save; nothing to deduplicate here.
+        return name
+
+    def _save(self, name, content):
+        return self.reference_blob(name, content)
+
+    def reference_blob(self, name, content, blob=None):
+        """
+        Adds a reference to the blob of `content`, as (name, sha256, size) from an earlier
+        write_blob or written now, and returns its name. If the blob was unlinked in the
+        meantime it is written again.
+        """
+        while True:
+            blob_name, digest, size = blob or self.write_blob(name, content)
+            try:
+                add_reference(blob_name, digest, size, self.path(blob_name))
+                return blob_name
+            except BlobMissing:
+                blob = None
+
+    def write_blob(self, name, content):
+        """
+        Puts `content` in place without touching the database and returns
+        (blob name, sha256, size). The caller must add the reference.
+        """
+        if hasattr(content, 'temporary_file_path'):
+            return self._move_file(name, content.temporary_file_path())
+        return self._stream_file(name, content)
+
+    def _stream_file(self, name, content):
+        directory = self.path(BLOB_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Hashed while streaming into a temp file on the same file system, so the blob
+        # can be moved into place with a rename and the upload is never held in memory.
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                if hasattr(content, 'seek') and content.seekable():
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    temp_file.write(chunk)
+            blob_name = blob_name_for(digest.hexdigest(), name)
+            self._place(temp_path, blob_name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return blob_name, digest.hexdigest(), size
+
+    def _move_file(self, name, source):
+        # Uploads already on disk are hashed in place and moved, not copied. When the
+        # blob exists the source is left for its owner to clean up.
+        digest = hashlib.sha256()
+        size = 0
+        with open(source, 'rb') as source_file:
+            for chunk in iter(lambda: source_file.read(self.HASH_BLOCK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        blob_name = blob_name_for(digest.hexdigest(), name)
+        self._place(source, blob_name)
+        return blob_name, digest.hexdigest(), size
+
+    def _place(self, source, blob_name):
+        blob_path = self.path(blob_name)
+        if os.path.exists(blob_path):
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        file_move_safe(source, blob_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(blob_path, self.file_permissions_mode)
+
+    def delete(self, name):
+        self.release(name)
+
+    def release(self, name):
+        """
+        Drops one reference to `name`. Returns True once the file itself was removed.
+        """
+        if not name:
+            return False
+        with transaction.atomic():
+            if not remove_reference(name):
+                return False
+            # Unlinked before the row's delete commits: a save of the same content either
+            # still finds the row, or creates a new one after the file is gone and writes it.
+            super(ContentAddressedStorage, self).delete(name)
+        return True
+
+
+def blob_name_for(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    return posixpath.join(BLOB_DIRECTORY, digest[:2], digest[2:4], digest + extension)
+
+
+def add_reference(name, digest, size, path):
+    from api.models import MediaBlob
+
+    if MediaBlob.objects.filter(name=name).update(references=F('references') + 1):
+        return
+    # Only a new blob is inspected; later uploads of the same content reuse its row.
+    metadata = extract_metadata(path)
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, hash=digest, size=size, references=1, **metadata)
+            if not os.path.exists(path):
+                raise BlobMissing(name)
+    except IntegrityError:
+        # Another upload of the same content created the row first.
+        MediaBlob.objects.filter(name=name).update(references=F('references') + 1)
+
+
+def remove_reference(name):
+    """
+    Returns True if no reference to `name` is left and its file may be removed.
+    """
+    from api.models import MediaBlob
+
+    with transaction.atomic():
+        if MediaBlob.objects.filter(name=name, references__gt=1).update(references=F('references') - 1):
+            return False
+        MediaBlob.objects.filter(name=name).delete()
+    return True
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,129 @@
+import logging
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.models import Category, Post
+from api.post_cache import post_response_cache
+from api.tests import tests_helper
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+category_base_url = '/api/category/'
+
+
+class CategoryTests(APITestCase):
+
+    def setUp(self):
+        tests_helper.create_fake_admin_user()
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        # tech -> python -> django, tech -> rust, life
+        self.tech = Category.objects.create(name='tech')
+        self.python = Category.objects.create(name='python', parent=self.tech)
+        self.django = Category.objects.create(name='django', parent=self.python)
+        self.rust = Category.objects.create(name='rust', parent=self.tech)
+        self.life = Category.objects.create(name='life')
+
+    def tearDown(self):
+        post_response_cache.clear()
+
+    def test_createCategory_nested_shouldSetPath(self):
+        # Assert
+        self.assertEqual(Category.objects.get(name='django').path, '/tech/python/django/')
+
+    def test_listCategory_subtree_shouldReturnDescendantsInOneQuery(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        with self.assertNumQueries(3):  # session, user, categories
+            actual = self.client.get(category_base_url, {'subtree': 'python'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(category['name'] for category in actual.data['results']), ['django', 'python'])
+
+    def test_ancestors_shouldReturnBreadcrumbRootFirst(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.get(category_base_url + 'django/ancestors/', format='json')
+
+        # Assert
+        self.assertEqual([category['name'] for category in actual.data], ['tech', 'python', 'django'])
+
+    def test_tree_shouldNestAllCategories(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.get(category_base_url + 'tree/', format='json')
+
+        # Assert
+        def names(nodes):
+            return [(node['name'], names(node['children'])) for node in nodes]
+
+        self.assertEqual(names(actual.data), [('life', []), ('tech', [('python', [('django', [])]), ('rust', [])])])
+
+    def test_updateCategory_moveParent_shouldMoveSubtree(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.put(category_base_url + 'python/', {'name': 'python', 'parent': 'life'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(Category.objects.get(name='django').path, '/life/python/django/')
+
+    def test_updateCategory_moveUnderDescendant_shouldReturnBadRequest(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.put(category_base_url + 'python/', {'name': 'python', 'parent': 'django'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleteCategory_shouldRerootChildren(self):
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.delete(category_base_url + 'tech/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Category.objects.get(name='python').path, '/python/')
+        self.assertEqual(Category.objects.get(name='django').path, '/python/django/')
+
+    def test_deleteCategory_pathNotBackfilled_shouldLeaveOtherPaths(self):
+        # Arrange
+        Category.objects.filter(name='life').update(path='')
+
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.delete(category_base_url + 'life/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Category.objects.get(name='django').path, '/tech/python/django/')
+        self.assertEqual(Category.objects.get(name='rust').path, '/tech/rust/')
+
+    def test_updateCategory_pathNotBackfilled_shouldStillCheckParent(self):
+        # Arrange
+        Category.objects.update(path='')
+
+        # Act
+        tests_helper.login_as_admin(self)
+        moved = self.client.put(category_base_url + 'python/', {'name': 'python', 'parent': 'life'}, format='json')
+        cycle = self.client.put(category_base_url + 'tech/', {'name': 'tech', 'parent': 'rust'}, format='json')
+
+        # Assert
+        self.assertEqual(moved.status_code, status.HTTP_200_OK)
+        self.assertEqual(cycle.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listPost_categoryWithDescendants_shouldIncludeSubcategoryPosts(self):
+        # Arrange
+        Post.objects.create(title='in-tech', body='body', owner=self.user1, category=self.tech)
+        Post.objects.create(title='in-django', body='body', owner=self.user1, category=self.django)
+        Post.objects.create(title='in-life', body='body', owner=self.user1, category=self.life)
+
+        # Act
+        direct = self.client.get('/api/post/', {'category': 'tech'}, format='json')
+        nested = self.client.get('/api/post/', {'category': 'tech', 'includeDescendants': 'true'}, format='json')
+
+        # Assert
+        self.assertEqual([post['title'] for post in direct.data['results']], ['in-tech'])
+        self.assertEqual([post['title'] for post in nested.data['results']], ['in-django', 'in-tech'])
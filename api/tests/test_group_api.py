@@ -1,9 +1,12 @@
 import logging
 
+from django.contrib.auth.models import Permission
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from api.models import Group
+from api.backends import snapshot_cache
+from api.group_permissions import is_group_member
+from api.models import Group, User, UserGroup
 from api.tests import tests_helper
 from testing import truth
 
@@ -19,6 +22,9 @@ class GroupTests(APITestCase):
         tests_helper.create_fake_admin_user()
         tests_helper.create_fake_users()
 
+    def tearDown(self):
+        snapshot_cache.clear()
+
     def test_createGroup_admin_shouldCreateGroup(self):
         # Arrange
         data = {'name': 'group-1'}
@@ -137,3 +143,45 @@ class GroupTests(APITestCase):
 
         # assert
         self.assertEqual(actual.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_groupMembership_changed_shouldRefreshSnapshot(self):
+        # Arrange
+        group1, group2 = tests_helper.create_fake_groups()
+        user = User.objects.get(username='user-1')
+        self.assertFalse(is_group_member(user, group1.id))
+
+        # act
+        membership = UserGroup.objects.create(user=user, group=group1)
+        added = User.objects.get(username='user-1')
+        with self.assertNumQueries(2):
+            is_member = is_group_member(added, group1.id)
+        next_request_user = User.objects.get(username='user-1')
+        with self.assertNumQueries(0):
+            is_cached_member = is_group_member(next_request_user, group2.id, group1.id)
+        membership.delete()
+        removed = User.objects.get(username='user-1')
+
+        # assert
+        self.assertTrue(is_member)
+        self.assertTrue(is_cached_member)
+        self.assertFalse(is_group_member(removed, group1.id))
+
+    def test_userPermissions_changed_shouldRefreshSnapshot(self):
+        # Arrange
+        permission = Permission.objects.get(content_type__app_label='api', codename='view_group')
+        user = User.objects.get(username='user-1')
+        self.assertFalse(user.has_perm('api.view_group'))
+
+        # act
+        user.user_permissions.add(permission)
+        granted = User.objects.get(username='user-1')
+        has_perm = granted.has_perm('api.view_group')
+        with self.assertNumQueries(0):
+            has_perms = granted.has_perms(['api.view_group'])
+        permission.user_set.remove(user)
+        revoked = User.objects.get(username='user-1')
+
+        # assert
+        self.assertTrue(has_perm)
+        self.assertTrue(has_perms)
+        self.assertFalse(revoked.has_perm('api.view_group'))
@@ -0,0 +1,298 @@
+import logging
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from PIL import Image as PILImage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api import images
+from api.storage import BlobMissing, add_reference, content_storage
+from api.models import Image, User, MediaBlob
+from api.tests import tests_helper
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+image_base_url = '/api/image/'
+
+TEST_VARIANTS = {
+    'WORKERS': 0,
+    'SIZES': {'thumbnail': [100, 100], 'small': [400, 400]},
+    # The Pillow build used in CI has no WebP encoder.
+    'FORMATS': ['png', 'jpeg'],
+    'QUALITY': 80,
+}
+
+
+class ImageTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS=TEST_VARIANTS)
+        self.settings_override.enable()
+        self.user1, self.user2 = tests_helper.create_fake_users()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_createImage_user_shouldGenerateVariants(self):
+        # Arrange
+        data = {'image': tests_helper.create_fake_image_file(size=(800, 600))}
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.post(image_base_url, data, format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get()
+        self.assertEqual(image.variants_version, images.config_version())
+        with PILImage.open(os.path.join(self.media_root, images.variant_name(image.image.name, 'small', 'png'))) \
+                as small:
+            self.assertEqual(small.size, (400, 300))
+        with PILImage.open(os.path.join(self.media_root, images.variant_name(image.image.name, 'thumbnail', 'jpeg'))) \
+                as thumbnail:
+            self.assertEqual(thumbnail.size, (100, 75))
+
+    def test_retrieveImage_user_shouldReturnVariantUrls(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(), name='photo.png', owner=self.user1)
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.get(image_base_url + str(image.id) + '/', format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(actual.data['variants']), {'thumbnail', 'small'})
+        self.assertEqual(actual.data['variants']['thumbnail']['png'],
+                         '/media/' + images.variant_name(image.image.name, 'thumbnail', 'png'))
+
+    def test_retrieveImage_staleVariants_shouldReturnNullVariants(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(), name='photo.png', owner=self.user1)
+        Image.objects.filter(pk=image.pk).update(variants_version='')
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.get(image_base_url + str(image.id) + '/', format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertIsNone(actual.data['variants'])
+
+    def test_deleteImage_user_shouldDeleteVariants(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(), name='photo.png', owner=self.user1)
+        thumbnail = os.path.join(self.media_root, images.variant_name(image.image.name, 'thumbnail', 'png'))
+        self.assertTrue(os.path.exists(thumbnail))
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.delete(image_base_url + str(image.id) + '/', format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(thumbnail))
+
+    def test_generateImageVariants_staleImages_shouldBackfill(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(), name='photo.png', owner=self.user1)
+        self.user2.profile_pic = tests_helper.create_fake_image_file(name='avatar.png', size=(300, 300))
+        self.user2.save()
+        shutil.rmtree(os.path.join(self.media_root, os.path.dirname(image.image.name), 'variants'))
+        Image.objects.filter(pk=image.pk).update(variants_version='')
+        User.objects.filter(pk=self.user2.pk).update(profile_pic_variants_version='')
+        out = StringIO()
+
+        # Act
+        call_command('generate_image_variants', workers=2, stdout=out)
+
+        # assert
+        self.assertIn('Generated variants for 2 image(s), 0 failed.', out.getvalue())
+        self.assertEqual(Image.objects.get(pk=image.pk).variants_version, images.config_version())
+        self.assertEqual(User.objects.get(pk=self.user2.pk).profile_pic_variants_version, images.config_version())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.media_root, images.variant_name(image.image.name, 'small', 'jpeg'))))
+
+    def test_createImage_sameContentTwice_shouldStoreOneBlob(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        self.client.post(image_base_url, {'image': tests_helper.create_fake_image_file('a.png')}, format='multipart')
+
+        # Act
+        actual = self.client.post(image_base_url, {'image': tests_helper.create_fake_image_file('b.png')},
+                                  format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        first, second = Image.objects.all()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('blobs/'))
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).references, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 2)  # the blob and its variants
+
+    def test_deleteImage_sharedBlob_shouldUnlinkWithLastReference(self):
+        # Arrange
+        first, second = [Image.objects.create(image=tests_helper.create_fake_image_file(name), name=name,
+                                              owner=self.user1) for name in ('a.png', 'b.png')]
+        path = first.image.path
+        thumbnail = os.path.join(self.media_root, images.variant_name(first.image.name, 'thumbnail', 'png'))
+        tests_helper.login_as_user_1(self)
+
+        # Act
+        self.client.delete(image_base_url + str(first.id) + '/', format='json')
+        kept = os.path.exists(path) and os.path.exists(thumbnail)
+        self.client.delete(image_base_url + str(second.id) + '/', format='json')
+
+        # assert
+        self.assertTrue(kept)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumbnail))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_storeBlob_lastReferenceReleasedWhileWriting_shouldWriteItAgain(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file('a.png'), name='a.png', owner=self.user1)
+        upload = tests_helper.create_fake_image_file('b.png')
+        # Written while the blob is still in place, so the file is not moved again.
+        blob = content_storage.write_blob(upload.name, upload)
+        content_storage.release(image.image.name)
+
+        # Act
+        with self.assertRaises(BlobMissing):
+            add_reference(*blob, content_storage.path(blob[0]))
+        name = content_storage.reference_blob(upload.name, upload, blob)
+
+        # Assert
+        self.assertEqual(name, image.image.name)
+        self.assertTrue(os.path.exists(content_storage.path(name)))
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 1)
+
+    def test_createImage_user_shouldReturnStoredMetadata(self):
+        # Arrange
+        data = {'image': tests_helper.create_fake_image_file(size=(800, 600))}
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.post(image_base_url, data, format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        blob = MediaBlob.objects.get()
+        self.assertEqual(actual.data['metadata'], {
+            'hash': blob.hash, 'size': blob.size, 'mime': 'image/png', 'width': 800, 'height': 600,
+            'orientation': 'landscape', 'duration': None,
+        })
+
+    def test_createImage_exifRotated_shouldStoreDisplayedDimensions(self):
+        # Act
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(
+            'photo.jpg', size=(800, 600), exif_orientation=6), name='photo.jpg', owner=self.user1)
+
+        # assert
+        blob = MediaBlob.objects.get(name=image.image.name)
+        self.assertEqual((blob.mime, blob.width, blob.height, blob.orientation), ('image/jpeg', 600, 800, 'portrait'))
+
+    def test_listImage_metadataFilters_shouldQueryWithoutReadingFiles(self):
+        # Arrange
+        sizes = {'wide.png': (800, 600), 'tall.png': (300, 600), 'square.png': (500, 500)}
+        for name, size in sizes.items():
+            Image.objects.create(image=tests_helper.create_fake_image_file(name, size=size), name=name,
+                                 owner=self.user1)
+        shutil.rmtree(os.path.join(self.media_root, 'blobs'))
+        tests_helper.login_as_user_1(self)
+
+        # Act
+        portrait = self.client.get(image_base_url, {'orientation': 'portrait'}, format='json')
+        wide = self.client.get(image_base_url, {'min_width': 400}, format='json')
+        small = self.client.get(image_base_url, {'max_width': 500, 'max_height': 500}, format='json')
+        invalid = self.client.get(image_base_url, {'orientation': 'diagonal'}, format='json')
+
+        # assert
+        self.assertEqual([image['name'] for image in portrait.data['results']], ['tall.png'])
+        self.assertEqual({image['name'] for image in wide.data['results']}, {'wide.png', 'square.png'})
+        self.assertEqual([image['name'] for image in small.data['results']], ['square.png'])
+        self.assertEqual(portrait.data['results'][0]['metadata']['height'], 600)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listImage_metadata_shouldJoinInOneQuery(self):
+        # Arrange
+        for name in ('a.png', 'b.png'):
+            Image.objects.create(image=tests_helper.create_fake_image_file(name, color=(len(name), 0, 0)),
+                                 name=name, owner=self.user1)
+        tests_helper.login_as_user_1(self)
+        self.client.get(image_base_url, format='json')
+
+        # Act
+        with self.assertNumQueries(3):  # session, user and one joined image query
+            actual = self.client.get(image_base_url, {'fields': 'name,metadata'}, format='json')
+
+        # assert
+        self.assertEqual([image['metadata']['width'] for image in actual.data['results']], [800, 800])
+
+    def test_extractMediaMetadata_missingMetadata_shouldBackfill(self):
+        # Arrange
+        image = Image.objects.create(image=tests_helper.create_fake_image_file(), name='photo.png', owner=self.user1)
+        MediaBlob.objects.update(mime='', width=None, height=None, orientation='')
+        out = StringIO()
+
+        # Act
+        call_command('extract_media_metadata', stdout=out)
+
+        # assert
+        self.assertIn('Updated metadata of 1 blob(s), 0 file(s) missing.', out.getvalue())
+        blob = MediaBlob.objects.get(name=image.image.name)
+        self.assertEqual((blob.mime, blob.width, blob.height, blob.orientation), ('image/png', 800, 600, 'landscape'))
+
+    def test_bulkUpload_partialFailure_shouldSaveValidFilesInOneInsert(self):
+        # Arrange
+        files = [tests_helper.create_fake_image_file('{}.png'.format(index), color=(index, 0, 0))
+                 for index in range(3)]
+        files.insert(1, SimpleUploadedFile('notes.png', b'not an image', content_type='image/png'))
+        tests_helper.login_as_user_1(self)
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            actual = self.client.post(image_base_url + 'bulk/', {'images': files}, format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([(result['name'], result['status']) for result in actual.data],
+                         [('0.png', 201), ('notes.png', 400), ('1.png', 201), ('2.png', 201)])
+        self.assertIn('image', actual.data[1]['errors'])
+        self.assertEqual(actual.data[2]['image']['metadata']['width'], 800)
+        self.assertEqual(sorted(Image.objects.values_list('name', flat=True)), ['0.png', '1.png', '2.png'])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "image"')]), 1)
+        image = Image.objects.get(name='2.png')
+        self.assertEqual(image.owner, self.user1)
+        self.assertEqual(image.variants_version, images.config_version())
+
+    def test_bulkUpload_sameContent_shouldShareOneBlob(self):
+        # Arrange
+        files = [tests_helper.create_fake_image_file(name) for name in ('a.png', 'b.png')]
+        tests_helper.login_as_user_1(self)
+
+        # Act
+        actual = self.client.post(image_base_url + 'bulk/', {'images': files}, format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(MediaBlob.objects.get().references, 2)
+
+    def test_bulkUpload_noFiles_shouldReturnBadRequest(self):
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.post(image_base_url + 'bulk/', {}, format='multipart')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,153 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+media_base_url = '/media/'
+
+CONTENT = bytes(range(256)) * 4
+
+
+class MediaTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'blobs', 'ab', 'cd', 'variants'))
+        for name in ('clip.mp4', 'blobs/ab/cd/abcd.mp3', 'blobs/ab/cd/variants/abcd_small.webp'):
+            with open(os.path.join(self.media_root, name), 'wb') as media:
+                media.write(CONTENT)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    @staticmethod
+    def _content(response):
+        content = b''.join(response.streaming_content)
+        response.close()
+        return content
+
+    def test_getMedia_noRange_shouldReturnWholeFile(self):
+        # Act
+        actual = self.client.get(media_base_url + 'clip.mp4')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._content(actual), CONTENT)
+        self.assertEqual(actual['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(actual['Content-Type'], 'video/mp4')
+        self.assertEqual(actual['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', actual)
+        self.assertNotIn('Cache-Control', actual)
+
+    def test_getMedia_singleRange_shouldReturnPartialContent(self):
+        # Act
+        actual = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=100-199')
+        suffix = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=-24')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(self._content(actual), CONTENT[100:200])
+        self.assertEqual(actual['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(actual['Content-Length'], '100')
+        self.assertEqual(self._content(suffix), CONTENT[-24:])
+        self.assertEqual(suffix['Content-Range'], 'bytes 1000-1023/1024')
+
+    def test_getMedia_multipleRanges_shouldReturnMultipart(self):
+        # Act
+        actual = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=0-9, 500-509, 5-14')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(actual['Content-Type'].startswith('multipart/byteranges; boundary='))
+        boundary = actual['Content-Type'].split('boundary=')[1].encode('ascii')
+        body = self._content(actual)
+        self.assertEqual(actual['Content-Length'], str(len(body)))
+        parts = [part for part in body.split(b'--' + boundary) if part.strip(b'\r\n-')]
+        self.assertEqual(len(parts), 2)
+        self.assertIn(b'Content-Range: bytes 0-14/1024', parts[0])
+        self.assertTrue(parts[0].endswith(b'\r\n\r\n' + CONTENT[0:15] + b'\r\n'))
+        self.assertIn(b'Content-Range: bytes 500-509/1024', parts[1])
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + CONTENT[500:510] + b'\r\n'))
+
+    def test_getMedia_unsatisfiableRange_shouldReturn416(self):
+        # Act
+        actual = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=2000-3000')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(actual['Content-Range'], 'bytes */1024')
+
+    def test_getMedia_conditional_shouldReturnNotModified(self):
+        # Arrange
+        first = self.client.get(media_base_url + 'clip.mp4')
+        first.close()
+
+        # Act
+        by_etag = self.client.get(media_base_url + 'clip.mp4', HTTP_IF_NONE_MATCH=first['ETag'])
+        by_date = self.client.get(media_base_url + 'clip.mp4', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        # Assert
+        self.assertEqual(by_etag.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(by_date.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(by_etag['ETag'], first['ETag'])
+
+    def test_getMedia_staleIfRange_shouldReturnWholeFile(self):
+        # Act
+        actual = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        by_date = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=http_date(0))
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._content(actual), CONTENT)
+        self.assertEqual(by_date.status_code, status.HTTP_200_OK)
+        by_date.close()
+
+    def test_getMedia_blob_shouldBeCachedImmutably(self):
+        # Act
+        actual = self.client.get(media_base_url + 'blobs/ab/cd/abcd.mp3')
+        actual.close()
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(actual['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_getMedia_blobVariant_shouldNotBeCachedImmutably(self):
+        # Act
+        actual = self.client.get(media_base_url + 'blobs/ab/cd/variants/abcd_small.webp')
+        actual.close()
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertFalse(actual.has_header('Cache-Control'))
+
+    def test_getMedia_outsideMediaRoot_shouldReturnNotFound(self):
+        # Act
+        traversal = self.client.get(media_base_url + '../settings.py')
+        directory = self.client.get(media_base_url + 'blobs/')
+        missing = self.client.get(media_base_url + 'missing.mp4')
+
+        # Assert
+        self.assertEqual(traversal.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(directory.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_getMedia_accelRedirect_shouldDelegateToServer(self):
+        # Act
+        with override_settings(MEDIA_SERVING={'MODE': 'x-accel-redirect', 'ACCEL_REDIRECT_PREFIX': '/internal/'}):
+            actual = self.client.get(media_base_url + 'clip.mp4', HTTP_RANGE='bytes=0-9')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(actual['X-Accel-Redirect'], '/internal/clip.mp4')
+        self.assertEqual(actual.content, b'')
@@ -0,0 +1,777 @@
+import logging
+from datetime import timedelta
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api import buffers, rendering, rollups, trending
+from api.counters import view_counter, like_counter
+from api.models import Post, BlogVisitLog, Category, PostLike, MediaBlob, PostDailyVisitRollup, \
+    PostReadingStats
+from api.post_cache import post_response_cache
+from api.tests import tests_helper
+from api.visit_logs import visit_log_buffer, heartbeat_buffer, recent_visits
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+post_base_url = '/api/post/'
+
+
+class PostTests(APITestCase):
+
+    def setUp(self):
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        self.post1, self.post2 = tests_helper.create_fake_posts(self.user2)
+
+    def tearDown(self):
+        view_counter.flush()
+        like_counter.flush()
+        visit_log_buffer.flush()
+        heartbeat_buffer.flush()
+        post_response_cache.clear()
+        recent_visits.clear()
+
+    def test_retrievePost_anonymous_shouldCountViewWithoutSavingPost(self):
+        # Arrange
+        last_updated = self.post1.lastUpdatedTimestamp
+
+        # Act
+        first = self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+        second = self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['view'], 1)
+        self.assertEqual(second.data['view'], 2)
+
+        view_counter.flush()
+        post = Post.objects.get(id=self.post1.id)
+        self.assertEqual(post.view, 2)
+        self.assertEqual(post.lastUpdatedTimestamp, last_updated)
+
+    def test_retrievePost_owner_shouldNotCountView(self):
+        # Act
+        self.client.login(username='user-2', password='user-2')
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(actual.data['view'], 0)
+        self.assertNotIn('blog_visit_log', actual.data)
+
+    def test_listPost_pendingViews_shouldIncludePendingDelta(self):
+        # Arrange
+        view_counter.add(self.post1.id, 3)
+
+        # Act
+        actual = self.client.get(post_base_url, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        views = {post['id']: post['view'] for post in actual.data['results']}
+        self.assertEqual(views[self.post1.id], 3)
+        self.assertEqual(views[self.post2.id], 0)
+
+    def test_retrievePost_loggedInUser_shouldReturnQueuedVisitLogId(self):
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        log_id = actual.data['blog_visit_log']
+        self.assertTrue(visit_log_buffer.contains(log_id))
+
+        visit_log_buffer.flush()
+        log = BlogVisitLog.objects.get(id=log_id)
+        self.assertEqual(log.post_id, self.post1.id)
+        self.assertEqual(log.user_id, self.user1.user_id)
+
+    def test_updateVisitLog_queuedLog_shouldFlushAndUpdate(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        log_id = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+
+        # Act
+        actual = self.client.put('/api/blog_visit_log/' + str(log_id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertFalse(visit_log_buffer.contains(log_id))
+        self.assertTrue(BlogVisitLog.objects.filter(id=log_id).exists())
+
+    def test_updateVisitLog_heartbeats_shouldCoalesceIntoOneUpdate(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        log_id = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+        visit_log_buffer.flush()
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                last = self.client.put('/api/blog_visit_log/' + str(log_id) + '/', format='json')
+            heartbeat_buffer.flush()
+
+        # Assert
+        self.assertEqual(last.status_code, status.HTTP_200_OK)
+        logs = [query['sql'] for query in queries.captured_queries if '"api_blogvisitlog"' in query['sql']]
+        # The ownership check on the first heartbeat and the previous end times read by the flush.
+        self.assertEqual(len([sql for sql in logs if sql.startswith('SELECT')]), 2)
+        self.assertEqual(len([sql for sql in logs if sql.startswith('UPDATE')]), 1)
+        self.assertEqual(BlogVisitLog.objects.get(id=log_id).end_time.isoformat().replace('+00:00', 'Z'),
+                         last.data['end_time'])
+
+    def test_updateVisitLog_otherUsersSession_shouldBeForbidden(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        log_id = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+        self.client.put('/api/blog_visit_log/' + str(log_id) + '/', format='json')
+
+        # Act
+        self.client.force_authenticate(self.user2)
+        actual = self.client.put('/api/blog_visit_log/' + str(log_id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_updateVisitLog_closed_shouldFlushImmediately(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        log_id = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+        self.client.put('/api/blog_visit_log/' + str(log_id) + '/', format='json')
+
+        # Act
+        actual = self.client.put('/api/blog_visit_log/' + str(log_id) + '/', {'closed': True}, format='json')
+        invalid = self.client.put('/api/blog_visit_log/' + str(log_id) + '/', {'closed': 'maybe'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(heartbeat_buffer), 0)
+        self.assertIsNone(heartbeat_buffer.session(log_id))
+        self.assertEqual(BlogVisitLog.objects.get(id=log_id).end_time.isoformat().replace('+00:00', 'Z'),
+                         actual.data['end_time'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listVisitLog_warmHistory_shouldServeRingWithoutQueryingLogs(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        self.client.get('/api/blog_visit_log/', format='json')
+        first = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+        second = self.client.get(post_base_url + str(self.post2.id) + '/', format='json').data['blog_visit_log']
+        beat = self.client.put('/api/blog_visit_log/' + str(first) + '/', format='json')
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            actual = self.client.get('/api/blog_visit_log/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries.captured_queries if '"api_blogvisitlog"' in query['sql']])
+        self.assertEqual([(log['id'], log['post']) for log in actual.data],
+                         [(str(second), self.post2.id), (str(first), self.post1.id)])
+        self.assertEqual(actual.data[1]['end_time'], beat.data['end_time'])
+
+    @override_settings(CACHES_IN_PROCESS={'RECENT_VISITS': {'LENGTH': 2}})
+    def test_listVisitLog_coldHistory_shouldLoadLatestFromDatabase(self):
+        # Arrange
+        now = timezone.now()
+        for minutes in (30, 10, 20):
+            BlogVisitLog.objects.create(post=self.post1, user=self.user1, start_time=now - timedelta(minutes=minutes))
+        tests_helper.login_as_user_1(self)
+
+        # Act
+        cold = self.client.get('/api/blog_visit_log/', format='json')
+        self.client.get(post_base_url + str(self.post2.id) + '/', format='json')
+        warm = self.client.get('/api/blog_visit_log/', format='json')
+
+        # Assert
+        self.assertEqual([log['start_time'] for log in cold.data],
+                         [(now - timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z')
+                          for minutes in (10, 20)])
+        self.assertEqual([log['post'] for log in warm.data], [self.post2.id, self.post1.id])
+
+    def test_listPost_pageSize_shouldWalkPagesWithoutDuplicates(self):
+        # Arrange
+        for i in range(3, 8):
+            Post.objects.create(title='post-%d' % i, body='body', owner=self.user2)
+
+        # Act
+        first = self.client.get(post_base_url, {'page_size': 3}, format='json')
+        Post.objects.create(title='inserted', body='body', owner=self.user2)
+        second = self.client.get(first.data['next'], format='json')
+
+        # Assert
+        self.assertEqual([post['title'] for post in first.data['results']], ['post-7', 'post-6', 'post-5'])
+        self.assertEqual([post['title'] for post in second.data['results']], ['post-4', 'post-3', 'post-2'])
+        self.assertIsNotNone(second.data['next'])
+
+        previous = self.client.get(second.data['previous'], format='json')
+        self.assertEqual([post['title'] for post in previous.data['results']], ['post-7', 'post-6', 'post-5'])
+
+    def test_listPost_orderByWithFilter_shouldPageInOrder(self):
+        # Arrange
+        for i in range(3, 6):
+            Post.objects.create(title='post-%d' % i, body='body', owner=self.user1)
+
+        # Act
+        first = self.client.get(post_base_url, {'page_size': 2, 'orderBy': 'title', 'author': 'user-1'},
+                                format='json')
+        second = self.client.get(first.data['next'], format='json')
+
+        # Assert
+        self.assertEqual([post['title'] for post in first.data['results']], ['post-3', 'post-4'])
+        self.assertEqual([post['title'] for post in second.data['results']], ['post-5'])
+        self.assertIsNone(second.data['next'])
+
+    def test_listPost_invalidOrderBy_shouldReturnBadRequest(self):
+        # Act
+        actual = self.client.get(post_base_url, {'orderBy': 'description'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listPost_invalidCursor_shouldReturnNotFound(self):
+        # Act
+        actual = self.client.get(post_base_url, {'cursor': 'not-a-cursor'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_listPost_cursorOfAnotherOrderBy_shouldReturnNotFound(self):
+        # Arrange
+        for i in range(3):
+            Post.objects.create(title='post-%d' % i, body='body', owner=self.user1)
+        first = self.client.get(post_base_url, {'page_size': 1, 'orderBy': 'title'}, format='json')
+        cursor = parse_qs(urlparse(first.data['next']).query)['cursor'][0]
+
+        # Act
+        actual = self.client.get(post_base_url, {'orderBy': 'view', 'cursor': cursor}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_listPost_search_shouldRankTitleMatchesFirst(self):
+        # Arrange
+        Post.objects.create(title='cooking', body='a note about django templates', owner=self.user1)
+        Post.objects.create(title='django tips', body='body', owner=self.user1)
+
+        # Act
+        actual = self.client.get(post_base_url, {'search': 'django'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['title'] for post in actual.data['results']], ['django tips', 'cooking'])
+        self.assertIn('<mark>django</mark>', actual.data['results'][1]['snippet'])
+
+    def test_listPost_searchMarkupInBody_shouldEscapeSnippet(self):
+        # Arrange
+        Post.objects.create(title='title', body='findme <img src=x onerror=alert(1)> text', owner=self.user1)
+
+        # Act
+        actual = self.client.get(post_base_url, {'search': 'findme'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.data['results'][0]['snippet'],
+                         '<mark>findme</mark> &lt;img src=x onerror=alert(1)&gt; text')
+
+    def test_listPost_searchPrefix_shouldMatchDescriptionAndBody(self):
+        # Act
+        actual = self.client.get(post_base_url, {'search': 'descrip*'}, format='json')
+
+        # Assert
+        self.assertEqual(len(actual.data['results']), 2)
+
+    def test_listPost_searchAfterUpdateAndDelete_shouldFollowChanges(self):
+        # Arrange
+        self.post1.title = 'renamed'
+        self.post1.save()
+        self.post2.delete()
+
+        # Act
+        old = self.client.get(post_base_url, {'search': 'post'}, format='json')
+        new = self.client.get(post_base_url, {'search': 'renamed'}, format='json')
+
+        # Assert
+        self.assertEqual(len(old.data['results']), 0)
+        self.assertEqual([post['id'] for post in new.data['results']], [self.post1.id])
+
+    def test_listPost_searchPaged_shouldSeekOnRank(self):
+        # Act
+        first = self.client.get(post_base_url, {'search': 'body', 'page_size': 1}, format='json')
+        second = self.client.get(first.data['next'], format='json')
+
+        # Assert
+        self.assertEqual(len(first.data['results']), 1)
+        self.assertEqual(len(second.data['results']), 1)
+        self.assertNotEqual(first.data['results'][0]['id'], second.data['results'][0]['id'])
+        self.assertIsNone(second.data['next'])
+
+    def test_retrievePost_cached_shouldServeWithoutQueriesAndKeepCounting(self):
+        # Arrange
+        url = post_base_url + str(self.post1.id) + '/'
+        self.client.get(url, format='json')
+        view_counter.flush()
+
+        # Act
+        with self.assertNumQueries(0):
+            actual = self.client.get(url, format='json')
+
+        # Assert
+        self.assertEqual(actual.data['view'], 2)
+        self.assertEqual(post_response_cache.stats()['hits'], 1)
+        view_counter.flush()
+        self.assertEqual(self.client.get(url, format='json').data['view'], 3)
+
+    def test_retrievePost_cachedLoggedInUser_shouldStillLogVisit(self):
+        # Arrange
+        url = post_base_url + str(self.post1.id) + '/'
+        self.client.get(url, format='json')
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.get(url, format='json')
+
+        # Assert
+        self.assertIn('blog_visit_log', actual.data)
+        visit_log_buffer.flush()
+        self.assertEqual(BlogVisitLog.objects.filter(post=self.post1).count(), 1)
+
+    def test_listPost_afterPostUpdate_shouldInvalidate(self):
+        # Arrange
+        self.client.get(post_base_url, format='json')
+        self.post1.title = 'updated'
+        self.post1.save()
+
+        # Act
+        actual = self.client.get(post_base_url, format='json')
+
+        # Assert
+        self.assertIn('updated', [post['title'] for post in actual.data['results']])
+
+    def test_listPost_afterCategoryDelete_shouldInvalidate(self):
+        # Arrange
+        category = Category.objects.create(name='category-1')
+        Post.objects.filter(id=self.post1.id).update(category=category)
+        post_response_cache.clear()
+        self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+
+        # Act
+        category.delete()
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+
+        # Assert
+        self.assertIsNone(actual.data['category'])
+
+    def test_listPost_fields_shouldReturnOnlyRequestedFields(self):
+        # Act
+        with self.assertNumQueries(1):
+            actual = self.client.get(post_base_url, {'fields': 'title,view'}, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(actual.data['results'][0], {'id': self.post2.id, 'title': 'post-2', 'view': 0})
+
+    def test_listPost_expand_shouldInlineOwnerAndCategoryInOneQuery(self):
+        # Arrange
+        category = Category.objects.create(name='category-1')
+        for post in Post.objects.all():
+            post.category = category
+            post.save()
+
+        # Act
+        with self.assertNumQueries(1):
+            actual = self.client.get(post_base_url, {'expand': 'owner,category'}, format='json')
+
+        # Assert
+        post = actual.data['results'][0]
+        self.assertEqual(post['owner']['username'], 'user-2')
+        self.assertNotIn('email', post['owner'])
+        self.assertEqual(post['category']['name'], 'category-1')
+
+    def test_retrievePost_fieldsAndExpand_shouldCombine(self):
+        # Act
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/', {'fields': 'owner', 'expand': 'owner'},
+                                 format='json')
+
+        # Assert
+        self.assertEqual(set(actual.data.keys()), {'id', 'owner'})
+        self.assertEqual(actual.data['owner']['user_id'], str(self.user2.user_id))
+
+    def test_createPost_markdownBody_shouldStoreSanitizedHtml(self):
+        # Arrange
+        data = {'title': 'markdown', 'body': '# Title\n\n*hi* <script>alert(1)</script> [x](javascript:alert(1))'}
+
+        # Act
+        tests_helper.login_as_user_1(self)
+        actual = self.client.post(post_base_url, data, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(actual.data['body_html'], '<h1>Title</h1>\n<p><em>hi</em>  <a>x</a></p>')
+        self.assertNotIn('body_html_version', actual.data)
+
+    def test_sanitizeHtml_controlCharactersInScheme_shouldDropUrl(self):
+        # Arrange
+        html = '<a href="\x01javascript:alert(1)">a</a><a href="java\tscript:alert(1)">b</a>' \
+               '<img src=" \x1fjavascript:x">'
+
+        # Act
+        actual = rendering.sanitize_html(html)
+
+        # Assert
+        self.assertEqual(actual, '<a>a</a><a>b</a><img>')
+
+    def test_renderMarkdownCommand_configChanged_shouldRenderStalePosts(self):
+        # Arrange
+        Post.objects.filter(id=self.post1.id).update(body='**bold**', body_html='', body_html_version='stale')
+
+        # Act
+        call_command('render_markdown', workers=2, stdout=StringIO())
+
+        # Assert
+        post = Post.objects.get(id=self.post1.id)
+        self.assertEqual(post.body_html, '<p><strong>bold</strong></p>')
+        self.assertEqual(post.body_html_version, rendering.config_version())
+
+    def test_listPost_orderByTrending_shouldPreferRecentActivity(self):
+        # Arrange
+        now = timezone.now()
+        view_counter.add(self.post1.id, 100)
+        view_counter.flush()
+        trending.refresh_trending(now - timedelta(days=7))
+        view_counter.add(self.post2.id, 20)
+        view_counter.flush()
+        trending.refresh_trending(now)
+
+        # Act
+        actual = self.client.get(post_base_url, {'orderBy': 'trending'}, format='json')
+
+        # Assert
+        self.assertEqual([post['id'] for post in actual.data['results']], [self.post2.id, self.post1.id])
+
+    def test_refreshTrending_readingTime_shouldCountOnlyNewDwell(self):
+        # Arrange
+        now = timezone.now()
+        log = BlogVisitLog.objects.create(post=self.post1, user=self.user1, start_time=now - timedelta(minutes=10))
+        BlogVisitLog.objects.filter(id=log.id).update(end_time=now - timedelta(minutes=5))
+        trending.refresh_trending(now - timedelta(minutes=5) + trending.dwell_lag())
+        score = Post.objects.get(id=self.post1.id).trending_score
+
+        # Act
+        updated = trending.refresh_trending(now)
+
+        # Assert
+        self.assertGreater(score, 0)
+        self.assertEqual(updated, 0)
+        self.assertEqual(Post.objects.get(id=self.post1.id).trending_score, score)
+
+    def test_refreshTrending_flushedViews_shouldScoreOnlyDirtyPosts(self):
+        # Arrange
+        view_counter.add(self.post1.id, 3)
+        view_counter.flush()
+
+        # Act
+        updated = trending.refresh_trending()
+
+        # Assert
+        self.assertEqual(updated, 1)
+        post = Post.objects.get(id=self.post1.id)
+        self.assertGreater(post.trending_score, 0)
+        self.assertFalse(post.trending_dirty)
+        self.assertEqual(post.trending_view_base, post.view)
+
+    def test_refreshTrending_sessionResumedBeforeWatermark_shouldCountWholeGap(self):
+        # Arrange
+        now = timezone.now()
+        config = trending.trending_config()
+        log = BlogVisitLog.objects.create(post=self.post1, user=self.user1, start_time=now - timedelta(minutes=10))
+        BlogVisitLog.objects.filter(id=log.id).update(end_time=now - timedelta(minutes=8))
+        trending.refresh_trending(now - timedelta(minutes=5) + trending.dwell_lag())
+        score = Post.objects.get(id=self.post1.id).trending_score
+        BlogVisitLog.objects.filter(id=log.id).update(end_time=now - timedelta(minutes=1))
+
+        # Act
+        trending.refresh_trending(now + trending.dwell_lag())
+
+        # Assert
+        weight = config['DWELL_WEIGHT_PER_MINUTE'] * 7
+        expected = trending.log_add(score, trending.contribution(weight, now + trending.dwell_lag(), config))
+        self.assertAlmostEqual(Post.objects.get(id=self.post1.id).trending_score, expected)
+
+    def test_refreshTrending_endTimeWrittenLate_shouldStillCountDwell(self):
+        # Arrange
+        now = timezone.now()
+        trending.refresh_trending(now)
+        # A heartbeat from just before the run, flushed by another process after it.
+        BlogVisitLog.objects.create(post=self.post1, user=self.user1, start_time=now - timedelta(minutes=5),
+                                    end_time=now - timedelta(seconds=1))
+
+        # Act
+        updated = trending.refresh_trending(now + timedelta(minutes=1))
+
+        # Assert
+        self.assertEqual(updated, 1)
+        self.assertGreater(Post.objects.get(id=self.post1.id).trending_score, 0)
+
+    @override_settings(VISIT_LOG_ROLLUP={'RETENTION_DAYS': 30, 'DELETE_CHUNK_SIZE': 1})
+    def test_rollupVisitLogs_oldLogs_shouldCompactAndKeepVisitsReadable(self):
+        # Arrange
+        now = timezone.now()
+        old_day, recent_day = (now - timedelta(days=40)).date(), (now - timedelta(days=1)).date()
+        old = rollups.day_start(old_day) + timedelta(hours=10)
+        for user, dwell in ((self.user1, 10), (self.user1, 30), (self.user2, 60)):
+            BlogVisitLog.objects.create(post=self.post1, user=user, start_time=old,
+                                        end_time=old + timedelta(seconds=dwell))
+        recent = rollups.day_start(recent_day) + timedelta(hours=10)
+        BlogVisitLog.objects.create(post=self.post1, user=self.user1, start_time=recent,
+                                    end_time=recent + timedelta(seconds=5))
+
+        # Act
+        first = rollups.rollup_visit_logs(now)
+        second = rollups.rollup_visit_logs(now)
+        self.client.force_authenticate(self.user2)
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/visits/', format='json')
+
+        # Assert
+        self.assertEqual((first, second), ((1, 3), (0, 0)))
+        self.assertEqual(BlogVisitLog.objects.count(), 1)
+        rollup = PostDailyVisitRollup.objects.get(post=self.post1)
+        self.assertEqual((rollup.day, rollup.views, rollup.unique_users, rollup.total_dwell, rollup.median_dwell),
+                         (old_day, 3, 2, 100.0, 30.0))
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual([(day['day'], day['views'], day['total_dwell']) for day in actual.data],
+                         [(old_day, 3, 100.0), (recent_day, 1, 5.0)])
+
+    def test_postVisits_notOwnerOrInvalidSince_shouldBeRejected(self):
+        # Act
+        tests_helper.login_as_user_1(self)
+        forbidden = self.client.get(post_base_url + str(self.post1.id) + '/visits/', format='json')
+        self.client.force_authenticate(self.user2)
+        invalid = self.client.get(post_base_url + str(self.post1.id) + '/visits/', {'since': '2021-13-01'},
+                                  format='json')
+
+        # Assert
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('since', invalid.data)
+
+    def test_postAnalytics_visitsAndHeartbeat_shouldServeIncrementalTotals(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        log_id = self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['blog_visit_log']
+        self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+        visit_log_buffer.flush()
+        started = timezone.now() - timedelta(seconds=60)
+        BlogVisitLog.objects.filter(id=log_id).update(start_time=started, end_time=started)
+
+        # Act
+        self.client.put('/api/blog_visit_log/' + str(log_id) + '/', {'closed': True}, format='json')
+        self.client.force_authenticate(self.user2)
+        actual = self.client.get(post_base_url + str(self.post1.id) + '/analytics/', {'bucket': 'month'},
+                                 format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual((actual.data['views'], actual.data['readers']), (2, 1))
+        self.assertGreaterEqual(actual.data['read_seconds'], 60)
+        self.assertEqual(actual.data['average_read_seconds'], actual.data['read_seconds'] / 2)
+        self.assertEqual([(row['views'], row['new_readers']) for row in actual.data['series']], [(2, 1)])
+        self.assertEqual(actual.data['series'][0]['period'], timezone.now().date().replace(day=1))
+        self.assertEqual(PostReadingStats.objects.get(post=self.post1).views, 2)
+
+    def test_postAnalytics_notOwnerOrInvalidBucket_shouldBeRejected(self):
+        # Act
+        tests_helper.login_as_user_1(self)
+        forbidden = self.client.get(post_base_url + str(self.post1.id) + '/analytics/', format='json')
+        self.client.force_authenticate(self.user2)
+        invalid = self.client.get(post_base_url + str(self.post1.id) + '/analytics/', {'bucket': 'hour'},
+                                  format='json')
+
+        # Assert
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bucket', invalid.data)
+
+    def test_likePost_twice_shouldCountOnce(self):
+        # Act
+        tests_helper.login_as_user_1(self)
+        first = self.client.post(post_base_url + str(self.post1.id) + '/like/', format='json')
+        second = self.client.post(post_base_url + str(self.post1.id) + '/like/', format='json')
+
+        # Assert
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, {'like': 1, 'liked': True})
+        self.assertEqual(second.data, {'like': 1, 'liked': True})
+        like_counter.flush()
+        self.assertEqual(Post.objects.get(id=self.post1.id).like, 1)
+        self.assertEqual(PostLike.objects.filter(post=self.post1).count(), 1)
+
+    def test_unlikePost_liked_shouldDecrement(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        self.client.post(post_base_url + str(self.post1.id) + '/like/', format='json')
+        like_counter.flush()
+
+        # Act
+        actual = self.client.post(post_base_url + str(self.post1.id) + '/unlike/', format='json')
+        again = self.client.post(post_base_url + str(self.post1.id) + '/unlike/', format='json')
+
+        # Assert
+        self.assertEqual(actual.data, {'like': 0, 'liked': False})
+        self.assertEqual(again.data, {'like': 0, 'liked': False})
+        self.assertEqual(self.client.get(post_base_url + str(self.post1.id) + '/', format='json').data['like'], 0)
+
+    def test_likePost_anonymous_shouldReturnUnauthorized(self):
+        # Act
+        actual = self.client.post(post_base_url + str(self.post1.id) + '/like/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deletePost_sharedVideo_shouldKeepFileUntilLastReference(self):
+        # Arrange
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            first, second = [Post.objects.create(title=title, body='body', owner=self.user1,
+                                                 video=SimpleUploadedFile('clip.mp4', b'same video bytes'))
+                             for title in ('first', 'second')]
+            path = first.video.path
+
+            # Act
+            tests_helper.login_as_user_1(self)
+            self.client.delete(post_base_url + str(first.id) + '/', format='json')
+            kept = os.path.exists(path)
+            references = MediaBlob.objects.get(name=second.video.name).references
+            self.client.delete(post_base_url + str(second.id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(first.video.name, second.video.name)
+        self.assertTrue(kept)
+        self.assertEqual(references, 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_updatePost_replacedAudio_shouldReleaseOldFile(self):
+        # Arrange
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            post = Post.objects.create(title='audio', body='body', owner=self.user1,
+                                       audio=SimpleUploadedFile('old.mp3', b'old audio'))
+            old_path = post.audio.path
+
+            # Act
+            post.audio = SimpleUploadedFile('new.mp3', b'new audio')
+            post.save()
+
+        # Assert
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(list(MediaBlob.objects.values_list('name', flat=True)), [post.audio.name])
+
+    def test_createPost_truncatedMp4_shouldStoreWithoutMetadata(self):
+        # Arrange
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        tests_helper.login_as_user_1(self)
+        data = {'title': 'broken', 'body': 'body', 'video': SimpleUploadedFile('x.mp4', b'\x00\x00\x00\x08mvhd')}
+
+        # Act
+        with override_settings(MEDIA_ROOT=media_root):
+            actual = self.client.post(post_base_url, data, format='multipart')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((actual.data['video_metadata']['mime'], actual.data['video_metadata']['duration']),
+                         ('video/mp4', None))
+
+    def test_retrievePost_media_shouldReturnStoredMetadata(self):
+        # Arrange
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            post = Post.objects.create(title='media', body='body', owner=self.user1,
+                                       video=tests_helper.create_fake_mp4_file(seconds=3, size=(1280, 720)),
+                                       audio=tests_helper.create_fake_wav_file(seconds=2))
+
+            # Act
+            actual = self.client.get(post_base_url + str(post.id) + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        video, audio = actual.data['video_metadata'], actual.data['audio_metadata']
+        self.assertEqual((video['mime'], video['width'], video['height'], video['orientation'], video['duration']),
+                         ('video/mp4', 1280, 720, 'landscape', 3.0))
+        self.assertEqual((audio['mime'], audio['duration'], audio['width']), ('audio/wav', 2.0, None))
+        self.assertIsNone(self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+                          .data['video_metadata'])
+
+
+class VisitLogBufferTests(APITransactionTestCase):
+    # SQLite checks foreign keys when the transaction commits, which APITestCase never does.
+
+    def setUp(self):
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        self.post1, self.post2 = tests_helper.create_fake_posts(self.user2)
+
+    def tearDown(self):
+        view_counter.flush()
+        visit_log_buffer.flush()
+        post_response_cache.clear()
+        recent_visits.clear()
+
+    def test_flushVisitLogs_postDeletedWhileQueued_shouldDropItsLogAndInsertTheRest(self):
+        # Arrange
+        tests_helper.login_as_user_1(self)
+        self.client.get(post_base_url + str(self.post1.id) + '/', format='json')
+        self.client.force_authenticate(self.user2)
+        self.client.delete(post_base_url + str(self.post1.id) + '/', format='json')
+        self.client.force_authenticate(self.user1)
+        log_id = self.client.get(post_base_url + str(self.post2.id) + '/', format='json').data['blog_visit_log']
+
+        # Act
+        visit_log_buffer.flush()
+
+        # Assert
+        self.assertEqual(len(visit_log_buffer), 0)
+        self.assertEqual(list(BlogVisitLog.objects.values_list('id', flat=True)), [log_id])
+        self.assertEqual(PostReadingStats.objects.get(post=self.post2).views, 1)
+        self.assertFalse(PostReadingStats.objects.filter(post_id=self.post1.id).exists())
+
+
+class WriteBehindFlusherTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        self.post1, self.post2 = tests_helper.create_fake_posts(self.user1)
+
+    def tearDown(self):
+        buffers.stop_flusher()
+        view_counter.flush()
+
+    @override_settings(WRITE_BEHIND={'VIEW_COUNTER': {'FLUSH_INTERVAL': 0.1}})
+    def test_flusher_idleWorker_shouldWriteBufferedViews(self):
+        # Arrange
+        buffers.start_flusher()
+
+        # Act
+        view_counter.add(self.post1.id, 3)
+        deadline = time.monotonic() + 5
+        while Post.objects.get(id=self.post1.id).view != 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        # Assert
+        self.assertEqual(len(view_counter), 0)
+        self.assertEqual(Post.objects.get(id=self.post1.id).view, 3)
@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APITestCase
+
+from api.models import Post
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+
+class QueryPlanAuditTests(APITestCase):
+
+    def test_auditQueryPlans_committedBaseline_shouldFindNoNewScans(self):
+        # Arrange
+        out = StringIO()
+
+        # Act
+        call_command('audit_query_plans', stdout=out)
+
+        # Assert
+        self.assertIn('No new full scans or temp sorts', out.getvalue())
+        self.assertNotIn('No longer seen', out.getvalue())
+        self.assertFalse(Post.objects.exists())
+
+    def test_auditQueryPlans_emptyBaseline_shouldFailOnAcceptedScans(self):
+        # Arrange
+        descriptor, baseline = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, baseline)
+        with os.fdopen(descriptor, 'w') as baseline_file:
+            json.dump({}, baseline_file)
+
+        # Act
+        with self.assertRaises(CommandError) as raised:
+            call_command('audit_query_plans', baseline=baseline, stdout=StringIO())
+
+        # Assert
+        self.assertIn('post list orderBy=title: temp B-tree for order by', str(raised.exception))
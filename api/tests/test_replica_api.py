@@ -0,0 +1,81 @@
+import logging
+
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase, APIClient
+
+from api.authentication import principal_cache
+from api.db_router import ReplicaRouter
+from api.models import Post, User
+from api.post_cache import post_response_cache
+from api.tests import tests_helper
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+post_base_url = '/api/post/'
+
+ROUTING = {'REPLICAS': ['replica'], 'STICKY_SECONDS': 5, 'COOKIE_NAME': 'read_primary'}
+
+
+@override_settings(DATABASE_ROUTING=ROUTING)
+class ReplicaRoutingTests(APITransactionTestCase):
+    # 'replica' is a separate SQLite file that nothing replicates into, so the rows a
+    # response contains show which database served it.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        replica_owner = User.objects.using('replica').create(username='replica-user', email='replica@test.com')
+        Post.objects.using('replica').create(title='only on replica', body='body', owner=replica_owner,
+                                             is_public=True)
+
+    def tearDown(self):
+        post_response_cache.clear()
+        principal_cache.clear()
+
+    def _titles(self, response):
+        return [post['title'] for post in response.data['results']]
+
+    def test_listPost_safeRequest_shouldReadFromReplica(self):
+        # Act
+        with CaptureQueriesContext(connections['default']) as primary:
+            actual = self.client.get(post_base_url, format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._titles(actual), ['only on replica'])
+        self.assertEqual(len(primary), 0)
+
+    def test_createPost_thenList_shouldReadOwnWriteFromPrimary(self):
+        # Arrange
+        self.client.force_authenticate(self.user1)
+        other_client = APIClient()
+        other_client.force_authenticate(self.user2)
+
+        # Act
+        created = self.client.post(post_base_url, {'title': 'new post', 'body': 'body', 'is_public': True},
+                                   format='json')
+        own = self.client.get(post_base_url, format='json')
+        post_response_cache.clear()
+        other = other_client.get(post_base_url, format='json')
+
+        # Assert
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(created.cookies['read_primary']['max-age'], 5)
+        self.assertEqual(self._titles(own), ['new post'])
+        self.assertEqual(self._titles(other), ['only on replica'])
+        self.assertFalse(Post.objects.using('replica').filter(title='new post').exists())
+
+    def test_router_outsideRequest_shouldUsePrimary(self):
+        # Arrange
+        router = ReplicaRouter()
+
+        # Act
+        read, write = router.db_for_read(Post), router.db_for_write(Post)
+
+        # Assert
+        self.assertEqual((read, write), (None, None))
+        self.assertEqual(Post.objects.filter(title='only on replica').count(), 0)
@@ -0,0 +1,244 @@
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, OperationalError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
+
+from api import uploads
+from api.models import Post, UploadSession, MediaBlob
+from api.tests import tests_helper
+
+logger = logging.getLogger('django_test')
+logger.info('Unit test logger enabled.')
+
+upload_base_url = '/api/upload/'
+
+CONTENT = bytes(range(256)) * 40
+
+
+class UploadTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                                   RESUMABLE_UPLOADS={'BLOCK_SIZE': 1000})
+        self.settings_override.enable()
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        self.post1, self.post2 = tests_helper.create_fake_posts(self.user1)
+        tests_helper.login_as_user_1(self)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _create_session(self, post=None, size=len(CONTENT), filename='clip.mp4'):
+        data = {'post': (post or self.post1).id, 'field': 'video', 'filename': filename, 'size': size}
+        return self.client.post(upload_base_url, data, format='json')
+
+    def _put(self, session_id, start, end, body=None):
+        return self.client.put(upload_base_url + session_id + '/', CONTENT[start:end] if body is None else body,
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(start, end - 1, len(CONTENT)))
+
+    def test_createUpload_ownPost_shouldAllocateFile(self):
+        # Act
+        actual = self._create_session()
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(actual.data['missing'], [[0, len(CONTENT)]])
+        session = UploadSession.objects.get()
+        self.assertEqual(os.path.getsize(uploads.upload_path(session)), len(CONTENT))
+
+    def test_createUpload_otherUsersPost_shouldReturnBadRequest(self):
+        # Arrange
+        other_post, _ = tests_helper.create_fake_posts(self.user2)
+
+        # Act
+        actual = self._create_session(post=other_post)
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_createUpload_filenameWithoutExtension_shouldReturnBadRequest(self):
+        # Act
+        actual = [self._create_session(filename=filename) for filename in ('clip', 'videos/clip.mp4', '.mp4')]
+
+        # Assert
+        self.assertEqual([response.status_code for response in actual], [status.HTTP_400_BAD_REQUEST] * 3)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_uploadChunks_outOfOrder_shouldAssembleAndAttach(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+
+        # Act
+        for start, end in ((6000, len(CONTENT)), (2500, 6000), (0, 2500)):
+            self.assertEqual(self._put(session_id, start, end).status_code, status.HTTP_200_OK)
+        actual = self.client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        post = Post.objects.get(pk=self.post1.pk)
+        self.assertTrue(post.video.name.startswith('blobs/'))
+        with post.video.open('rb') as video:
+            self.assertEqual(video.read(), CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [])
+
+    def test_finalizeUpload_replacingVideo_shouldReleasePreviousFile(self):
+        # Arrange
+        self.post1.video = SimpleUploadedFile('old.mp4', b'old video')
+        self.post1.save()
+        previous = self.post1.video.name
+        session_id = self._create_session().data['id']
+        self._put(session_id, 0, len(CONTENT))
+
+        # Act
+        actual = self.client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(Post.objects.get(pk=self.post1.pk).video.name, previous)
+        self.assertFalse(MediaBlob.objects.filter(name=previous).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, previous)))
+
+    def test_finalizeUpload_concurrentFinalize_shouldAttachOnce(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+        self._put(session_id, 0, len(CONTENT))
+        # The second request loaded the session before the first one removed it.
+        session = UploadSession.objects.get(pk=session_id)
+
+        # Act
+        actual = self.client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        with self.assertRaises(uploads.ChunkError):
+            uploads.attach(session)
+        with Post.objects.get(pk=self.post1.pk).video.open('rb') as video:
+            self.assertEqual(video.read(), CONTENT)
+
+    def test_uploadChunk_interrupted_shouldResumeFromReceivedBytes(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+
+        # Act
+        interrupted = self._put(session_id, 0, 5000, body=CONTENT[:3200])
+        progress = self.client.get(upload_base_url + session_id + '/', format='json')
+        start = progress.data['missing'][0][0]
+        resumed = self._put(session_id, start, len(CONTENT))
+        actual = self.client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual(interrupted.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(progress.data['received'], [[0, 3200]])
+        self.assertEqual(resumed.data['missing'], [])
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        with Post.objects.get(pk=self.post1.pk).video.open('rb') as video:
+            self.assertEqual(video.read(), CONTENT)
+
+    def test_finalizeUpload_missingChunks_shouldReturnConflict(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+        self._put(session_id, 0, 1000)
+
+        # Act
+        actual = self.client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(actual.data['missing'], [[1000, len(CONTENT)]])
+
+    def test_uploadChunk_badContentRange_shouldReturnBadRequest(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+
+        # Act
+        actual = self.client.put(upload_base_url + session_id + '/', CONTENT[:10],
+                                 content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-9/5')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieveUpload_otherUser_shouldReturnNotFound(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+
+        # Act
+        self.client.logout()
+        self.client.login(username='user-2', password='user-2')
+        actual = self.client.get(upload_base_url + session_id + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleteUpload_owner_shouldRemovePartialFile(self):
+        # Arrange
+        session_id = self._create_session().data['id']
+        path = uploads.upload_path(UploadSession.objects.get())
+
+        # Act
+        actual = self.client.delete(upload_base_url + session_id + '/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(path))
+
+
+class ParallelUploadTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user1, self.user2 = tests_helper.create_fake_users()
+        self.post1, self.post2 = tests_helper.create_fake_posts(self.user1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_uploadChunks_parallel_shouldAssembleAndAttach(self):
+        # Arrange
+        client = APIClient()
+        client.login(username='user-1', password='user-1')
+        data = {'post': self.post1.id, 'field': 'audio', 'filename': 'track.mp3', 'size': len(CONTENT)}
+        session_id = client.post(upload_base_url, data, format='json').data['id']
+        chunk = 1024
+        ranges = [(start, min(start + chunk, len(CONTENT))) for start in range(0, len(CONTENT), chunk)]
+
+        def put(byte_range):
+            start, end = byte_range
+            worker = APIClient()
+            worker.force_authenticate(self.user1)
+            try:
+                # Chunks are idempotent, so a client simply retries one that failed. Here that
+                # covers the test database's shared in-memory SQLite locking whole tables.
+                for _ in range(20):
+                    try:
+                        return worker.put(upload_base_url + session_id + '/', CONTENT[start:end],
+                                          content_type='application/octet-stream',
+                                          HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(start, end - 1, len(CONTENT)))
+                    except OperationalError:
+                        continue
+            finally:
+                connection.close()
+
+        # Act
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(put, ranges))
+        actual = client.post(upload_base_url + session_id + '/finalize/', format='json')
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * len(ranges))
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        with Post.objects.get(pk=self.post1.pk).audio.open('rb') as audio:
+            self.assertEqual(audio.read(), CONTENT)
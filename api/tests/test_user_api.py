@@ -1,9 +1,13 @@
 import logging
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from api.models import User
+from api.authentication import principal_cache
+from api.logins import last_login_buffer
+from api.models import User, UserGroup, Post, BlogVisitLog, AuthorReadingStats
 from api.tests import tests_helper
 from testing import truth
 
@@ -15,6 +19,10 @@ user_base_url = '/api/user/'
 
 class UserTests(APITestCase):
 
+    def tearDown(self):
+        principal_cache.clear()
+        last_login_buffer.flush()
+
     def test_createUser_anonymous_shouldCreateUser(self):
         # Arrange
         data = {'username': 'username',
@@ -45,18 +53,19 @@ class UserTests(APITestCase):
 
         # assert
         self.assertEqual(actual.status_code, status.HTTP_200_OK)
-        expected = [{"user_id": "#####", "profile_pic": "/media/default_profile.jpeg",
+        expected = {"next": None, "previous": None, "results": [
+                    {"user_id": "#####", "profile_pic": "/media/default_profile.jpeg", "profile_pic_variants": None,
                      "username": "user-2", "email": "user-2@gmail.com", "last_login": "#####", "is_superuser": False,
                      "first_name": "fname-2", "last_name": "lname-2", "is_staff": False, "is_active": True,
                      "date_joined": "#####", "user_permissions": [], "groups": []},
-                    {"user_id": "#####", "profile_pic": "/media/default_profile.jpeg",
+                    {"user_id": "#####", "profile_pic": "/media/default_profile.jpeg", "profile_pic_variants": None,
                      "username": "user-1", "email": "user-1@gmail.com", "last_login": "#####", "is_superuser": False,
                      "first_name": "fname-1", "last_name": "lname-1", "is_staff": False, "is_active": True,
                      "date_joined": "#####", "user_permissions": [], "groups": []},
-                    {"user_id": "#####", "profile_pic": "/media/default_profile.jpeg",
+                    {"user_id": "#####", "profile_pic": "/media/default_profile.jpeg", "profile_pic_variants": None,
                      "username": "fake-admin", "email": "", "last_login": "#####", "is_superuser": True,
                      "first_name": "", "last_name": "", "is_staff": True, "is_active": True,
-                     "date_joined": "#####", "user_permissions": [], "groups": []}]
+                     "date_joined": "#####", "user_permissions": [], "groups": []}]}
         truth.assert_that_ignore_fields(self,
                                         actual,
                                         expected,
@@ -95,6 +104,7 @@ class UserTests(APITestCase):
 
         # Assert
         expected = {"user_id": str(user2.user_id), "profile_pic": "/media/default_profile.jpeg",
+                    "profile_pic_variants": None,
                     "username": "user-2", "email": "user-2@gmail.com", "last_login": "#####", "is_superuser": False,
                     "first_name": "fname-2", "last_name": "lname-2", "is_staff": False, "is_active": True,
                     "date_joined": "#####", "user_permissions": [], "groups": []}
@@ -240,3 +250,126 @@ class UserTests(APITestCase):
 
         # assert
         self.assertEqual(actual.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_listUser_admin_fieldsAndExpandGroups_shouldPrefetchGroups(self):
+        # Arrange
+        tests_helper.create_fake_admin_user()
+        user1, user2 = tests_helper.create_fake_users()
+        group1, group2 = tests_helper.create_fake_groups()
+        UserGroup.objects.create(user=user1, group=group1)
+
+        # Act
+        tests_helper.login_as_admin(self)
+        actual = self.client.get(user_base_url, {'fields': 'username,groups', 'expand': 'groups'}, format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        users = {user['username']: user for user in actual.data['results']}
+        self.assertEqual(set(users['user-1'].keys()), {'user_id', 'username', 'groups'})
+        self.assertEqual(users['user-1']['groups'], [{'id': group1.id, 'name': 'group-1'}])
+        self.assertEqual(users['user-2']['groups'], [])
+
+    def test_retrieveUser_token_shouldNotQueryUserTwice(self):
+        # Arrange
+        user1, user2 = tests_helper.create_fake_users()
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        url = user_base_url + str(user1.user_id) + "/"
+        self.client.get(url, format='json')
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            actual = self.client.get(url, format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual(actual.data['username'], 'user-1')
+        # Only the retrieve itself reads the user row; authentication is served from the cache.
+        user_selects = [query for query in queries.captured_queries if query['sql'].startswith('SELECT "user".')]
+        self.assertEqual(len(user_selects), 1)
+
+    def test_deleteUser_token_shouldRejectCachedUser(self):
+        # Arrange
+        user1, user2 = tests_helper.create_fake_users()
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        url = user_base_url + str(user1.user_id) + "/"
+        self.client.get(url, format='json')
+
+        # Act
+        deleted = self.client.delete(url, format='json')
+        actual = self.client.get(url, format='json')
+
+        # assert
+        self.assertEqual(deleted.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(actual.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updateUser_adminRevokesStaff_shouldRefreshCachedUser(self):
+        # Arrange
+        tests_helper.create_fake_admin_user()
+        user1, user2 = tests_helper.create_fake_users()
+        user1.is_staff = True
+        user1.save()
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        self.assertEqual(self.client.get(user_base_url, format='json').status_code, status.HTTP_200_OK)
+
+        # Act
+        user1.is_staff = False
+        user1.save()
+        actual = self.client.get(user_base_url, format='json')
+
+        # assert
+        self.assertEqual(actual.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_obtainToken_user_shouldDeferLastLogin(self):
+        # Arrange
+        user1, user2 = tests_helper.create_fake_users()
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            actual = tests_helper.login_with_token(self, 'user-1', 'user-1')
+        pending = User.objects.get(user_id=user1.user_id).last_login
+
+        # assert
+        self.assertEqual(actual['user_id'], user1.user_id)
+        self.assertIn('refresh', actual)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertIsNone(pending)
+        self.assertIsNotNone(last_login_buffer.pending(user1.user_id))
+
+    def test_obtainToken_manyUsers_shouldFlushLastLoginInOneUpdate(self):
+        # Arrange
+        user1, user2 = tests_helper.create_fake_users()
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        tests_helper.login_with_token(self, 'user-2', 'user-2')
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        expected = last_login_buffer.pending(user1.user_id)
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            last_login_buffer.flush()
+
+        # assert
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith('UPDATE "user" SET "last_login" = CASE'))
+        self.assertEqual(User.objects.get(user_id=user1.user_id).last_login, expected)
+        self.assertIsNotNone(User.objects.get(user_id=user2.user_id).last_login)
+
+    def test_userAnalytics_readerOfSeveralPosts_shouldCountOnce(self):
+        # Arrange
+        user1, user2 = tests_helper.create_fake_users()
+        post1, post2 = tests_helper.create_fake_posts(user2)
+        other = Post.objects.create(title='other', body='body', owner=user1)
+        for post in (post1, post2, post2, other):
+            BlogVisitLog.objects.create(post=post, user=user1)
+
+        # Act
+        tests_helper.login_with_token(self, 'user-2', 'user-2')
+        actual = self.client.get(user_base_url + str(user2.user_id) + '/analytics/', format='json')
+        forbidden = self.client.get(user_base_url + str(user1.user_id) + '/analytics/', format='json')
+
+        # Assert
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertEqual((actual.data['views'], actual.data['readers']), (3, 1))
+        self.assertEqual([(row['views'], row['new_readers']) for row in actual.data['series']], [(3, 1)])
+        self.assertEqual(AuthorReadingStats.objects.get(author=user2).readers, 1)
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
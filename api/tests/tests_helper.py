@@ -1,6 +1,12 @@
+import struct
+import wave
+from io import BytesIO
+
+from PIL import Image as PILImage
 from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
 
-from api.models import User, Group
+from api.models import User, Group, Post
 
 fake_admin_username = 'fake-admin'
 fake_admin_password = 'fake-admin'
@@ -14,6 +20,12 @@ def login_as_user_1(test_case):
     test_case.client.login(username='user-1', password='user-1')
 
 
+def login_with_token(test_case, username, password):
+    response = test_case.client.post('/auth/token/', {'username': username, 'password': password}, format='json')
+    test_case.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['access'])
+    return response.data
+
+
 def create_fake_admin_user():
     User.objects.create_superuser(username=fake_admin_username, password=fake_admin_password)
 
@@ -36,3 +48,47 @@ def create_fake_groups():
     group1 = Group.objects.create(name='group-1')
     group2 = Group.objects.create(name='group-2')
     return group1, group2
+
+
+def create_fake_posts(owner):
+    post1 = Post.objects.create(title='post-1', description='description-1', body='body-1', owner=owner,
+                                is_public=True)
+    post2 = Post.objects.create(title='post-2', description='description-2', body='body-2', owner=owner,
+                                is_public=True)
+    return post1, post2
+
+
+def create_fake_image_file(name='photo.png', size=(800, 600), color=(200, 40, 40), exif_orientation=None):
+    content = BytesIO()
+    image = PILImage.new('RGB', size, color)
+    if exif_orientation is None:
+        image.save(content, format='PNG')
+        return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+    exif = PILImage.Exif()
+    exif[0x0112] = exif_orientation
+    image.save(content, format='JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/jpeg')
+
+
+def create_fake_wav_file(name='track.wav', seconds=2, rate=8000):
+    content = BytesIO()
+    with wave.open(content, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(1)
+        audio.setframerate(rate)
+        audio.writeframes(b'\x80' * (seconds * rate))
+    return SimpleUploadedFile(name, content.getvalue(), content_type='audio/wav')
+
+
+def create_fake_mp4_file(name='clip.mp4', seconds=3, size=(1280, 720)):
+    """
+    Just the boxes a player reads first: ftyp, then moov with mvhd and one track's tkhd.
+    """
+    def box(kind, payload):
+        return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+    mvhd = box(b'mvhd', struct.pack('>B3xIIII', 0, 0, 0, 1000, seconds * 1000) + b'\x00' * 80)
+    tkhd = box(b'tkhd', struct.pack('>B3x', 0) + b'\x00' * 72 + struct.pack('>II', size[0] << 16, size[1] << 16))
+    content = box(b'ftyp', b'isom\x00\x00\x02\x00') + box(b'moov', mvhd + box(b'trak', tkhd)) + \
+        box(b'mdat', b'\x00' * 64)
+    return SimpleUploadedFile(name, content, content_type='video/mp4')
@@ -0,0 +1,117 @@
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api import buffers
+from api.models import Post, BlogVisitLog, JobWatermark
+from api.visit_logs import visit_log_buffer, heartbeat_buffer
+
+DEFAULTS = {
+    'HALF_LIFE_HOURS': 24.0,
+    'VIEW_WEIGHT': 1.0,
+    'LIKE_WEIGHT': 5.0,
+    'DWELL_WEIGHT_PER_MINUTE': 0.5,
+}
+
+WATERMARK = 'trending'
+
+# Scores are stored as log(sum(weight * exp(decay * (t - EPOCH)))). Ordering by that
+# equals ordering by the decayed score at any moment, so only posts with new activity
+# need rewriting and old scores never have to be decayed in place.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def trending_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TRENDING', {}))
+    return config
+
+
+def log_add(a, b):
+    if a > b:
+        a, b = b, a
+    return b + math.log1p(math.exp(a - b))
+
+
+def contribution(weight, at, config):
+    decay = math.log(2) / config['HALF_LIFE_HOURS']
+    hours = (at - EPOCH).total_seconds() / 3600.0
+    return math.log(weight) + decay * hours
+
+
+def dwell_lag():
+    """
+    How long a visit log's end_time can sit in another process's write-behind buffers
+    before it reaches the database: its flush interval plus a tick of the flusher thread.
+    """
+    interval = max(buffer.config()['FLUSH_INTERVAL'] for buffer in (visit_log_buffer, heartbeat_buffer))
+    return timedelta(seconds=interval + buffers.flush_tick())
+
+
+def refresh_trending(now=None):
+    """
+    Folds activity since the last run into `Post.trending_score`: new views and likes
+    of posts marked dirty (counter minus the stored base) and reading time from visit
+    logs whose end_time moved past the watermark, counted from where the last run left
+    each log. The watermark trails `now` by `dwell_lag()`, so end times written late by
+    the buffers still land after it. Returns the number of posts updated.
+    """
+    now = now or timezone.now()
+    config = trending_config()
+    watermark = JobWatermark.objects.filter(name=WATERMARK).first()
+    since = watermark.value if watermark else None
+    until = now - dwell_lag()
+    if since is not None and until < since:
+        until = since
+    visit_log_buffer.flush()
+    heartbeat_buffer.flush()
+
+    weights = {}
+    posts = {}
+    logs = BlogVisitLog.objects.filter(end_time__lte=until)
+    if since is not None:
+        logs = logs.filter(end_time__gt=since)
+
+    # Logs are read and marked counted in the transaction that stores the scores.
+    with transaction.atomic():
+        changed = Post.objects.filter(trending_dirty=True) \
+            .only('id', 'view', 'like', 'trending_score', 'trending_view_base', 'trending_like_base')
+        for post in changed:
+            posts[post.pk] = post
+            weights[post.pk] = config['VIEW_WEIGHT'] * max(0, post.view - post.trending_view_base) + \
+                config['LIKE_WEIGHT'] * max(0, post.like - post.trending_like_base)
+
+        for post_id, start_time, end_time, counted in logs.values_list(
+                'post_id', 'start_time', 'end_time', 'trending_counted_until').iterator():
+            # Only the part of the session earlier runs did not count, so heartbeats are not counted twice.
+            seconds = (end_time - max(start_time, counted or start_time)).total_seconds()
+            if seconds > 0:
+                weights[post_id] = weights.get(post_id, 0.0) + config['DWELL_WEIGHT_PER_MINUTE'] * seconds / 60.0
+
+        missing = set(weights) - set(posts)
+        for post in Post.objects.filter(pk__in=missing) \
+                .only('id', 'view', 'like', 'trending_score', 'trending_view_base', 'trending_like_base'):
+            posts[post.pk] = post
+
+        updated = []
+        for pk, post in posts.items():
+            weight = weights.get(pk, 0.0)
+            if weight > 0:
+                score = contribution(weight, now, config)
+                post.trending_score = log_add(post.trending_score, score) if post.trending_score else score
+            post.trending_view_base = post.view
+            post.trending_like_base = post.like
+            updated.append(post)
+
+        Post.objects.bulk_update(updated, ['trending_score', 'trending_view_base', 'trending_like_base'],
+                                 batch_size=500)
+        # A counter flushed since the read leaves its post dirty for the next run.
+        Post.objects.filter(pk__in=list(posts), view=F('trending_view_base'), like=F('trending_like_base')) \
+            .update(trending_dirty=False)
+        logs.update(trending_counted_until=F('end_time'))
+        JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': until})
+    return len(updated)
@@ -0,0 +1,150 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+
+DEFAULT_UPLOADS = {
+    # Relative to MEDIA_ROOT, so finished files can be moved into storage with a rename.
+    'DIRECTORY': 'uploads',
+    'MAX_SIZE': 4 * 1024 ** 3,
+    # Bytes read from the request and written per pwrite call.
+    'BLOCK_SIZE': 1024 * 1024,
+}
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class ChunkError(Exception):
+    pass
+
+
+class PartialFile(File):
+    """
+    A finished upload on local disk. Exposing `temporary_file_path` lets the storage
+    move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_config():
+    config = dict(DEFAULT_UPLOADS)
+    config.update(getattr(settings, 'RESUMABLE_UPLOADS', {}))
+    return config
+
+
+def upload_path(session):
+    return os.path.join(settings.MEDIA_ROOT, upload_config()['DIRECTORY'], '{}.part'.format(session.pk))
+
+
+def create_upload_file(session):
+    path = upload_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as upload:
+        # Sparse on most file systems; chunks are written into place in any order.
+        upload.truncate(session.size)
+
+
+def remove_upload_file(session):
+    try:
+        os.remove(upload_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def parse_content_range(header, size):
+    """
+    Parses `bytes <first>-<last>/<total>` into a half-open [start, end) range.
+    """
+    match = CONTENT_RANGE.match((header or '').strip())
+    if match is None:
+        raise ChunkError('Content-Range must look like "bytes <first>-<last>/<total>".')
+    start, last, total = match.groups()
+    start, end = int(start), int(last) + 1
+    if total != '*' and int(total) != size:
+        raise ChunkError('Content-Range total does not match the upload size {}.'.format(size))
+    if start >= end or end > size:
+        raise ChunkError('Content-Range is outside the upload.')
+    return start, end
+
+
+def write_chunk(session, start, end, stream):
+    """
+    Copies `end - start` bytes from `stream` into the upload file at `start`, one block at
+    a time. Returns the end of what was written, which is short of `end` if the body was.
+    """
+    block_size = upload_config()['BLOCK_SIZE']
+    offset = start
+    descriptor = os.open(upload_path(session), os.O_WRONLY)
+    try:
+        while offset < end:
+            data = stream.read(min(block_size, end - offset)) if stream is not None else b''
+            if not data:
+                break
+            os.pwrite(descriptor, data, offset)
+            offset += len(data)
+    finally:
+        os.close(descriptor)
+    return offset
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(received, size):
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def received_ranges(session):
+    return merge_ranges(session.chunks.values_list('start', 'end'))
+
+
+def attach(session):
+    """
+    Saves the finished upload as the post's file and removes the session. The upload
+    file is claimed with a rename first, so of two concurrent calls only one attaches
+    it and the other raises ChunkError.
+    """
+    from api.signals import release_media
+
+    path = upload_path(session)
+    claimed = path + '.finalizing'
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        raise ChunkError('The upload is already being finalized.')
+
+    post = session.post
+    media = getattr(post, session.field)
+    previous = media.name
+    try:
+        with open(claimed, 'rb') as upload:
+            media.save(session.filename, PartialFile(upload), save=False)
+    except Exception:
+        # Hand the file back so finalize can be retried.
+        if os.path.exists(claimed):
+            os.rename(claimed, path)
+        raise
+    post.save(update_fields=[session.field, 'lastUpdatedTimestamp'])
+    if previous and previous != media.name:
+        # save() above commits the file, so the pre_save signal does not see the replaced one.
+        release_media(type(post), session.field, previous)
+    session.delete()
+    return post
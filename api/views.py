@@ -1,21 +1,70 @@
 import logging
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction, IntegrityError
 from django.utils import timezone
-from rest_framework import viewsets, status
+from django.utils.dateparse import parse_date
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAdminUser, AllowAny, SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from api.group_permissions import IsOwnerOrReadOnly, IsUserSelfOrAdmin, IsUserSelf
-from api.models import User, Post, Image, Group, Category, BlogVisitLog
+from api import analytics, bulk_images, categories, rollups, search, uploads
+from api.counters import view_counter, like_counter
+from api.group_permissions import IsOwnerOrReadOnly, IsOwnerOrAdmin, IsUserSelfOrAdmin, IsUserSelf
+from api.models import User, Post, Image, Group, Category, BlogVisitLog, MediaBlob, PostLike, UploadSession, \
+    UploadChunk
+from api.pagination import KeysetPagination
+from api.post_cache import post_response_cache, cache_key, cache_posts
 from api.serializers import GroupSerializer, PostSerializer, \
     TokenObtainPairPatchedSerializer, UserSerializer, UserAdminSerializer, UserUpdateSerializer, ImageSerializer, \
-    CategorySerializer, BlogVisitLogSerializer
+    CategorySerializer, BlogVisitLogSerializer, UploadSessionSerializer
+from api.visit_logs import visit_log_buffer, heartbeat_buffer, recent_visits
 
 logger = logging.getLogger(__name__)
 
 
+def get_field_options(request):
+    """
+    Parses the comma separated `fields` and `expand` query parameters into serializer kwargs.
+    """
+    options = {}
+    for name in ('fields', 'expand'):
+        value = request.query_params.get(name, '')
+        options[name] = [item.strip() for item in value.split(',') if item.strip()] or None
+    return options
+
+
+def get_since(request):
+    """
+    Parses the optional `since` query parameter of the analytics actions into a date.
+    """
+    since = request.query_params.get('since')
+    if since is None:
+        return None
+    try:
+        since = parse_date(since)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ValidationError({'since': ['Expected a date in YYYY-MM-DD format.']})
+    return since
+
+
+def get_analytics(request, target, report):
+    bucket = request.query_params.get('bucket', 'day')
+    if bucket not in analytics.BUCKETS:
+        raise ValidationError({'bucket': ['Must be one of {}.'.format(', '.join(analytics.BUCKETS))]})
+    return Response(report(target, bucket=bucket, since=get_since(request)))
+
+
+def ordering_columns(ordering):
+    return tuple(field.lstrip('-') for field in ordering)
+
+
 class UserViewSet(viewsets.ViewSet):
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
@@ -24,8 +73,12 @@ class UserViewSet(viewsets.ViewSet):
         return super(UserViewSet, self).dispatch(request, *args, **kwargs)
 
     def list(self, request):
-        serializer = self.serializer_class(self.queryset.all(), many=True)
-        return Response(serializer.data)
+        options = get_field_options(request)
+        paginator = KeysetPagination(('-date_joined', '-pk'))
+        queryset = self.serializer_class.optimize_queryset(self.queryset.all(), required=('date_joined',), **options)
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = self.serializer_class(page, many=True, **options)
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -36,8 +89,10 @@ class UserViewSet(viewsets.ViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def retrieve(self, request, pk=None):
-        user = get_object_or_404(self.queryset.all(), pk=pk)
-        serializer = self.serializer_class(user)
+        options = get_field_options(request)
+        queryset = self.serializer_class.optimize_queryset(self.queryset.all(), **options)
+        user = get_object_or_404(queryset, pk=pk)
+        serializer = self.serializer_class(user, **options)
         return Response(serializer.data)
 
     def update(self, request, pk=None):
@@ -60,6 +115,12 @@ class UserViewSet(viewsets.ViewSet):
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True)
+    def analytics(self, request, pk=None):
+        user = get_object_or_404(self.queryset.only('user_id'), pk=pk)
+        self.check_object_permissions(self.request, user)
+        return get_analytics(request, user.pk, analytics.author_analytics)
+
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
@@ -144,16 +205,21 @@ class CategoryViewSet(viewsets.ViewSet):
     def get_queryset(self):
         queryset = Category.objects.all()
         parent = self.request.query_params.get('parent', None)
+        subtree = self.request.query_params.get('subtree', None)
         if parent:
             if parent == 'root':
                 queryset = queryset.filter(parent=None)
             else:
                 queryset = queryset.filter(parent=parent)
+        if subtree:
+            queryset = queryset.filter(categories.subtree_filter(subtree))
         return queryset
 
     def list(self, request):
-        serializer = self.serializer_class(self.get_queryset().all(), many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(('pk',))
+        page = paginator.paginate_queryset(self.get_queryset(), request)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -168,8 +234,20 @@ class CategoryViewSet(viewsets.ViewSet):
         serializer = self.serializer_class(group)
         return Response(serializer.data)
 
+    @action(detail=False)
+    def tree(self, request):
+        queryset = self.get_queryset().order_by('path')
+        return Response(categories.build_tree(queryset, lambda category: dict(self.serializer_class(category).data)))
+
+    @action(detail=True)
+    def ancestors(self, request, pk=None):
+        serializer = self.serializer_class(categories.ancestors(pk), many=True)
+        if not serializer.data:
+            raise NotFound()
+        return Response(serializer.data)
+
     def update(self, request, pk=None):
-        serializer = self.serializer_class(self.get_queryset().get(id=pk), data=request.data)
+        serializer = self.serializer_class(get_object_or_404(self.get_queryset().all(), pk=pk), data=request.data)
         if serializer.is_valid(raise_exception=True):
             serializer.save()
         else:
@@ -203,20 +281,52 @@ class PostViewSet(viewsets.ViewSet):
         author = self.request.query_params.get('author', None)
         title = self.request.query_params.get('title', None)
         category = self.request.query_params.get('category', None)
-        order_by = self.request.query_params.get('orderBy', None)
+        search_query = self.request.query_params.get('search', None)
         if author:
             queryset = queryset.filter(owner__username__contains=author)
         if title:
             queryset = queryset.filter(title__contains=title)
         if category:
-            queryset = queryset.filter(category=category)
-        if order_by:
-            queryset = queryset.order_by(order_by)
+            if self.request.query_params.get('includeDescendants', '').lower() == 'true':
+                queryset = queryset.filter(categories.subtree_filter(category, prefix='category__'))
+            else:
+                queryset = queryset.filter(category=category)
+        if search_query:
+            queryset = search.search(queryset, search_query)
         return queryset
 
+    def get_ordering(self):
+        order_by = self.request.query_params.get('orderBy', None)
+        if not order_by:
+            if self.request.query_params.get('search', None):
+                return 'search_rank', 'pk'
+            return '-createdTimestamp', '-pk'
+        if order_by == 'trending':
+            return '-trending_score', '-pk'
+
+        try:
+            field = Post._meta.get_field(order_by.lstrip('-'))
+        except FieldDoesNotExist:
+            field = None
+        # Keyset pagination needs a concrete, non-null column to seek on.
+        if field is None or not field.concrete or field.null:
+            raise ValidationError({'orderBy': ['Cannot order by "{}".'.format(order_by)]})
+        return order_by, '-pk' if order_by.startswith('-') else 'pk'
+
     def list(self, request):
-        serializer = self.serializer_class(self.get_queryset().all(), many=True)
-        return Response(serializer.data)
+        key = cache_key('list', request)
+        cached = post_response_cache.get(key)
+        if cached is None:
+            options = get_field_options(request)
+            ordering = self.get_ordering()
+            paginator = KeysetPagination(ordering)
+            queryset = self.serializer_class.optimize_queryset(
+                self.get_queryset(), required=ordering_columns(ordering) + ('owner', 'category'), **options)
+            page = paginator.paginate_queryset(queryset, request)
+            serializer = self.serializer_class(page, many=True, **options)
+            cached = cache_posts(key, request, paginator.get_paginated_response(serializer.data).data, page,
+                                 many=True)
+        return Response(cached.render())
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -227,22 +337,61 @@ class PostViewSet(viewsets.ViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def retrieve(self, request, pk=None):
-        post = get_object_or_404(self.get_queryset().all(), pk=pk)
+        key = cache_key('retrieve', request, pk)
+        cached = post_response_cache.get(key)
+        if cached is None:
+            options = get_field_options(request)
+            queryset = self.serializer_class.optimize_queryset(
+                self.get_queryset(), required=('owner', 'category'), **options)
+            post = get_object_or_404(queryset, pk=pk)
+            cached = cache_posts(key, request, self.serializer_class(post, **options).data, [post],
+                                 owner_id=post.owner_id)
+
+        post_id = cached.data['id']
         blog_visit_log = None
-        if post.owner != self.request.user:
-            post.view = post.view + 1
-            post.save()
+        if cached.owner_id != self.request.user.pk:
+            view_counter.add(post_id)
             if not self.request.user.is_anonymous:
-                blog_visit_log = BlogVisitLog.objects.create(post=post, user=self.request.user)
-
-        post_serializer = self.serializer_class(post)
+                blog_visit_log = visit_log_buffer.add(BlogVisitLog(post_id=post_id, user=self.request.user))
+                recent_visits.add(blog_visit_log)
 
-        data = {}
-        data.update(post_serializer.data)
+        data = cached.render()
         if blog_visit_log:
             data['blog_visit_log'] = blog_visit_log.id
         return Response(data)
 
+    @action(detail=True, methods=['post'])
+    def like(self, request, pk=None):
+        post = get_object_or_404(Post.objects.only('id', 'like'), pk=pk)
+        try:
+            with transaction.atomic():
+                PostLike.objects.create(post=post, user=request.user)
+        except IntegrityError:
+            pass
+        else:
+            like_counter.add(post.pk)
+        return Response({'like': post.like + like_counter.pending(post.pk), 'liked': True})
+
+    @action(detail=True, methods=['post'])
+    def unlike(self, request, pk=None):
+        post = get_object_or_404(Post.objects.only('id', 'like'), pk=pk)
+        deleted, _ = PostLike.objects.filter(post=post, user=request.user).delete()
+        if deleted:
+            like_counter.add(post.pk, -1)
+        return Response({'like': post.like + like_counter.pending(post.pk), 'liked': False})
+
+    @action(detail=True)
+    def visits(self, request, pk=None):
+        post = get_object_or_404(Post.objects.only('id', 'owner_id'), pk=pk)
+        self.check_object_permissions(request, post)
+        return Response(rollups.daily_visits(post.pk, since=get_since(request)))
+
+    @action(detail=True)
+    def analytics(self, request, pk=None):
+        post = get_object_or_404(Post.objects.only('id', 'owner_id'), pk=pk)
+        self.check_object_permissions(request, post)
+        return get_analytics(request, post.pk, analytics.post_analytics)
+
     def update(self, request, pk=None):
         serializer = self.serializer_class(self.get_queryset().get(id=pk), data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -262,9 +411,11 @@ class PostViewSet(viewsets.ViewSet):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.request.method in SAFE_METHODS:
+        if self.action in ('visits', 'analytics'):
+            permission_classes = [IsOwnerOrAdmin]
+        elif self.request.method in SAFE_METHODS:
             permission_classes = [AllowAny]
-        elif self.action == 'create':
+        elif self.action in ('create', 'like', 'unlike'):
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsOwnerOrReadOnly]
@@ -279,23 +430,79 @@ class ImageViewSet(viewsets.ViewSet):
     def dispatch(self, request, *args, **kwargs):
         return super(ImageViewSet, self).dispatch(request, *args, **kwargs)
 
+    # Query parameter -> MediaBlob lookup. Metadata is stored at upload, so no file is opened.
+    metadata_filters = {
+        'min_width': 'blob__width__gte',
+        'max_width': 'blob__width__lte',
+        'min_height': 'blob__height__gte',
+        'max_height': 'blob__height__lte',
+        'min_size': 'blob__size__gte',
+        'max_size': 'blob__size__lte',
+    }
+
+    def get_queryset(self):
+        queryset = self.queryset.all().filter(owner=self.request.user)
+        orientation = self.request.query_params.get('orientation', None)
+        if orientation:
+            if orientation not in dict(MediaBlob.ORIENTATION_CHOICES):
+                raise ValidationError({'orientation': ['Must be one of landscape, portrait or square.']})
+            queryset = queryset.filter(blob__orientation=orientation)
+        for name, lookup in self.metadata_filters.items():
+            value = self.request.query_params.get(name, None)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({name: ['A non-negative integer is required.']})
+                queryset = queryset.filter(**{lookup: int(value)})
+        return queryset
+
     def list(self, request):
-        serializer = self.serializer_class(self.queryset.all().filter(owner=request.user), many=True)
-        return Response(serializer.data)
+        options = get_field_options(request)
+        paginator = KeysetPagination(('-createdTimestamp', '-pk'))
+        queryset = self.serializer_class.optimize_queryset(
+            self.get_queryset(), required=('createdTimestamp',), **options)
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = self.serializer_class(page, many=True, **options)
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            image = serializer.save(owner=request.user)
-            image.name = self.request.FILES['image'].name
-            image.save()
+            # A second full save would overwrite the variants version stamped after the first.
+            serializer.save(owner=request.user, name=self.request.FILES['image'].name)
         else:
             logger.error(serializer.errors)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        files = request.FILES.getlist('images')
+        if not files:
+            raise ValidationError({'images': ['No files were submitted.']})
+        max_files = bulk_images.bulk_config()['MAX_FILES']
+        if len(files) > max_files:
+            raise ValidationError({'images': ['At most {} files can be uploaded at once.'.format(max_files)]})
+
+        results = bulk_images.store_images(files, request.user)
+        saved = [result.image.pk for result in results if result.image is not None]
+        queryset = self.serializer_class.optimize_queryset(self.queryset.filter(pk__in=saved))
+        serialized = {image['id']: image for image in self.serializer_class(queryset, many=True).data}
+
+        data = []
+        for result in results:
+            if result.image is None:
+                data.append({'name': result.name, 'status': status.HTTP_400_BAD_REQUEST, 'errors': result.errors})
+            else:
+                data.append({'name': result.name, 'status': status.HTTP_201_CREATED,
+                             'image': serialized[str(result.image.pk)]})
+        # Some files failing does not fail the others; 207 tells the client to read each status.
+        return Response(data, status=status.HTTP_201_CREATED if len(saved) == len(results) else
+                        status.HTTP_207_MULTI_STATUS)
+
     def retrieve(self, request, pk=None):
-        image = get_object_or_404(self.queryset.all(), pk=pk)
-        serializer = self.serializer_class(image)
+        options = get_field_options(request)
+        queryset = self.serializer_class.optimize_queryset(self.queryset.all(), required=('owner',), **options)
+        image = get_object_or_404(queryset, pk=pk)
+        serializer = self.serializer_class(image, **options)
         return Response(serializer.data)
 
     def update(self, request, pk=None):
@@ -309,7 +516,7 @@ class ImageViewSet(viewsets.ViewSet):
 
     def destroy(self, request, pk=None):
         image = get_object_or_404(self.queryset.all(), pk=pk)
-        image.image.delete()
+        # The file and its variants are released by the post_delete signal.
         image.delete()
 
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -323,6 +530,73 @@ class ImageViewSet(viewsets.ViewSet):
         return [permission() for permission in permission_classes]
 
 
+class UploadSessionViewSet(viewsets.ViewSet):
+    """
+    Resumable uploads of a post's video or audio: create a session, PUT byte ranges with
+    a Content-Range header in any order or in parallel, then finalize.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def dispatch(self, request, *args, **kwargs):
+        return super(UploadSessionViewSet, self).dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def create(self, request):
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save(owner=request.user)
+        uploads.create_upload_file(session)
+        return Response(self.serializer_class(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        return Response(self.serializer_class(session).data)
+
+    def update(self, request, pk=None):
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        try:
+            start, end = uploads.parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), session.size)
+        except uploads.ChunkError as e:
+            raise ValidationError({'Content-Range': str(e)})
+        # Read straight from the request stream so the chunk is never held in memory whole.
+        written = uploads.write_chunk(session, start, end, request.stream)
+        if written > start:
+            # Whatever arrived is kept, so a dropped connection only loses the rest of the chunk.
+            UploadChunk.objects.create(session=session, start=start, end=written)
+        if written < end:
+            raise ValidationError({'Content-Range': 'Body ended after {} of {} bytes.'.format(
+                written - start, end - start)})
+        return Response(self.serializer_class(session).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        missing = uploads.missing_ranges(uploads.received_ranges(session), session.size)
+        if missing:
+            return Response({'missing': missing}, status=status.HTTP_409_CONFLICT)
+        try:
+            post = uploads.attach(session)
+        except uploads.ChunkError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(PostSerializer(post).data)
+
+    def destroy(self, request, pk=None):
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        session.delete()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_permissions(self):
+        """
+        Instantiates and returns the list of permissions that this view requires.
+        """
+        permission_classes = [IsAuthenticated]
+
+        return [permission() for permission in permission_classes]
+
+
 class BlogVisitLogViewSet(viewsets.ViewSet):
     serializer_class = BlogVisitLogSerializer
 
@@ -340,6 +614,15 @@ class BlogVisitLogViewSet(viewsets.ViewSet):
         return queryset
 
     def list(self, request):
+        user = request.query_params.get('user', None)
+        if not (request.user.is_staff or request.user.is_superuser) and not request.query_params.get('post') \
+                and user in (None, str(request.user.pk)):
+            # The user's own history, served from the recent visits ring without touching the logs.
+            serializer = self.serializer_class(recent_visits.history(request.user.pk), many=True)
+            return Response(serializer.data)
+
+        visit_log_buffer.flush()
+        heartbeat_buffer.flush()
         queryset = self.get_queryset().all()
         if request.user.is_staff or request.user.is_superuser:
             pass
@@ -349,11 +632,22 @@ class BlogVisitLogViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
     def update(self, request, pk=None):
-        blog_visit_log = get_object_or_404(BlogVisitLog.objects.all(), pk=pk)
+        try:
+            closed = serializers.BooleanField().to_internal_value(request.data.get('closed', False))
+        except ValidationError as e:
+            raise ValidationError({'closed': e.detail})
+
+        blog_visit_log = heartbeat_buffer.session(pk)
+        if blog_visit_log is None:
+            if visit_log_buffer.contains(pk):
+                visit_log_buffer.flush()
+            blog_visit_log = get_object_or_404(
+                BlogVisitLog.objects.only('id', 'post_id', 'user_id', 'start_time', 'end_time'), pk=pk)
+        # A known session is checked against the owner it was loaded with, without reading the row again.
         self.check_object_permissions(request, blog_visit_log)
 
-        blog_visit_log.end_time = timezone.now()
-        blog_visit_log.save()
+        heartbeat_buffer.open(blog_visit_log)
+        heartbeat_buffer.beat(blog_visit_log, timezone.now(), closed=closed)
 
         serializer = self.serializer_class(blog_visit_log)
         return Response(serializer.data)
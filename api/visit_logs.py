@@ -0,0 +1,130 @@
+from collections import OrderedDict, deque
+
+from django.db import transaction
+
+from api import analytics
+from api.buffers import QueueBuffer, LatestValueBuffer
+from api.cache import LRUCache
+from api.models import BlogVisitLog
+
+visit_log_buffer = QueueBuffer(BlogVisitLog, 'VISIT_LOG')
+
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_HISTORY_LENGTH = 10
+
+
+class HeartbeatBuffer(LatestValueBuffer):
+    """
+    Coalesces the heartbeats that extend a visit log's `end_time`: only the latest time
+    per log is kept and the batch is written with one UPDATE, together with the read time
+    each log gained. Logs already checked are remembered as sessions, up to
+    `MAX_SESSIONS` per process, so later heartbeats neither read the row nor its owner.
+    """
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        super(HeartbeatBuffer, self).__init__(BlogVisitLog, 'end_time', 'HEARTBEAT')
+
+    def config(self):
+        config = super(HeartbeatBuffer, self).config()
+        config.setdefault('MAX_SESSIONS', DEFAULT_MAX_SESSIONS)
+        return config
+
+    def session(self, pk):
+        """
+        The visit log of an open session, as last seen by this process, or None.
+        """
+        with self._lock:
+            log = self._sessions.get(str(pk))
+            if log is not None:
+                self._sessions.move_to_end(str(pk))
+            return log
+
+    def open(self, log):
+        max_sessions = self.config()['MAX_SESSIONS']
+        with self._lock:
+            self._sessions[str(log.pk)] = log
+            while len(self._sessions) > max_sessions:
+                self._sessions.popitem(last=False)
+        return log
+
+    def beat(self, log, end_time, closed=False):
+        log.end_time = end_time
+        self.set(log.pk, end_time)
+        recent_visits.touch(log, end_time)
+        if closed:
+            with self._lock:
+                self._sessions.pop(str(log.pk), None)
+            self.flush()
+
+    def _write(self, batch):
+        with transaction.atomic():
+            previous = list(BlogVisitLog.objects.filter(pk__in=list(batch))
+                            .values_list('pk', 'post_id', 'start_time', 'end_time'))
+            super(HeartbeatBuffer, self)._write(batch)
+            analytics.record_reading((post_id, start_time, end_time, batch[pk])
+                                     for pk, post_id, start_time, end_time in previous)
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+
+class RecentVisitCache(LRUCache):
+    """
+    Per-user ring buffer of the latest `LENGTH` visit logs, as [id, post_id, start_time,
+    end_time] newest first, so a user's recent history is read without sorting their
+    logs. Visits and heartbeats are applied as they happen; users not cached are loaded
+    from the database on their next read. Logs deleted in bulk, e.g. by a post deletion
+    or the visit log rollup, stay listed until the entry expires.
+    """
+
+    def config(self):
+        config = super(RecentVisitCache, self).config()
+        config.setdefault('LENGTH', DEFAULT_HISTORY_LENGTH)
+        return config
+
+    def history(self, user_id):
+        """
+        The user's latest visit logs, newest first, as unsaved BlogVisitLog instances.
+        """
+        key = str(user_id)
+        with self._lock:
+            ring = self.get(key)
+            entries = [list(entry) for entry in ring] if ring is not None else None
+        if entries is None:
+            # Visits and heartbeats still queued in this process belong in the history.
+            visit_log_buffer.flush()
+            heartbeat_buffer.flush()
+            entries = [list(entry) for entry in BlogVisitLog.objects.filter(user_id=user_id)
+                       .order_by('-start_time').values_list('id', 'post_id', 'start_time', 'end_time')
+                       [:self.config()['LENGTH']]]
+            self.set(key, deque([list(entry) for entry in entries], maxlen=self.config()['LENGTH']))
+        return [BlogVisitLog(id=log_id, post_id=post_id, user_id=user_id, start_time=start_time, end_time=end_time)
+                for log_id, post_id, start_time, end_time in entries]
+
+    def add(self, log):
+        with self._lock:
+            ring = self.peek(str(log.user_id))
+            if ring is None:
+                return
+            entry = [log.pk, log.post_id, log.start_time, log.end_time]
+            if any(existing[0] == log.pk for existing in ring):
+                return
+            if not ring or log.start_time >= ring[0][2]:
+                # The usual case: the ring is full, so the oldest visit falls off the end.
+                ring.appendleft(entry)
+            else:
+                ordered = sorted(list(ring) + [entry], key=lambda item: item[2], reverse=True)
+                ring.clear()
+                ring.extend(ordered[:ring.maxlen])
+
+    def touch(self, log, end_time):
+        with self._lock:
+            ring = self.peek(str(log.user_id))
+            for entry in ring or ():
+                if entry[0] == log.pk:
+                    entry[3] = end_time
+                    return
+
+
+recent_visits = RecentVisitCache('RECENT_VISITS')
@@ -0,0 +1,69 @@
+"""
+Benchmarks run through the Django test runner so they get a throwaway database:
+
+    python manage.py test benchmarks --pattern="bench_*.py"
+
+They are not collected by a plain `python manage.py test`.
+"""
+import threading
+import time
+
+from django.db import connection
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_concurrently(target, total, concurrency):
+    """
+    Calls `target(worker_index)` `total` times spread over `concurrency` threads.
+    Returns a dict with throughput, latency percentiles (ms) and error count.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = total // concurrency
+
+    def worker(index):
+        local = []
+        local_errors = 0
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                target(index)
+            except Exception:
+                local_errors += 1
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def report(title, results):
+    print('\n' + title)
+    for name, result in results:
+        print('  {:<24} {:>8.1f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  errors {}'.format(
+            name, result['rps'], result['p50'], result['p99'], result['errors']))
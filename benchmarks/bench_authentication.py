@@ -0,0 +1,62 @@
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.authentication import CachedJWTAuthentication, principal_cache
+from api.models import Image
+from api.tests import tests_helper
+from api.views import PostViewSet, ImageViewSet
+from benchmarks import percentile
+
+REQUESTS = 300
+
+
+class AuthenticationBenchmark(TransactionTestCase):
+    """
+    Queries and latency per authenticated request with the stock JWTAuthentication,
+    which selects the user on every call, versus the cached principal.
+    """
+
+    def setUp(self):
+        user1, user2 = tests_helper.create_fake_users()
+        self.post, _ = tests_helper.create_fake_posts(user1)
+        self.image = Image.objects.create(image='images/bench.png', name='bench.png', owner=user1)
+        self.client = APIClient()
+        tests_helper.login_with_token(self, 'user-1', 'user-1')
+        self.endpoints = [
+            ('post retrieve', '/api/post/{}/'.format(self.post.id)),
+            ('post list', '/api/post/'),
+            ('image list', '/api/image/'),
+            ('image retrieve', '/api/image/{}/'.format(self.image.id)),
+        ]
+
+    def _run(self, authentication_class, url):
+        classes = [authentication_class, SessionAuthentication]
+        with mock.patch.object(PostViewSet, 'authentication_classes', classes), \
+                mock.patch.object(ImageViewSet, 'authentication_classes', classes):
+            principal_cache.clear()
+            # Warm the response and principal caches so only steady-state cost is measured.
+            self.client.get(url, format='json')
+            latencies = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(REQUESTS):
+                    started = time.perf_counter()
+                    response = self.client.get(url, format='json')
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.status_code
+        return len(queries) / float(REQUESTS), percentile(latencies, 50)
+
+    def test_authenticated_query_savings(self):
+        print('\nAuthenticated GETs, {} sequential requests per endpoint'.format(REQUESTS))
+        for name, url in self.endpoints:
+            stock_queries, stock_p50 = self._run(JWTAuthentication, url)
+            cached_queries, cached_p50 = self._run(CachedJWTAuthentication, url)
+            print('  {:<16} queries/request {:>5.2f} -> {:>5.2f}  p50 {:>6.2f} ms -> {:>6.2f} ms'.format(
+                name, stock_queries, cached_queries, stock_p50, cached_p50))
+            self.assertLessEqual(cached_queries, stock_queries - 1)
@@ -0,0 +1,87 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import base_user
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.logins import last_login_buffer
+from api.tests import tests_helper
+
+LOGINS = 40
+REFRESHES = 400
+
+
+class Timer(object):
+    """
+    Accumulates wall time spent inside the wrapped callables or database calls.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls += 1
+        return timed
+
+    def __call__(self, execute, sql, params, many, context):
+        return self.wrap(execute)(sql, params, many, context)
+
+
+class LoginBenchmark(TransactionTestCase):
+    """
+    Single-threaded token issuance and refresh, so the rates are per core. Time spent
+    verifying passwords and time spent in the database are reported separately.
+    """
+
+    def setUp(self):
+        tests_helper.create_fake_users()
+        self.client = APIClient()
+
+    def _run(self, url, payloads):
+        hashing, database = Timer(), Timer()
+        with mock.patch.object(base_user, 'check_password', hashing.wrap(base_user.check_password)), \
+                connection.execute_wrapper(database):
+            started = time.perf_counter()
+            for payload in payloads:
+                response = self.client.post(url, payload, format='json')
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - started
+        return {
+            'tokens': len(payloads),
+            'rate': len(payloads) / elapsed,
+            'hashing': hashing.seconds * 1000 / len(payloads),
+            'database': database.seconds * 1000 / len(payloads),
+            'queries': database.calls / float(len(payloads)),
+            'other': (elapsed - hashing.seconds - database.seconds) * 1000 / len(payloads),
+        }
+
+    def _login(self):
+        payloads = [{'username': 'user-1', 'password': 'user-1'}] * LOGINS
+        return self._run('/auth/token/', payloads)
+
+    def test_token_throughput(self):
+        with override_settings(WRITE_BEHIND={'LAST_LOGIN': {'ENABLED': False}}):
+            synchronous = self._login()
+        buffered = self._login()
+        refresh_token = self.client.post('/auth/token/', {'username': 'user-1', 'password': 'user-1'},
+                                         format='json').data['refresh']
+        last_login_buffer.flush()
+        refreshed = self._run('/auth/token/refresh/', [{'refresh': refresh_token}] * REFRESHES)
+
+        print('\nToken endpoints, single thread')
+        for name, result in [('token, inline last_login', synchronous),
+                             ('token, buffered last_login', buffered),
+                             ('token refresh', refreshed)]:
+            print('  {:<28} {:>8.1f} tokens/s/core  hashing {:>7.2f} ms  db {:>5.2f} ms ({:.1f} queries)'
+                  '  other {:>5.2f} ms'.format(name, result['rate'], result['hashing'], result['database'],
+                                               result['queries'], result['other']))
+        self.assertLess(buffered['queries'], synchronous['queries'])
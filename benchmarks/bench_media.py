@@ -0,0 +1,138 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import SimpleTestCase, override_settings
+from django.urls import re_path
+from django.views.static import serve
+
+from api.media import serve_media
+
+MEGABYTE = 1024 * 1024
+FILE_SIZE = 64 * MEGABYTE
+REQUESTS = 20
+
+media_root = tempfile.mkdtemp()
+
+# The view blog.urls used before, next to the new one.
+urlpatterns = [
+    re_path(r'^static-view/(?P<path>.*)$', serve, {'document_root': media_root}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+]
+
+
+class SendfileWrapper(object):
+    """
+    wsgi.file_wrapper in the style of gunicorn's: sends Content-Length bytes from the
+    file's current offset with os.sendfile, without copying them through Python.
+    """
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def close(self):
+        self.filelike.close()
+
+
+class FakeServer(object):
+    """
+    Runs the WSGI application in-process and writes response bodies to /dev/null,
+    so only Django and the transfer path are measured.
+    """
+
+    def __init__(self, file_wrapper):
+        self.application = WSGIHandler()
+        self.file_wrapper = file_wrapper
+        self.sink = os.open(os.devnull, os.O_WRONLY)
+
+    def close(self):
+        os.close(self.sink)
+
+    def get(self, path, **headers):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+        }
+        environ.update(('HTTP_' + key, value) for key, value in headers.items())
+        if self.file_wrapper:
+            environ['wsgi.file_wrapper'] = SendfileWrapper
+        response_headers = {}
+
+        def start_response(status, headers):
+            response_headers.update(headers)
+
+        result = self.application(environ, start_response)
+        sent = 0
+        try:
+            if isinstance(result, SendfileWrapper):
+                length = int(response_headers['Content-Length'])
+                descriptor = result.filelike.fileno()
+                offset = result.filelike.tell()
+                while sent < length:
+                    count = os.sendfile(self.sink, descriptor, offset + sent, length - sent)
+                    if not count:
+                        break
+                    sent += count
+            else:
+                for data in result:
+                    sent += os.write(self.sink, data)
+        finally:
+            result.close()
+        return sent
+
+
+@override_settings(ROOT_URLCONF='benchmarks.bench_media', MEDIA_ROOT=media_root)
+class MediaServingBenchmark(SimpleTestCase):
+    """
+    Throughput and CPU per request of django.views.static.serve versus serve_media,
+    with and without a sendfile-capable wsgi.file_wrapper. The seek scenario asks for
+    the last megabyte, as a player does when jumping to the end of a video.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(MediaServingBenchmark, cls).setUpClass()
+        with open(os.path.join(media_root, 'video.mp4'), 'wb') as video:
+            for _ in range(FILE_SIZE // MEGABYTE):
+                video.write(os.urandom(MEGABYTE))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(media_root, ignore_errors=True)
+        super(MediaServingBenchmark, cls).tearDownClass()
+
+    def _run(self, server, path, **headers):
+        server.get(path, **headers)
+        sent = 0
+        started, cpu_started = time.perf_counter(), time.process_time()
+        for _ in range(REQUESTS):
+            sent += server.get(path, **headers)
+        elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        return sent / float(REQUESTS), sent / MEGABYTE / elapsed, cpu * 1000 / REQUESTS
+
+    def test_media_serving(self):
+        scenarios = [
+            ('full file, sendfile', True, {}),
+            ('full file, no wrapper', False, {}),
+            ('seek to last MB', True, {'RANGE': 'bytes={}-'.format(FILE_SIZE - MEGABYTE)}),
+        ]
+        print('\n{} MB file, {} sequential requests per scenario'.format(FILE_SIZE // MEGABYTE, REQUESTS))
+        for name, file_wrapper, headers in scenarios:
+            server = FakeServer(file_wrapper)
+            try:
+                static_bytes, static_rate, static_cpu = self._run(server, '/static-view/video.mp4', **headers)
+                media_bytes, media_rate, media_cpu = self._run(server, '/media/video.mp4', **headers)
+            finally:
+                server.close()
+            print('  {:<22} bytes/request {:>9.1f} KB -> {:>9.1f} KB  {:>8.1f} -> {:>8.1f} MB/s  '
+                  'CPU {:>7.2f} -> {:>7.2f} ms/request'.format(
+                      name, static_bytes / 1024, media_bytes / 1024, static_rate, media_rate,
+                      static_cpu, media_cpu))
+            if headers:
+                self.assertEqual(media_bytes, MEGABYTE)
+                self.assertEqual(static_bytes, FILE_SIZE)
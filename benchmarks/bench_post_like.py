@@ -0,0 +1,53 @@
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.counters import like_counter
+from api.models import Post, PostLike, User
+from api.tests import tests_helper
+from benchmarks import run_concurrently, report
+
+LIKERS = 400
+CONCURRENCY = 8
+
+
+class PostLikeBenchmark(TransactionTestCase):
+    """
+    Many users liking the same post at once, with the like counter updated in the
+    request versus batched by the write-behind buffer.
+    """
+
+    def setUp(self):
+        author, _ = tests_helper.create_fake_users()
+        self.post, _ = tests_helper.create_fake_posts(author)
+        self.url = '/api/post/{}/like/'.format(self.post.id)
+
+    def _run(self, prefix):
+        users = User.objects.bulk_create(
+            [User(username='{}-{}'.format(prefix, i), password='!') for i in range(LIKERS)])
+        clients = []
+        for user in users:
+            client = APIClient()
+            client.force_authenticate(user)
+            clients.append(client)
+        remaining = list(clients)
+
+        def like(index):
+            response = remaining.pop().post(self.url, format='json')
+            assert response.status_code == 200, response.status_code
+
+        result = run_concurrently(like, LIKERS, CONCURRENCY)
+        like_counter.flush()
+        return result
+
+    def test_like_throughput(self):
+        with override_settings(WRITE_BEHIND={'LIKE_COUNTER': {'ENABLED': False}}):
+            synchronous = self._run('sync')
+        with override_settings(WRITE_BEHIND={'LIKE_COUNTER': {'FLUSH_INTERVAL': 1.0, 'MAX_PENDING': 500}}):
+            buffered = self._run('buffered')
+
+        report('PostViewSet.like on one post, {} likers over {} threads'.format(LIKERS, CONCURRENCY), [
+            ('update per like', synchronous),
+            ('write-behind counter', buffered),
+        ])
+        # The denormalized counter must agree with the dedupe table.
+        self.assertEqual(Post.objects.get(id=self.post.id).like, PostLike.objects.filter(post=self.post).count())
@@ -0,0 +1,49 @@
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.counters import view_counter
+from api.models import Post
+from api.tests import tests_helper
+from benchmarks import run_concurrently, report
+
+REQUESTS = 400
+CONCURRENCY = 8
+
+
+class PostRetrieveBenchmark(TransactionTestCase):
+    """
+    Anonymous retrieve of a single hot post, comparing a per-request counter update
+    with the write-behind view counter.
+    """
+
+    def setUp(self):
+        user1, user2 = tests_helper.create_fake_users()
+        self.post, _ = tests_helper.create_fake_posts(user1)
+        self.url = '/api/post/{}/'.format(self.post.id)
+
+    def _run(self):
+        clients = [APIClient() for _ in range(CONCURRENCY)]
+
+        def retrieve(index):
+            response = clients[index].get(self.url, format='json')
+            assert response.status_code == 200, response.status_code
+
+        result = run_concurrently(retrieve, REQUESTS, CONCURRENCY)
+        view_counter.flush()
+        return result
+
+    def test_retrieve_throughput(self):
+        with override_settings(WRITE_BEHIND={'VIEW_COUNTER': {'ENABLED': False}}):
+            synchronous = self._run()
+        with override_settings(WRITE_BEHIND={'VIEW_COUNTER': {'FLUSH_INTERVAL': 1.0, 'MAX_PENDING': 500}}):
+            buffered = self._run()
+
+        report('PostViewSet.retrieve, {} requests over {} threads'.format(REQUESTS, CONCURRENCY), [
+            ('update per request', synchronous),
+            ('write-behind counter', buffered),
+        ])
+        # A request can fail on a locked table after its own update committed, so only
+        # successful requests are guaranteed to be counted.
+        self.assertGreaterEqual(Post.objects.get(id=self.post.id).view,
+                                synchronous['requests'] - synchronous['errors'] +
+                                buffered['requests'] - buffered['errors'])
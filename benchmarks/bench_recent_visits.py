@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import BlogVisitLog
+from api.tests import tests_helper
+from api.visit_logs import recent_visits
+from benchmarks import run_concurrently, report
+
+LOG_ROWS = 100000
+REQUESTS = 400
+CONCURRENCY = 4
+
+
+class RecentVisitsBenchmark(TransactionTestCase):
+    """
+    A reader's own visit history, BlogVisitLogViewSet.list, for a user with 100k visit
+    logs: read from the logs on every request versus from the recent visits ring.
+    """
+
+    def setUp(self):
+        self.reader, author = tests_helper.create_fake_users()
+        posts = tests_helper.create_fake_posts(author)
+        started = timezone.now() - timedelta(days=30)
+        for offset in range(0, LOG_ROWS, 5000):
+            BlogVisitLog.objects.bulk_create([
+                BlogVisitLog(post=posts[index % 2], user=self.reader, start_time=started + timedelta(seconds=index),
+                             end_time=started + timedelta(seconds=index + 10))
+                for index in range(offset, min(offset + 5000, LOG_ROWS))
+            ])
+        recent_visits.clear()
+
+    def _run(self):
+        clients = [APIClient() for _ in range(CONCURRENCY)]
+        for client in clients:
+            client.force_authenticate(self.reader)
+
+        def history(index):
+            response = clients[index].get('/api/blog_visit_log/', format='json')
+            assert response.status_code == 200 and len(response.data) == 10, response.status_code
+
+        clients[0].get('/api/blog_visit_log/', format='json')
+        with CaptureQueriesContext(connection) as queries:
+            clients[0].get('/api/blog_visit_log/', format='json')
+        result = run_concurrently(history, REQUESTS, CONCURRENCY)
+        result['queries'] = len(queries)
+        recent_visits.clear()
+        return result
+
+    def test_history_latency(self):
+        # MAX_ENTRIES 0 evicts every ring as soon as it is stored, so each request reads the logs.
+        with override_settings(CACHES_IN_PROCESS={'RECENT_VISITS': {'MAX_ENTRIES': 0}}):
+            database = self._run()
+        with override_settings(CACHES_IN_PROCESS={'RECENT_VISITS': {'TTL': 300, 'MAX_ENTRIES': 10000}}):
+            ring = self._run()
+
+        report('BlogVisitLogViewSet.list of a user with {} logs, {} requests over {} threads'.format(
+            LOG_ROWS, REQUESTS, CONCURRENCY), [
+            ('logs per request', database),
+            ('recent visits ring', ring),
+        ])
+        print('  queries per request: {} from the logs, {} from the ring'.format(database['queries'],
+                                                                                  ring['queries']))
+        self.assertEqual(ring['errors'], 0)
+        self.assertEqual(ring['queries'], 0)
@@ -0,0 +1,80 @@
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.counters import view_counter
+from api.models import BlogVisitLog
+from api.tests import tests_helper
+from api.visit_logs import visit_log_buffer, heartbeat_buffer
+from benchmarks import run_concurrently, report
+
+REQUESTS = 400
+CONCURRENCY = 8
+# Open reading sessions, one per client, each sending heartbeats.
+SESSIONS = 8
+
+
+class VisitLogBenchmark(TransactionTestCase):
+    """
+    Authenticated retrieve, which writes a BlogVisitLog row per read, with the visit
+    log inserted inline versus queued for bulk_create.
+    """
+
+    def setUp(self):
+        self.reader, author = tests_helper.create_fake_users()
+        self.post, _ = tests_helper.create_fake_posts(author)
+        self.url = '/api/post/{}/'.format(self.post.id)
+
+    def _run(self):
+        clients = [APIClient() for _ in range(CONCURRENCY)]
+        for client in clients:
+            client.force_authenticate(self.reader)
+
+        def retrieve(index):
+            response = clients[index].get(self.url, format='json')
+            assert response.status_code == 200, response.status_code
+
+        result = run_concurrently(retrieve, REQUESTS, CONCURRENCY)
+        visit_log_buffer.flush()
+        view_counter.flush()
+        return result
+
+    def test_retrieve_latency(self):
+        with override_settings(WRITE_BEHIND={'VISIT_LOG': {'ENABLED': False}}):
+            inline = self._run()
+        with override_settings(WRITE_BEHIND={'VISIT_LOG': {'FLUSH_INTERVAL': 1.0, 'MAX_PENDING': 200}}):
+            queued = self._run()
+
+        report('Authenticated PostViewSet.retrieve, {} requests over {} threads'.format(REQUESTS, CONCURRENCY), [
+            ('insert per request', inline),
+            ('batched ingestion', queued),
+        ])
+        self.assertGreaterEqual(BlogVisitLog.objects.count(),
+                                queued['requests'] - queued['errors'])
+
+    def test_heartbeat_latency(self):
+        logs = BlogVisitLog.objects.bulk_create([BlogVisitLog(post=self.post, user=self.reader)
+                                                 for _ in range(SESSIONS)])
+        clients = [APIClient() for _ in range(CONCURRENCY)]
+        for client in clients:
+            client.force_authenticate(self.reader)
+
+        def heartbeat(index):
+            response = clients[index].put('/api/blog_visit_log/{}/'.format(logs[index % SESSIONS].pk),
+                                          format='json')
+            assert response.status_code == 200, response.status_code
+
+        def run():
+            result = run_concurrently(heartbeat, REQUESTS, CONCURRENCY)
+            heartbeat_buffer.flush()
+            return result
+
+        with override_settings(WRITE_BEHIND={'HEARTBEAT': {'ENABLED': False}}):
+            inline = run()
+        with override_settings(WRITE_BEHIND={'HEARTBEAT': {'FLUSH_INTERVAL': 1.0, 'MAX_PENDING': 500}}):
+            coalesced = run()
+
+        report('BlogVisitLogViewSet.update heartbeats, {} requests over {} threads'.format(REQUESTS, CONCURRENCY), [
+            ('update per heartbeat', inline),
+            ('coalesced', coalesced),
+        ])
+        self.assertEqual(coalesced['errors'], 0)
@@ -47,11 +47,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'api',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,7 +68,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ]
 }
@@ -77,6 +78,100 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Token',),
 }
 
+WRITE_BEHIND = {
+    'VIEW_COUNTER': {
+        'FLUSH_INTERVAL': 2.0,
+        'MAX_PENDING': 500,
+    },
+    'VISIT_LOG': {
+        'FLUSH_INTERVAL': 2.0,
+        'MAX_PENDING': 200,
+    },
+    'LIKE_COUNTER': {
+        'FLUSH_INTERVAL': 2.0,
+        'MAX_PENDING': 500,
+    },
+    'LAST_LOGIN': {
+        'FLUSH_INTERVAL': 5.0,
+        'MAX_PENDING': 500,
+    },
+    'HEARTBEAT': {
+        'FLUSH_INTERVAL': 10.0,
+        'MAX_PENDING': 500,
+        'MAX_SESSIONS': 10000,
+    },
+}
+
+CACHES_IN_PROCESS = {
+    'POST_RESPONSE': {
+        'TTL': 60,
+        'MAX_ENTRIES': 1000,
+    },
+    'AUTH_PRINCIPAL': {
+        'TTL': 300,
+        'MAX_ENTRIES': 10000,
+    },
+    'PERMISSION_SNAPSHOT': {
+        'TTL': 300,
+        'MAX_ENTRIES': 10000,
+    },
+    'RECENT_VISITS': {
+        'TTL': 300,
+        'MAX_ENTRIES': 10000,
+        'LENGTH': 10,
+    },
+}
+
+# Post bodies are rendered with this config on save. Run `manage.py render_markdown` after changing it.
+MARKDOWN = {
+    'EXTENSIONS': ['extra', 'sane_lists'],
+    'EXTENSION_CONFIGS': {},
+}
+
+IMAGE_VARIANTS = {
+    'WORKERS': 2,
+    'SIZES': {
+        'thumbnail': [150, 150],
+        'small': [480, 480],
+        'medium': [1024, 1024],
+    },
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 82,
+}
+
+BULK_IMAGE_UPLOADS = {
+    'WORKERS': 4,
+    'MAX_FILES': 200,
+}
+
+MEDIA_SERVING = {
+    'MODE': 'python',
+    'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+    'BLOCK_SIZE': 256 * 1024,
+    'MAX_RANGES': 16,
+}
+
+RESUMABLE_UPLOADS = {
+    'DIRECTORY': 'uploads',
+    'MAX_SIZE': 4 * 1024 ** 3,
+    'BLOCK_SIZE': 1024 * 1024,
+}
+
+# Weights of the trending score. Refresh it periodically with `manage.py refresh_trending`.
+TRENDING = {
+    'HALF_LIFE_HOURS': 24.0,
+    'VIEW_WEIGHT': 1.0,
+    'LIKE_WEIGHT': 5.0,
+    'DWELL_WEIGHT_PER_MINUTE': 0.5,
+}
+
+VISIT_LOG_ROLLUP = {
+    'RETENTION_DAYS': 30,
+    'DELETE_CHUNK_SIZE': 1000,
+}
+
+AUTHENTICATION_BACKENDS = ['api.backends.SnapshotModelBackend']
+
 AUTH_USER_MODEL = "api.User"
 
 TEMPLATES = [
@@ -104,7 +199,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # A local stand-in for a read replica; it is only read from once listed in
+    # DATABASE_ROUTING['REPLICAS'], and nothing copies 'default' into it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.replica.sqlite3'),
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+DATABASE_ROUTING = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'read_primary',
 }
 
 LOGGING = {
@@ -13,12 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
-from django.urls import path, include
+import re
+
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
 import api.urls
+from api.media import serve_media
 from api.views import TokenObtainPairPatchedView
 from blog import settings
 
@@ -30,4 +32,5 @@ urlpatterns = [
                   path('auth/', include('rest_framework.urls')),
                   path('auth/token/', TokenObtainPairPatchedView.as_view(), name='token_obtain_pair'),
                   path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-              ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+                  re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+              ]
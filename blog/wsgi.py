@@ -11,6 +11,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from api import buffers
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
 
 application = get_wsgi_application()
+
+# Writes buffered by an idle worker are flushed from a background thread.
+buffers.start_flusher()
@@ -44,9 +44,8 @@ def _deep_remove_fields(source, ignored_fields):
                     del curr[ignored_field]
 
             for value in curr.values():
-                if isinstance(value, list):
-                    for item in curr:
-                        stack.append(item)
+                if isinstance(value, (list, dict)):
+                    stack.append(value)
 
         if isinstance(curr, list):
             for item in curr: